@@ -0,0 +1,418 @@
+# Dashboard distributions
+#
+# Percentiles and histograms of price per m² per district, rent ratio
+# quantiles and area buckets need every value, not running sums, so
+# district_stats cannot serve them and computing them in SQL means sorting
+# the properties table per request.
+#
+# Instead each worker process keeps a columnar snapshot of the numeric
+# property columns as NumPy arrays, sorted by id, and computes the
+# distributions vectorised. The snapshot is tagged with the data version it
+# reflects; when the version moves it catches up incrementally:
+#   - properties written since (updated_at, indexed) are upserted, with an
+#     overlap so a write committed late is not missed,
+#   - deletes show up as a count mismatch and are removed by an id diff,
+#   - the community -> district map is small and reloaded, so communities
+#     moving district carry their properties along.
+#
+# Without NumPy the same figures come from SQL (sql_distribution), which is
+# also the reference the benchmark checks the snapshot against.
+import math
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from app import models, response_cache
+from app.stats_store import district_key
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+DEFAULT_BINS = 20
+
+# Area bucket boundaries in m²: <50, 50-70, ..., 120-144, >=144
+AREA_BUCKET_EDGES = (50, 70, 90, 120, 144)
+
+# Rows written this long before the newest one seen are fetched again
+SNAPSHOT_OVERLAP = timedelta(seconds=5)
+
+# Width of the id ranges whose ids are read back when looking for deletes
+DELETE_BUCKET_SIZE = 1024
+
+# Snapshot columns besides id, all loaded as float64 with NaN for NULL
+VALUE_COLUMNS = ("community_id", "price_per_sqm", "rent_ratio", "area")
+
+
+# ============ Result ============
+
+def _quantiles(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    return {
+        f"p{q}": None if value is None or math.isnan(value) else float(value)
+        for q, value in zip(PERCENTILES, values)
+    }
+
+
+def _group(name: Optional[str], property_count, price_count, price_percentiles, histogram,
+           ratio_count, ratio_percentiles, area_buckets) -> dict:
+    return {
+        "district": name,
+        "property_count": int(property_count),
+        "price_per_sqm": {
+            "count": int(price_count),
+            "percentiles": _quantiles(price_percentiles),
+            "histogram": [int(count) for count in histogram],
+        },
+        "rent_ratio": {"count": int(ratio_count), "percentiles": _quantiles(ratio_percentiles)},
+        "area_buckets": [int(count) for count in area_buckets],
+    }
+
+
+def _result(edges: List[float], overall: dict, districts: List[dict]) -> dict:
+    districts.sort(key=lambda group: (-group["property_count"], group["district"]))
+    return {
+        "price_per_sqm_edges": edges,
+        "area_bucket_edges": list(AREA_BUCKET_EDGES),
+        "overall": overall,
+        "districts": districts,
+    }
+
+
+def histogram_edges(low: Optional[float], high: Optional[float], bins: int) -> List[float]:
+    if low is None:
+        return []
+    return [low + (high - low) * i / bins for i in range(bins + 1)]
+
+
+def interpolate(sorted_values, start: int, count: int, fraction: float) -> float:
+    """The fraction percentile of count sorted values from start, interpolated like numpy."""
+    position = (count - 1) * fraction
+    lower = math.floor(position)
+    upper = min(lower + 1, count - 1)
+    low_value = sorted_values[start + lower]
+    return low_value + (sorted_values[start + upper] - low_value) * (position - lower)
+
+
+# ============ Snapshot ============
+
+@dataclass
+class Snapshot:
+    version: Optional[int] = None
+    # Newest updated_at when last loaded
+    since: Optional[datetime] = None
+    columns: Dict[str, "np.ndarray"] = field(default_factory=dict)
+    # District code per community id (-1 for none), and the district names
+    district_codes: "np.ndarray" = None
+    district_names: List[str] = field(default_factory=list)
+
+    def refresh(self, db: Session):
+        """Catch up with the tables if the data version moved."""
+        version = response_cache.get_data_version(db)
+        if version == self.version:
+            return
+
+        p = models.Property
+        full = self.since is None
+        # Read before the rows: anything written after it is fetched again next time
+        newest = db.query(func.max(p.updated_at)).scalar()
+        # Table columns, so the rows skip ORM loading
+        table = p.__table__.c
+        query = select(table.id, *(getattr(table, name) for name in VALUE_COLUMNS))
+        if full:
+            query = query.order_by(table.id)
+        else:
+            query = query.where(table.updated_at >= self.since - SNAPSHOT_OVERLAP)
+        changed = _to_columns(db.execute(query).all())
+        self.columns = changed if full else _upsert(self.columns, changed)
+        self.since = newest or datetime.min + SNAPSHOT_OVERLAP
+
+        count = db.query(func.count(p.id)).scalar()
+        if count != len(self.columns["id"]):
+            self._drop_deleted(db)
+
+        self._load_districts(db)
+        self.version = version
+
+    def _drop_deleted(self, db: Session):
+        """
+        Remove deleted properties. Id ranges holding fewer rows than the
+        snapshot are halved until DELETE_BUCKET_SIZE ids wide and only the
+        ids of those are read back, so a few deletes cost a few range
+        counts on the primary key rather than reading every id.
+        """
+        ids = self.columns["id"]
+        table = models.Property.__table__.c
+        pending = [(int(ids[0]), int(ids[-1]) + 1)] if len(ids) else []
+        stale = np.zeros(len(ids), dtype=bool)
+        live = []
+        while pending:
+            low, high = pending.pop()
+            first, last = np.searchsorted(ids, (low, high))
+            in_range = (table.id >= low) & (table.id < high)
+            if db.execute(select(func.count(table.id)).where(in_range)).scalar() == last - first:
+                continue
+            if high - low > DELETE_BUCKET_SIZE:
+                middle = (low + high) // 2
+                pending += [(low, middle), (middle, high)]
+                continue
+            stale[first:last] = True
+            live.extend(row[0] for row in db.execute(select(table.id).where(in_range)))
+
+        keep = ~stale | np.isin(ids, np.array(live, dtype=np.int64))
+        self.columns = {name: values[keep] for name, values in self.columns.items()}
+
+    def _load_districts(self, db: Session):
+        table = models.Community.__table__.c
+        rows = db.execute(select(table.id, table.district)).all()
+        self.district_names = sorted({district_key(district) for _, district in rows})
+        codes = {name: code for code, name in enumerate(self.district_names)}
+        size = max((community_id for community_id, _ in rows), default=0) + 1
+        self.district_codes = np.full(size, -1, dtype=np.int64)
+        for community_id, district in rows:
+            self.district_codes[community_id] = codes[district_key(district)]
+
+    def property_districts(self) -> "np.ndarray":
+        """District code of every property in the snapshot, -1 for a missing community."""
+        community_ids = self.columns["community_id"].astype(np.int64)
+        known = community_ids < len(self.district_codes)
+        return np.where(known, self.district_codes[np.where(known, community_ids, 0)], -1)
+
+    def distribution(self, district: Optional[str] = None, community_id: Optional[int] = None,
+                     bins: int = DEFAULT_BINS) -> dict:
+        codes = self.property_districts()
+        keep = codes >= 0
+        if district is not None:
+            code = self.district_names.index(district) if district in self.district_names else -2
+            keep &= codes == code
+        if community_id is not None:
+            keep &= self.columns["community_id"] == community_id
+
+        codes = codes[keep]
+        price = self.columns["price_per_sqm"][keep]
+        ratio = self.columns["rent_ratio"][keep]
+        area = self.columns["area"][keep]
+        groups = len(self.district_names)
+
+        priced = ~np.isnan(price)
+        low, high = (float(price[priced].min()), float(price[priced].max())) if priced.any() else (None, None)
+        edges = histogram_edges(low, high, bins)
+
+        def summarise(group_codes, group_count):
+            counts = np.bincount(group_codes, minlength=group_count)
+            price_pct, price_count = grouped_percentiles(price, group_codes, group_count)
+            ratio_pct, ratio_count = grouped_percentiles(ratio, group_codes, group_count)
+            histogram = grouped_histogram(price, group_codes, group_count, low, high, bins)
+            areas = grouped_area_buckets(area, group_codes, group_count)
+            return [
+                (counts[g], price_count[g], price_pct[g], histogram[g], ratio_count[g], ratio_pct[g], areas[g])
+                for g in range(group_count)
+            ]
+
+        overall = _group(None, *summarise(np.zeros(len(codes), dtype=np.int64), 1)[0])
+        districts = [
+            _group(self.district_names[code], *values)
+            for code, values in enumerate(summarise(codes, groups)) if values[0]
+        ]
+        return _result(edges, overall, districts)
+
+
+def _to_columns(rows: list) -> Dict[str, "np.ndarray"]:
+    """Rows of (id, *VALUE_COLUMNS) as arrays sorted by id."""
+    # Plain tuples: numpy probes Row objects for the array protocol, slowly
+    table = np.array([tuple(row) for row in rows], dtype=np.float64).reshape(len(rows), len(VALUE_COLUMNS) + 1)
+    order = np.argsort(table[:, 0], kind="stable")
+    columns = {"id": table[order, 0].astype(np.int64)}
+    for i, name in enumerate(VALUE_COLUMNS, start=1):
+        columns[name] = table[order, i]
+    return columns
+
+
+def _upsert(columns: Dict[str, "np.ndarray"], changed: Dict[str, "np.ndarray"]) -> Dict[str, "np.ndarray"]:
+    """Replace the rows of columns with the ids in changed and insert the others, keeping id order."""
+    ids, new_ids = columns["id"], changed["id"]
+    positions = np.searchsorted(ids, new_ids)
+    found = positions < len(ids)
+    found[found] = ids[positions[found]] == new_ids[found]
+
+    merged = {}
+    for name, values in columns.items():
+        values = values.copy()
+        values[positions[found]] = changed[name][found]
+        merged[name] = np.insert(values, positions[~found], changed[name][~found])
+    return merged
+
+
+def grouped_percentiles(values, groups, group_count: int):
+    """PERCENTILES of the non-NaN values of every group (NaN when empty), and their counts."""
+    present = ~np.isnan(values)
+    values, groups = values[present], groups[present]
+    counts = np.bincount(groups, minlength=group_count)
+    result = np.full((group_count, len(PERCENTILES)), np.nan)
+    if not len(values):
+        return result, counts
+
+    # Sorted by value, then stably by group; the group codes are small, so
+    # the second sort is a radix sort and both beat a lexsort
+    order = np.argsort(values)
+    order = order[np.argsort(groups[order].astype(np.min_scalar_type(group_count)), kind="stable")]
+    values = values[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    fractions = np.array(PERCENTILES) / 100
+
+    # Same arithmetic as interpolate(), on every group and percentile at once
+    positions = (counts[:, None] - 1) * fractions[None, :]
+    lower = np.floor(positions)
+    upper = np.minimum(lower + 1, counts[:, None] - 1)
+    present = counts > 0
+    lower_index = (starts[:, None] + lower.astype(np.int64))[present]
+    upper_index = (starts[:, None] + upper.astype(np.int64))[present]
+    low_values = values[lower_index]
+    result[present] = low_values + (values[upper_index] - low_values) * (positions - lower)[present]
+    return result, counts
+
+
+def grouped_histogram(values, groups, group_count: int, low: Optional[float], high: Optional[float], bins: int):
+    """Counts of the non-NaN values of every group in bins equal bins from low to high."""
+    present = ~np.isnan(values)
+    values, groups = values[present], groups[present]
+    if low is None or high == low:
+        buckets = np.zeros(len(values), dtype=np.int64)
+    else:
+        width = (high - low) / bins
+        buckets = np.minimum(((values - low) / width).astype(np.int64), bins - 1)
+    counts = np.bincount(groups * bins + buckets, minlength=group_count * bins)
+    return counts.reshape(group_count, bins)
+
+
+def grouped_area_buckets(values, groups, group_count: int):
+    """Counts of the non-NaN values of every group per AREA_BUCKET_EDGES bucket."""
+    present = ~np.isnan(values)
+    buckets = np.searchsorted(AREA_BUCKET_EDGES, values[present], side="right")
+    size = len(AREA_BUCKET_EDGES) + 1
+    counts = np.bincount(groups[present] * size + buckets, minlength=group_count * size)
+    return counts.reshape(group_count, size)
+
+
+_snapshot = Snapshot()
+_lock = threading.Lock()
+
+
+def distribution(db: Session, district: Optional[str] = None, community_id: Optional[int] = None,
+                 bins: int = DEFAULT_BINS) -> dict:
+    """Price, rent ratio and area distributions overall and per district."""
+    if np is None:
+        return sql_distribution(db, district=district, community_id=community_id, bins=bins)
+    with _lock:
+        _snapshot.refresh(db)
+        return _snapshot.distribution(district=district, community_id=community_id, bins=bins)
+
+
+def reset():
+    """Drop the snapshot; the next request loads it from scratch."""
+    global _snapshot
+    with _lock:
+        _snapshot = Snapshot()
+
+
+# ============ SQL ============
+
+SQL_PERCENTILES = """
+WITH ranked AS (
+    SELECT {group} AS grp, p.{column} AS value,
+           ROW_NUMBER() OVER (PARTITION BY {group} ORDER BY p.{column}) - 1 AS position,
+           COUNT(*) OVER (PARTITION BY {group}) AS total
+    FROM properties p JOIN communities c ON c.id = p.community_id
+    WHERE p.{column} IS NOT NULL {filters}
+)
+SELECT grp, position, total, value FROM ranked WHERE {wanted}
+"""
+
+
+def _sql_percentiles(db: Session, column: str, group: str, filters: str, params: dict) -> Dict[str, tuple]:
+    """{group: (count, percentiles)} of column, fetching only the rows percentiles fall on."""
+    wanted = []
+    for q in PERCENTILES:
+        position = f"(total - 1) * {q / 100!r}"
+        wanted.append(f"position = CAST({position} AS INTEGER)")
+        wanted.append(f"position = CAST({position} AS INTEGER) + 1")
+    sql = SQL_PERCENTILES.format(group=group, column=column, filters=filters, wanted=" OR ".join(wanted))
+
+    found: Dict[str, dict] = {}
+    totals: Dict[str, int] = {}
+    for row in db.execute(text(sql), params):
+        found.setdefault(row.grp, {})[row.position] = row.value
+        totals[row.grp] = row.total
+    return {
+        name: (total, [interpolate(found[name], 0, total, q / 100) for q in PERCENTILES])
+        for name, total in totals.items()
+    }
+
+
+def sql_distribution(db: Session, district: Optional[str] = None, community_id: Optional[int] = None,
+                     bins: int = DEFAULT_BINS) -> dict:
+    """distribution() computed with SQL queries over the tables."""
+    conditions, params = [], {}
+    if district is not None:
+        conditions.append("COALESCE(c.district, '') = :district")
+        params["district"] = district
+    if community_id is not None:
+        conditions.append("p.community_id = :community_id")
+        params["community_id"] = community_id
+    filters = "".join(f" AND {condition}" for condition in conditions)
+    source = f"FROM properties p JOIN communities c ON c.id = p.community_id WHERE 1 = 1 {filters}"
+    grp = "COALESCE(c.district, '')"
+
+    low, high = db.execute(text(f"SELECT MIN(p.price_per_sqm), MAX(p.price_per_sqm) {source}"), params).one()
+    edges = histogram_edges(low, high, bins)
+    if low is None or high == low:
+        bucket = "0"
+    else:
+        params.update(low=low, width=(high - low) / bins, last=bins - 1)
+        bucket = "MIN(CAST((p.price_per_sqm - :low) / :width AS INTEGER), :last)"
+    area_bucket = "CASE " + " ".join(
+        f"WHEN p.area < {edge} THEN {i}" for i, edge in enumerate(AREA_BUCKET_EDGES)
+    ) + f" ELSE {len(AREA_BUCKET_EDGES)} END"
+
+    counts = dict(db.execute(text(f"SELECT {grp}, COUNT(*) {source} GROUP BY 1"), params).all())
+    histograms = {name: [0] * bins for name in counts}
+    for name, index, count in db.execute(text(
+        f"SELECT {grp}, {bucket}, COUNT(*) {source} AND p.price_per_sqm IS NOT NULL GROUP BY 1, 2"
+    ), params):
+        histograms[name][index] = count
+    areas = {name: [0] * (len(AREA_BUCKET_EDGES) + 1) for name in counts}
+    for name, index, count in db.execute(text(
+        f"SELECT {grp}, {area_bucket}, COUNT(*) {source} AND p.area IS NOT NULL GROUP BY 1, 2"
+    ), params):
+        areas[name][index] = count
+
+    empty = (0, [None] * len(PERCENTILES))
+    groups = []
+    for group in (grp, "''"):
+        prices = _sql_percentiles(db, "price_per_sqm", group, filters, params)
+        ratios = _sql_percentiles(db, "rent_ratio", group, filters, params)
+        groups.append((prices, ratios))
+
+    def make(name, key, count, histogram, area_counts, prices, ratios):
+        price_count, price_percentiles = prices.get(key, empty)
+        ratio_count, ratio_percentiles = ratios.get(key, empty)
+        return _group(name, count, price_count, price_percentiles, histogram,
+                      ratio_count, ratio_percentiles, area_counts)
+
+    districts = [
+        make(name, name, counts[name], histograms[name], areas[name], *groups[0])
+        for name in counts
+    ]
+    overall = make(
+        None, "", sum(counts.values()),
+        [sum(column) for column in zip(*histograms.values())] or [0] * bins,
+        [sum(column) for column in zip(*areas.values())] or [0] * (len(AREA_BUCKET_EDGES) + 1),
+        *groups[1]
+    )
+    return _result(edges, overall, districts)
@@ -1,5 +1,12 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 import bcrypt
 from fastapi import Depends, HTTPException, status
@@ -12,24 +19,80 @@ from app.models import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# bcrypt releases the GIL, so hashing runs truly in parallel on these threads.
+# The pool is bounded so a burst of logins queues here instead of occupying
+# every request thread and all CPUs at once.
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 
 def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a stored hash uses a different work factor than configured."""
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, get_password_hash, password)
+
+
+def shutdown_password_hashing():
+    _hash_executor.shutdown(wait=False)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as seen by request handlers."""
+    id: int
+    username: str
+    role: str
+
+
+# Principals verified against the users table, keyed by (username, jti).
+# Entries expire after PRINCIPAL_CACHE_TTL_SECONDS; invalidate_principals()
+# drops them early, though only in the worker process that ran the change.
+_principals: "OrderedDict[Tuple[str, Optional[str]], Tuple[float, Principal]]" = OrderedDict()
+_principals_lock = threading.Lock()
+
+
+def invalidate_principals(username: str):
+    with _principals_lock:
+        for key in [key for key in _principals if key[0] == username]:
+            del _principals[key]
 
 
 def create_access_token(data: dict, expires_delta: Optional[int] = None) -> str:
     to_encode = data.copy()
     # Use UTC timezone for JWT
     expire = datetime.now(timezone.utc).timestamp() + (expires_delta or settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+def create_user_token(user: User) -> str:
+    """Access token carrying the user's id and role as signed claims."""
+    return create_access_token(data={"sub": user.username, "uid": user.id, "role": user.role})
+
+
+def decode_token(token: str) -> dict:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -42,14 +105,55 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    return payload
+
 
-    user = db.query(User).filter(User.username == username).first()
+def load_principal(db: Session, payload: dict) -> Principal:
+    """Principal of a decoded token, checked against the database at most once per TTL."""
+    key = (payload["sub"], payload.get("jti"))
+    now = time.monotonic()
+    with _principals_lock:
+        entry = _principals.get(key)
+        if entry is not None and entry[0] > now:
+            _principals.move_to_end(key)
+            return entry[1]
+
+    user = db.query(User).filter(User.username == payload["sub"]).first()
     if user is None:
-        raise credentials_exception
-    return user
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    principal = Principal(id=user.id, username=user.username, role=user.role)
+
+    with _principals_lock:
+        _principals[key] = (now + settings.PRINCIPAL_CACHE_TTL_SECONDS, principal)
+        _principals.move_to_end(key)
+        while len(_principals) > settings.PRINCIPAL_CACHE_SIZE:
+            _principals.popitem(last=False)
+    return principal
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """
+    The authenticated user, for read-only requests.
+
+    Tokens issued by login carry id and role as signed claims and need no
+    query; older tokens without them fall back to load_principal.
+    """
+    payload = decode_token(token)
+    if "uid" in payload and "role" in payload:
+        return Principal(id=payload["uid"], username=payload["sub"], role=payload["role"])
+    return load_principal(db, payload)
+
+
+def get_verified_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """The authenticated user, with role and existence checked against the database."""
+    return load_principal(db, decode_token(token))
 
 
-def require_admin(current_user: User = Depends(get_current_user)) -> User:
+def require_admin(current_user: Principal = Depends(get_verified_user)) -> Principal:
     if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic_settings import BaseSettings
 
 
@@ -7,6 +9,75 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
 
+    # Password hashing: bcrypt work factor and size of the hashing thread pool
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+
+    # Authenticated users cached per worker process, keyed by token
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 300
+    PRINCIPAL_CACHE_SIZE: int = 1024
+
+    # SQLite performance profile, applied to every new connection
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE: int = 268435456
+    SQLITE_TEMP_STORE: str = "MEMORY"
+
+    # Connection pool, per uvicorn worker process
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+
+    # Background import jobs. Live progress is kept in IMPORT_JOB_DIR, which
+    # all workers must share; owners renew it every IMPORT_JOB_HEARTBEAT_SECONDS.
+    # Jobs run one at a time across workers, so more threads only wait
+    IMPORT_WORKERS: int = 1
+    IMPORT_JOB_DIR: str = "import_jobs"
+    IMPORT_JOB_HEARTBEAT_SECONDS: float = 10
+
+    # Media uploads: size limits in bytes, enforced while streaming
+    UPLOAD_MAX_PHOTO_SIZE: int = 20 * 1024 * 1024
+    UPLOAD_MAX_VIDEO_SIZE: int = 2 * 1024 * 1024 * 1024
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+
+    # Resumable video uploads: chunk size clients must use, and how long an
+    # unfinished session is kept after its last chunk
+    UPLOAD_SESSION_CHUNK_SIZE: int = 8 * 1024 * 1024
+    UPLOAD_SESSION_TTL_HOURS: int = 24
+
+    # Photo thumbnails (needs Pillow): widths in pixels, JPEG/WebP quality,
+    # and size of the resizing process pool
+    THUMBNAIL_WIDTHS: List[int] = [320, 640, 1280]
+    THUMBNAIL_QUALITY: int = 82
+    THUMBNAIL_WORKERS: int = 2
+
+    # Video posters and metadata (needs ffmpeg/ffprobe on PATH)
+    VIDEO_WORKERS: int = 1
+    VIDEO_TOOL_TIMEOUT: int = 120
+    VIDEO_META_WAIT_SECONDS: float = 5
+    POSTER_WIDTH: int = 1280
+
+    # Media serving: with X-Accel-Redirect on, responses only name the file
+    # and nginx sends it from the internal location at MEDIA_X_ACCEL_PREFIX
+    MEDIA_X_ACCEL_REDIRECT: bool = False
+    MEDIA_X_ACCEL_PREFIX: str = "/protected-uploads/"
+
+    # Orphaned media collection: files no photos/videos column refers to are
+    # removed once older than the grace period, every MEDIA_GC_INTERVAL_HOURS
+    # (0 turns the background task off). With quarantine they are moved to
+    # uploads/.quarantine and only deleted after MEDIA_GC_QUARANTINE_DAYS
+    MEDIA_GC_INTERVAL_HOURS: float = 24
+    MEDIA_GC_GRACE_HOURS: float = 24
+    MEDIA_GC_BATCH_SIZE: int = 200
+    MEDIA_GC_QUARANTINE: bool = False
+    MEDIA_GC_QUARANTINE_DAYS: int = 7
+
+    # Full-text search: matches of one kind beyond this many are listed
+    # newest first instead of being scored, which costs time per match
+    SEARCH_RANK_MAX_HITS: int = 5000
+
     class Config:
         env_file = ".env"
 
@@ -1,10 +1,26 @@
 from typing import Optional, List
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, Query, joinedload, noload, selectinload
 
-from app import models, schemas
+from app import metro, models, pagination, response_cache, schemas, schools, stats_store
+from app.database import begin_write
 
+# Sort keys accepted by the list endpoints
+COMMUNITY_SORT_COLUMNS = {
+    "id": models.Community.id,
+}
 
+PROPERTY_SORT_COLUMNS = {
+    "id": models.Property.id,
+    "price": models.Property.price,
+    "price_per_sqm": models.Property.price_per_sqm,
+    "rent_ratio": models.Property.rent_ratio,
+    "area": models.Property.area,
+    "visit_date": models.Property.visit_date,
+}
+
+
+# derived.DERIVED_COLUMNS has the same formulas in SQL for bulk recomputes;
+# change both together
 def calculate_rent_ratio(price: float, rent: float) -> Optional[float]:
     if price and rent and price > 0:
         return (rent * 12) / (price * 10000) * 100
@@ -17,17 +33,31 @@ def calculate_price_per_sqm(price: float, area: float) -> Optional[float]:
     return None
 
 
+def with_derived_fields(data: dict) -> dict:
+    """Fill in rent_ratio and price_per_sqm from price, rent and area."""
+    price = data.get("price")
+    rent = data.get("rent")
+    area = data.get("area")
+
+    data["rent_ratio"] = calculate_rent_ratio(price, rent)
+    data["price_per_sqm"] = calculate_price_per_sqm(price, area)
+    return data
+
+
 # User operations
 def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.username == username).first()
 
 
-def create_user(db: Session, user: schemas.UserCreate) -> models.User:
-    hashed_password = schemas.get_password_hash(user.password) if hasattr(schemas, 'get_password_hash') else None
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None) -> models.User:
+    """Create a user; pass hashed_password when it was already hashed off-thread."""
+    if hashed_password is None:
+        hashed_password = schemas.get_password_hash(user.password) if hasattr(schemas, 'get_password_hash') else None
     if hashed_password is None:
         from app.auth import get_password_hash
         hashed_password = get_password_hash(user.password)
 
+    begin_write(db)
     db_user = models.User(
         username=user.username,
         password_hash=hashed_password,
@@ -39,12 +69,65 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
     return db_user
 
 
+def set_password_hash(db: Session, user: models.User, password_hash: str):
+    begin_write(db)
+    user.password_hash = password_hash
+    db.commit()
+
+
 # Community operations
-def get_communities(db: Session, district: Optional[str] = None, skip: int = 0, limit: int = 100) -> List[models.Community]:
-    query = db.query(models.Community)
+def community_ids_matching(
+    metro_line: Optional[str] = None,
+    near_lat: Optional[float] = None,
+    near_lon: Optional[float] = None,
+    within: float = 1000
+) -> list:
+    """Subqueries of the community ids the metro and location filters allow."""
+    subqueries = []
+    if metro_line:
+        subqueries.append(metro.community_ids_on_line(metro_line))
+    if near_lat is not None and near_lon is not None:
+        subqueries.append(metro.community_ids_near(near_lat, near_lon, within))
+    return subqueries
+
+
+def filter_communities(
+    query: Query,
+    district: Optional[str] = None,
+    metro_line: Optional[str] = None,
+    near_lat: Optional[float] = None,
+    near_lon: Optional[float] = None,
+    within: float = 1000
+) -> Query:
+    """Apply the community list filters to a query over Community."""
     if district:
         query = query.filter(models.Community.district == district)
-    return query.offset(skip).limit(limit).all()
+    for ids in community_ids_matching(metro_line, near_lat, near_lon, within):
+        query = query.filter(models.Community.id.in_(ids))
+    return query
+
+
+def get_communities(
+    db: Session,
+    district: Optional[str] = None,
+    metro_line: Optional[str] = None,
+    near_lat: Optional[float] = None,
+    near_lon: Optional[float] = None,
+    within: float = 1000,
+    sort: str = "id",
+    order: str = "asc",
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100
+) -> List[models.Community]:
+    query = filter_communities(
+        db.query(models.Community), district=district, metro_line=metro_line,
+        near_lat=near_lat, near_lon=near_lon, within=within
+    )
+    return pagination.keyset_page(
+        query, sort, COMMUNITY_SORT_COLUMNS[sort], models.Community.id,
+        order=order, cursor=cursor, skip=skip, limit=limit
+    )
 
 
 def get_community(db: Session, community_id: int) -> Optional[models.Community]:
@@ -52,35 +135,52 @@ def get_community(db: Session, community_id: int) -> Optional[models.Community]:
 
 
 def create_community(db: Session, community: schemas.CommunityCreate) -> models.Community:
+    begin_write(db)
     db_community = models.Community(**community.model_dump())
     db.add(db_community)
+    schools.link_community(db, db_community)
+    metro.link_community(db, db_community)
+    stats_store.community_added(db, db_community.district)
+    response_cache.bump_data_version(db)
     db.commit()
     db.refresh(db_community)
     return db_community
 
 
 def update_community(db: Session, community_id: int, community: schemas.CommunityUpdate) -> Optional[models.Community]:
+    begin_write(db)
     db_community = get_community(db, community_id)
     if db_community:
-        for key, value in community.model_dump(exclude_unset=True).items():
+        old_district = db_community.district
+        data = community.model_dump(exclude_unset=True)
+        for key, value in data.items():
             setattr(db_community, key, value)
+        if data.keys() & schools.LEVEL_COLUMNS.values():
+            schools.link_community(db, db_community)
+        if "metro" in data:
+            metro.link_community(db, db_community)
+        stats_store.community_moved(db, community_id, old_district, db_community.district)
+        response_cache.bump_data_version(db)
         db.commit()
         db.refresh(db_community)
     return db_community
 
 
 def delete_community(db: Session, community_id: int) -> bool:
+    begin_write(db)
     db_community = get_community(db, community_id)
     if db_community:
+        stats_store.community_removed(db, community_id, db_community.district)
         db.delete(db_community)
+        response_cache.bump_data_version(db)
         db.commit()
         return True
     return False
 
 
 # Property operations
-def get_properties(
-    db: Session,
+def filter_properties(
+    query: Query,
     community_id: Optional[int] = None,
     district: Optional[str] = None,
     min_price: Optional[float] = None,
@@ -89,14 +189,21 @@ def get_properties(
     max_area: Optional[float] = None,
     min_rent_ratio: Optional[float] = None,
     max_rent_ratio: Optional[float] = None,
-    skip: int = 0,
-    limit: int = 100
-) -> List[models.Property]:
-    query = db.query(models.Property)
-
+    school: Optional[str] = None,
+    metro_line: Optional[str] = None,
+    near_lat: Optional[float] = None,
+    near_lon: Optional[float] = None,
+    within: float = 1000
+) -> Query:
+    """Apply the property list filters to a query over Property."""
     if community_id:
         query = query.filter(models.Property.community_id == community_id)
 
+    if school:
+        query = query.filter(models.Property.community_id.in_(schools.community_ids_for_school(school)))
+    for ids in community_ids_matching(metro_line, near_lat, near_lon, within):
+        query = query.filter(models.Property.community_id.in_(ids))
+
     if district:
         query = query.join(models.Community).filter(models.Community.district == district)
 
@@ -115,35 +222,92 @@ def get_properties(
     if max_rent_ratio is not None:
         query = query.filter(models.Property.rent_ratio <= max_rent_ratio)
 
-    return query.offset(skip).limit(limit).all()
+    return query
+
+
+def get_properties(
+    db: Session,
+    community_id: Optional[int] = None,
+    district: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_area: Optional[float] = None,
+    max_area: Optional[float] = None,
+    min_rent_ratio: Optional[float] = None,
+    max_rent_ratio: Optional[float] = None,
+    school: Optional[str] = None,
+    metro_line: Optional[str] = None,
+    near_lat: Optional[float] = None,
+    near_lon: Optional[float] = None,
+    within: float = 1000,
+    sort: str = "id",
+    order: str = "asc",
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    include_community: bool = True
+) -> List[models.Property]:
+    # Communities of the whole page are loaded with one extra IN query,
+    # once per distinct community, instead of one lazy load per property
+    loader = selectinload if include_community else noload
+    query = filter_properties(
+        db.query(models.Property).options(loader(models.Property.community)),
+        community_id=community_id,
+        district=district,
+        min_price=min_price,
+        max_price=max_price,
+        min_area=min_area,
+        max_area=max_area,
+        min_rent_ratio=min_rent_ratio,
+        max_rent_ratio=max_rent_ratio,
+        school=school,
+        metro_line=metro_line,
+        near_lat=near_lat,
+        near_lon=near_lon,
+        within=within
+    )
+    return pagination.keyset_page(
+        query, sort, PROPERTY_SORT_COLUMNS[sort], models.Property.id,
+        order=order, cursor=cursor, skip=skip, limit=limit
+    )
+
 
+def get_property(db: Session, property_id: int, include_community: Optional[bool] = None) -> Optional[models.Property]:
+    """
+    Get a property by id.
 
-def get_property(db: Session, property_id: int) -> Optional[models.Property]:
-    return db.query(models.Property).filter(models.Property.id == property_id).first()
+    include_community=True joins its community into the same query, False
+    skips loading it, and None leaves it to load lazily on access.
+    """
+    query = db.query(models.Property)
+    if include_community is not None:
+        loader = joinedload if include_community else noload
+        query = query.options(loader(models.Property.community))
+    return query.filter(models.Property.id == property_id).first()
 
 
 def create_property(db: Session, property: schemas.PropertyCreate) -> models.Property:
-    data = property.model_dump()
-
+    begin_write(db)
     # Calculate rent_ratio and price_per_sqm
-    price = data.get("price")
-    rent = data.get("rent")
-    area = data.get("area")
-
-    data["rent_ratio"] = calculate_rent_ratio(price, rent)
-    data["price_per_sqm"] = calculate_price_per_sqm(price, area)
+    data = with_derived_fields(property.model_dump())
 
     db_property = models.Property(**data)
     db.add(db_property)
+    stats_store.property_added(db, data["community_id"], data["price"], data["rent"], data["rent_ratio"])
+    response_cache.bump_data_version(db)
     db.commit()
     db.refresh(db_property)
     return db_property
 
 
 def update_property(db: Session, property_id: int, property: schemas.PropertyUpdate) -> Optional[models.Property]:
+    begin_write(db)
     db_property = get_property(db, property_id)
     if db_property:
         data = property.model_dump(exclude_unset=True)
+        stats_store.property_removed(
+            db, db_property.community_id, db_property.price, db_property.rent, db_property.rent_ratio
+        )
 
         # Recalculate rent_ratio and price_per_sqm
         price = data.get("price", db_property.price)
@@ -155,15 +319,24 @@ def update_property(db: Session, property_id: int, property: schemas.PropertyUpd
 
         for key, value in data.items():
             setattr(db_property, key, value)
+        stats_store.property_added(
+            db, db_property.community_id, db_property.price, db_property.rent, db_property.rent_ratio
+        )
+        response_cache.bump_data_version(db)
         db.commit()
         db.refresh(db_property)
     return db_property
 
 
 def delete_property(db: Session, property_id: int) -> bool:
+    begin_write(db)
     db_property = get_property(db, property_id)
     if db_property:
+        stats_store.property_removed(
+            db, db_property.community_id, db_property.price, db_property.rent, db_property.rent_ratio
+        )
         db.delete(db_property)
+        response_cache.bump_data_version(db)
         db.commit()
         return True
     return False
@@ -171,38 +344,4 @@ def delete_property(db: Session, property_id: int) -> bool:
 
 # Stats operations
 def get_stats(db: Session) -> dict:
-    total_communities = db.query(func.count(models.Community.id)).scalar() or 0
-    total_properties = db.query(func.count(models.Property.id)).scalar() or 0
-
-    avg_price = db.query(func.avg(models.Property.price)).scalar()
-    avg_rent = db.query(func.avg(models.Property.rent)).scalar()
-    avg_rent_ratio = db.query(func.avg(models.Property.rent_ratio)).scalar()
-
-    # District stats
-    district_stats = db.query(
-        models.Community.district,
-        func.count(models.Community.id).label("community_count"),
-        func.count(models.Property.id).label("property_count"),
-        func.avg(models.Property.price).label("avg_price")
-    ).join(
-        models.Property, models.Community.id == models.Property.community_id, isouter=True
-    ).group_by(
-        models.Community.district
-    ).all()
-
-    return {
-        "total_communities": total_communities,
-        "total_properties": total_properties,
-        "average_price": avg_price,
-        "average_rent": avg_rent,
-        "average_rent_ratio": avg_rent_ratio,
-        "district_stats": [
-            {
-                "district": stat[0] or "未知",
-                "community_count": stat[1],
-                "property_count": stat[2],
-                "average_price": stat[3]
-            }
-            for stat in district_stats
-        ]
-    }
+    return stats_store.read_stats(db)
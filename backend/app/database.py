@@ -1,14 +1,118 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
 from app.config import settings
 
 Base = declarative_base()
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
+# Execution options of a transaction that will write; see begin_write()
+WRITE_TRANSACTION = {"sqlite_immediate": True}
+
+
+def sqlite_pragmas() -> Dict[str, object]:
+    """PRAGMAs of the configured SQLite performance profile."""
+    return {
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        # Negative cache_size is in KiB rather than pages
+        "cache_size": -settings.SQLITE_CACHE_SIZE_KB,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "temp_store": settings.SQLITE_TEMP_STORE,
+    }
+
+
+def make_engine(url: str, pragmas: Optional[Dict[str, object]] = None) -> Engine:
+    """
+    Create an engine for url.
+
+    SQLite connections get the PRAGMAs from sqlite_pragmas() (or the given
+    ones) on connect. WAL lets readers proceed while an import is writing,
+    and busy_timeout makes writers in other workers wait instead of failing.
+
+    pysqlite only opens a transaction before DML statements, so SAVEPOINTs
+    (begin_nested) and DDL would otherwise run and commit on their own. Its
+    transaction handling is turned off and the engine emits BEGIN itself, so
+    a session or engine.begin() block is one SQLite transaction. With the
+    WRITE_TRANSACTION options it emits BEGIN IMMEDIATE.
+    """
+    db_url = make_url(url)
+    if db_url.get_backend_name() != "sqlite":
+        return create_engine(
+            url,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT
+        )
+
+    if db_url.database in (None, "", ":memory:"):
+        # In-memory databases use a single-connection pool and no profile
+        return with_sqlite_transactions(create_engine(url, connect_args={"check_same_thread": False}))
+
+    sqlite_engine = create_engine(
+        url,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT
+    )
+
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+
+    @event.listens_for(sqlite_engine, "connect")
+    def apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return with_sqlite_transactions(sqlite_engine)
+
+
+def with_sqlite_transactions(sqlite_engine: Engine) -> Engine:
+    """Have SQLAlchemy, not pysqlite, begin transactions (the SQLAlchemy pysqlite recipe)."""
+
+    @event.listens_for(sqlite_engine, "connect")
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(sqlite_engine, "begin")
+    def begin_transaction(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE" if conn.get_execution_options().get("sqlite_immediate") else "BEGIN")
+
+    return sqlite_engine
+
+
+def begin_write(db: Session):
+    """
+    Start a transaction on db that takes SQLite's write lock up front.
+
+    A transaction that reads before it writes fails at its first write with
+    "database is locked" if another connection committed in between; BEGIN
+    IMMEDIATE waits busy_timeout for the lock instead. Every write path
+    calls this before its first read. Ends any read-only transaction still
+    open on db, and does nothing if db already holds the write lock.
+    """
+    if in_write_transaction(db):
+        return
+    db.commit()
+    db.connection(execution_options=WRITE_TRANSACTION)
+
+
+def in_write_transaction(db: Session) -> bool:
+    """Whether db has a transaction open that began with begin_write()."""
+    if not db.in_transaction():
+        return False
+    return bool(db.connection().get_execution_options().get("sqlite_immediate"))
+
+
+engine = make_engine(settings.DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -22,7 +126,6 @@ def get_db():
 
 
 def init_db():
-    """Initialize database tables."""
-    # Import models to register them with Base
-    from app import models
-    Base.metadata.create_all(bind=engine)
+    """Initialize the database by applying pending schema migrations."""
+    from app.migrations import run_migrations
+    run_migrations(engine)
@@ -0,0 +1,117 @@
+# Bulk recomputation of derived property metrics
+#
+# rent_ratio and price_per_sqm are computed per row by crud when a property
+# is written. Rows written some other way, or with values from an older
+# formula, are fixed here with one set-based UPDATE: the formulas are SQL
+# expressions evaluated by SQLite over the whole table, and only rows whose
+# stored value differs are written. A dry run reports the same differences
+# without writing.
+#
+# SQLite evaluates the formulas with the same double arithmetic as Python,
+# so values crud wrote compare equal and differences are exact (IS NOT),
+# which is also much cheaper to evaluate than a tolerance.
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import and_, case, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app import models, response_cache, stats_store
+from app.database import begin_write
+
+# Differing values listed by default
+DEFAULT_SHOW = 20
+
+p = models.Property.__table__.c
+
+# Same formulas as crud.calculate_rent_ratio and crud.calculate_price_per_sqm,
+# including which inputs give NULL; change them together
+DERIVED_COLUMNS = {
+    "rent_ratio": case(
+        (and_(p.price > 0, p.rent != 0), (p.rent * 12) / (p.price * 10000) * 100),
+        else_=None
+    ),
+    "price_per_sqm": case(
+        (and_(p.price != 0, p.area > 0), p.price * 10000 / p.area),
+        else_=None
+    ),
+}
+
+
+def differs(column: str):
+    """Condition for a stored derived column not matching its formula, NULLs included."""
+    return p[column].is_not(DERIVED_COLUMNS[column])
+
+
+def any_differs():
+    return or_(*(differs(name) for name in DERIVED_COLUMNS))
+
+
+def _sum_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def count_changes(db: Session) -> Dict:
+    """Properties checked, those with derived values off, and values off per field."""
+    checked, mismatched, *by_field = db.execute(
+        select(
+            func.count(),
+            _sum_if(any_differs()),
+            *(_sum_if(differs(name)) for name in DERIVED_COLUMNS),
+        ).select_from(models.Property.__table__)
+    ).one()
+    return {
+        "checked": checked,
+        "mismatched": mismatched,
+        "mismatched_by_field": dict(zip(DERIVED_COLUMNS, by_field)),
+    }
+
+
+def list_changes(db: Session, show: int = DEFAULT_SHOW) -> List[Dict]:
+    """The first show differing values, by property id."""
+    names = list(DERIVED_COLUMNS)
+    rows = db.execute(
+        select(p.id, *(
+            expression
+            for name in names
+            for expression in (p[name], DERIVED_COLUMNS[name], differs(name))
+        ))
+        .where(any_differs())
+        .order_by(p.id)
+        .limit(show)
+    ).all()
+
+    changes = []
+    for row in rows:
+        for i, name in enumerate(names):
+            stored, computed, off = row[1 + 3 * i:4 + 3 * i]
+            if off:
+                changes.append({"id": row.id, "field": name, "stored": stored, "computed": computed})
+    return changes[:show]
+
+
+def recompute(db: Session, dry_run: bool = False, show: int = DEFAULT_SHOW) -> Dict:
+    """
+    Rewrite the derived columns of every property whose stored values are
+    off, in one UPDATE. Commits unless dry_run. Returns the counts of what
+    was off, the first differences (as they were before) and rows written.
+    """
+    if not dry_run:
+        begin_write(db)
+    result = {**count_changes(db), "changes": list_changes(db, show), "dry_run": dry_run, "updated": 0}
+    if dry_run or not result["mismatched"]:
+        return result
+
+    # updated_at moves so the analytics snapshot picks the rows up
+    updated = db.execute(
+        update(models.Property.__table__)
+        .where(any_differs())
+        .values(updated_at=datetime.utcnow(), **DERIVED_COLUMNS)
+    )
+    result["updated"] = updated.rowcount
+    # Rebuilt rather than adjusted: rows written around the app never
+    # reached district_stats either
+    stats_store.rebuild(db)
+    response_cache.bump_data_version(db)
+    db.commit()
+    return result
@@ -0,0 +1,246 @@
+# Streaming Excel/CSV export
+import csv
+import io
+import math
+import time
+import zipfile
+from io import StringIO
+from typing import Any, Callable, Iterator, List
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import get_column_letter
+from sqlalchemy.orm import Session
+
+from app import crud, models
+from app.database import SessionLocal
+from app.importer import COMMUNITY_HEADERS, PROPERTY_HEADERS
+
+# Rows fetched from the cursor per round trip, and rows per CSV or xlsx chunk
+EXPORT_BATCH_SIZE = 1000
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_MEDIA_TYPE = "text/csv"
+
+# Same column order as the import templates, so exports can be re-imported.
+# Derived metrics are appended after the template columns.
+COMMUNITY_EXPORT_HEADERS = COMMUNITY_HEADERS
+PROPERTY_EXPORT_HEADERS = PROPERTY_HEADERS + ["单价(元/㎡)", "租售比(%)"]
+
+
+# ============ Row Sources ============
+
+def iter_community_rows(db: Session, **filters: Any) -> Iterator[tuple]:
+    """Yield community export rows matching crud.filter_communities filters, fetched in batches."""
+    c = models.Community
+    query = crud.filter_communities(
+        db.query(
+            c.name, c.district, c.address, c.property_fee, c.parking, c.build_year,
+            c.metro, c.primary_school, c.middle_school, c.environment_score, c.notes
+        ),
+        **filters
+    )
+
+    for row in query.order_by(c.id).yield_per(EXPORT_BATCH_SIZE):
+        yield tuple(row)
+
+
+def iter_property_rows(db: Session, **filters: Any) -> Iterator[tuple]:
+    """Yield property export rows matching crud.get_properties filters."""
+    # Community names are resolved from a small id->name map instead of a
+    # join, so the list filters can add their own join when needed.
+    community_names = dict(db.query(models.Community.id, models.Community.name).all())
+
+    p = models.Property
+    query = crud.filter_properties(
+        db.query(
+            p.community_id, p.building, p.unit, p.room, p.area, p.layout,
+            p.floor, p.orientation, p.decoration, p.price, p.rent,
+            p.expected_price, p.visit_date, p.notes, p.price_per_sqm, p.rent_ratio
+        ),
+        **filters
+    )
+
+    for row in query.order_by(p.id).yield_per(EXPORT_BATCH_SIZE):
+        values = list(row)
+        values[0] = community_names.get(row.community_id)
+        # Same format the importer parses
+        values[12] = row.visit_date.strftime("%Y-%m-%d") if row.visit_date else None
+        yield tuple(values)
+
+
+# ============ Encoders ============
+
+def stream_csv(headers: List[str], rows: Iterator[tuple]) -> Iterator[bytes]:
+    """Encode rows as CSV, yielding one chunk per EXPORT_BATCH_SIZE rows."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel detects UTF-8 and shows Chinese headers correctly
+    buffer.write("\ufeff")
+    writer.writerow(headers)
+
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode("utf-8")
+
+
+# Package parts of a one-sheet workbook; the sheet itself is streamed
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name={title} sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+
+XLSX_SHEET_END = '</sheetData></worksheet>'
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable file that collects what is written until drained."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def xlsx_cell(reference: str, value: Any) -> str:
+    """A cell element: numbers as values, everything else as an inline string."""
+    if value is None or (isinstance(value, float) and not math.isfinite(value)):
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{reference}"><v>{value!r}</v></c>'
+    text = escape(ILLEGAL_CHARACTERS_RE.sub("", str(value)))
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_row(number: int, columns: List[str], values: tuple) -> str:
+    cells = "".join(xlsx_cell(f"{column}{number}", value) for column, value in zip(columns, values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+def stream_xlsx(title: str, headers: List[str], rows: Iterator[tuple]) -> Iterator[bytes]:
+    """
+    Encode rows as a one-sheet workbook, yielding the zip as it is written.
+
+    The fixed package parts go first and the sheet is compressed into the
+    archive EXPORT_BATCH_SIZE rows at a time, so the first bytes go out
+    before the rows are read and neither the rows nor the file are held
+    in memory or on disk.
+    """
+    columns = [get_column_letter(i) for i in range(1, len(headers) + 1)]
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", XLSX_CONTENT_TYPES)
+        archive.writestr("_rels/.rels", XLSX_ROOT_RELS)
+        archive.writestr("xl/workbook.xml", XLSX_WORKBOOK.format(title=quoteattr(title)))
+        archive.writestr("xl/_rels/workbook.xml.rels", XLSX_WORKBOOK_RELS)
+        archive.writestr("xl/styles.xml", XLSX_STYLES)
+        yield sink.drain()
+
+        entry = zipfile.ZipInfo("xl/worksheets/sheet1.xml", time.localtime()[:6])
+        entry.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(entry, "w") as sheet:
+            batch = [XLSX_SHEET_START, xlsx_row(1, columns, tuple(headers))]
+            for number, row in enumerate(rows, start=2):
+                batch.append(xlsx_row(number, columns, row))
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    sheet.write("".join(batch).encode("utf-8"))
+                    batch.clear()
+                    yield sink.drain()
+            batch.append(XLSX_SHEET_END)
+            sheet.write("".join(batch).encode("utf-8"))
+
+    yield sink.drain()
+
+
+def export_stream(
+    fmt: str,
+    title: str,
+    headers: List[str],
+    row_source: Callable[[Session], Iterator[tuple]]
+) -> Iterator[bytes]:
+    """
+    Stream an export in the given format using its own database session.
+
+    The session lives as long as the response body is being generated,
+    which outlasts request-scoped dependencies.
+    """
+    db = SessionLocal()
+    try:
+        rows = row_source(db)
+        if fmt == "csv":
+            yield from stream_csv(headers, rows)
+        else:
+            yield from stream_xlsx(title, headers, rows)
+    finally:
+        db.close()
@@ -0,0 +1,288 @@
+# Bulk Excel import engine
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import openpyxl
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app import crud, metro, models, response_cache, schemas, schools, stats_store
+from app.database import begin_write
+
+# Rows written per INSERT statement
+BATCH_SIZE = 500
+
+# Sheet headers, in column order, shared by templates, imports and exports
+COMMUNITY_HEADERS = [
+    "小区名称*", "所属区*", "详细地址", "物业费", "停车位", "建成年份",
+    "周边配套/地铁", "对口小学", "对口中学", "环境打分(1-10)", "备注"
+]
+
+PROPERTY_HEADERS = [
+    "小区名称*", "楼号", "单元", "房号", "面积(㎡)*", "户型",
+    "楼层", "朝向", "装修情况", "挂牌价格(万)*", "租金(元/月)",
+    "预计价格(万)", "看房日期(YYYY-MM-DD)", "备注"
+]
+
+
+# ============ Workbook Reading ============
+
+def iter_sheet_rows(path: str) -> Iterator[Tuple[int, tuple]]:
+    """
+    Yield (row_number, values) for each data row of the active sheet.
+
+    The workbook is opened in read-only mode, which streams rows from the
+    file instead of loading the whole sheet into memory.
+    """
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        # Skip header row
+        yield from enumerate(ws.iter_rows(min_row=2, values_only=True), start=2)
+    finally:
+        wb.close()
+
+
+# ============ Row Parsing ============
+
+def parse_community_row(row: list) -> Dict[str, Any]:
+    """Parse a community row from Excel."""
+    return {
+        "name": str(row[0]).strip() if row[0] else "",
+        "district": str(row[1]).strip() if row[1] else "",
+        "address": str(row[2]).strip() if len(row) > 2 and row[2] else "",
+        "property_fee": str(row[3]).strip() if len(row) > 3 and row[3] else "",
+        "parking": str(row[4]).strip() if len(row) > 4 and row[4] else "",
+        "build_year": int(row[5]) if len(row) > 5 and row[5] and str(row[5]).isdigit() else None,
+        "metro": str(row[6]).strip() if len(row) > 6 and row[6] else "",
+        "primary_school": str(row[7]).strip() if len(row) > 7 and row[7] else "",
+        "middle_school": str(row[8]).strip() if len(row) > 8 and row[8] else "",
+        "environment_score": int(row[9]) if len(row) > 9 and row[9] and str(row[9]).isdigit() else None,
+        "notes": str(row[10]).strip() if len(row) > 10 and row[10] else "",
+    }
+
+
+def parse_property_row(row: list, community_map: Dict[str, int]) -> Optional[Dict[str, Any]]:
+    """Parse a property row from Excel."""
+    community_name = str(row[0]).strip() if row[0] else ""
+
+    if community_name not in community_map:
+        return None
+
+    # Parse visit_date
+    visit_date = None
+    if len(row) > 12 and row[12]:
+        try:
+            visit_date = datetime.strptime(str(row[12]).strip(), "%Y-%m-%d")
+        except ValueError:
+            pass
+
+    return {
+        "community_id": community_map[community_name],
+        "building": str(row[1]).strip() if len(row) > 1 and row[1] else "",
+        "unit": str(row[2]).strip() if len(row) > 2 and row[2] else "",
+        "room": str(row[3]).strip() if len(row) > 3 and row[3] else "",
+        "area": float(row[4]) if len(row) > 4 and row[4] else None,
+        "layout": str(row[5]).strip() if len(row) > 5 and row[5] else "",
+        "floor": str(row[6]).strip() if len(row) > 6 and row[6] else "",
+        "orientation": str(row[7]).strip() if len(row) > 7 and row[7] else "",
+        "decoration": str(row[8]).strip() if len(row) > 8 and row[8] else "",
+        "price": float(row[9]) if len(row) > 9 and row[9] else None,
+        "rent": float(row[10]) if len(row) > 10 and row[10] else None,
+        "expected_price": float(row[11]) if len(row) > 11 and row[11] else None,
+        "visit_date": visit_date,
+        "notes": str(row[13]).strip() if len(row) > 13 and row[13] else "",
+    }
+
+
+# ============ Row Validation ============
+
+def validate_community_row(row: list) -> Dict[str, Any]:
+    """Parse and validate a community row, raising ValueError on bad input."""
+    data = parse_community_row(row)
+
+    if not data["name"]:
+        raise ValueError("小区名称不能为空")
+    if not data["district"]:
+        raise ValueError("所属区不能为空")
+
+    return schemas.CommunityCreate(**data).model_dump()
+
+
+def validate_property_row(row: list, community_map: Dict[str, int]) -> Dict[str, Any]:
+    """Parse and validate a property row, raising ValueError on bad input."""
+    data = parse_property_row(row, community_map)
+
+    if not data:
+        raise ValueError(f"小区 '{row[0]}' 不存在，请先创建小区")
+    if not data["area"]:
+        raise ValueError("面积不能为空")
+    if not data["price"]:
+        raise ValueError("挂牌价格不能为空")
+
+    return crud.with_derived_fields(schemas.PropertyCreate(**data).model_dump())
+
+
+def validate_rows(
+    rows: Iterable[Tuple[int, tuple]],
+    validate: Callable[[tuple], Dict[str, Any]],
+    errors: List[str]
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Lazily validate (row_number, row) pairs, appending per-row error messages to errors."""
+    for row_number, row in rows:
+        if not row or not row[0]:  # Skip empty rows
+            continue
+
+        try:
+            yield row_number, validate(row)
+        except Exception as e:
+            errors.append(f"Row {row_number}: {str(e)}")
+
+
+# ============ Bulk Insert ============
+
+def insert_batch(
+    db: Session,
+    model,
+    batch: List[Tuple[int, Dict[str, Any]]],
+    returning: tuple
+) -> Tuple[list, List[str]]:
+    """
+    Insert a batch with one executemany INSERT inside a savepoint.
+
+    If the batch fails, it is replayed row by row, each row in its own
+    savepoint, so only the offending rows are rejected and reported.
+    """
+    stmt = insert(model).returning(*returning, sort_by_parameter_order=True)
+
+    try:
+        with db.begin_nested():
+            return db.execute(stmt, [values for _, values in batch]).all(), []
+    except SQLAlchemyError:
+        pass
+
+    inserted = []
+    errors = []
+    for row_number, values in batch:
+        try:
+            with db.begin_nested():
+                inserted.extend(db.execute(stmt, [values]).all())
+        except SQLAlchemyError as e:
+            errors.append(f"Row {row_number}: {str(getattr(e, 'orig', e))}")
+
+    return inserted, errors
+
+
+def bulk_insert(
+    db: Session,
+    model,
+    records: Iterable[Tuple[int, Dict[str, Any]]],
+    returning: tuple,
+    on_batch: Optional[Callable[[int, List[str]], None]] = None
+) -> Tuple[list, List[str]]:
+    """
+    Insert validated records in batches within the current transaction.
+
+    Records are consumed lazily, so at most one batch is held in memory.
+    on_batch, if given, is called after every batch with the number of rows
+    inserted so far and the insert errors so far.
+    """
+    inserted = []
+    errors = []
+    records = iter(records)
+
+    while True:
+        batch = list(islice(records, BATCH_SIZE))
+        if not batch:
+            break
+        rows, batch_errors = insert_batch(db, model, batch, returning)
+        inserted.extend(rows)
+        errors.extend(batch_errors)
+        if on_batch:
+            on_batch(len(inserted), errors)
+
+    return inserted, errors
+
+
+# ============ Importers ============
+
+# Called with (rows imported so far, all errors so far)
+ProgressCallback = Callable[[int, List[str]], None]
+
+
+def progress_reporter(
+    progress: Optional[ProgressCallback],
+    errors: List[str]
+) -> Optional[Callable[[int, List[str]], None]]:
+    """Adapt an importer progress callback to bulk_insert's on_batch hook."""
+    if progress is None:
+        return None
+    return lambda imported, insert_errors: progress(imported, errors + insert_errors)
+
+
+def import_communities(
+    db: Session,
+    rows: Iterable[Tuple[int, tuple]],
+    progress: Optional[ProgressCallback] = None,
+    commit: bool = True
+) -> Dict[str, Any]:
+    """
+    Validate community rows and bulk insert the valid ones batch by batch.
+    Commits unless commit=False, which leaves the caller's writes to join
+    the import's transaction.
+    """
+    begin_write(db)
+    errors = []
+    records = validate_rows(rows, validate_community_row, errors)
+
+    inserted, insert_errors = bulk_insert(
+        db, models.Community, records,
+        (models.Community.id, models.Community.name, models.Community.district,
+         models.Community.primary_school, models.Community.middle_school, models.Community.metro),
+        on_batch=progress_reporter(progress, errors)
+    )
+    schools.link_communities(db, inserted)
+    metro.link_communities(db, inserted)
+    stats_store.communities_imported(db, (row.district for row in inserted))
+    response_cache.bump_data_version(db)
+    if commit:
+        db.commit()
+
+    return {
+        "details": [{"id": row.id, "name": row.name} for row in inserted],
+        "errors": errors + insert_errors,
+    }
+
+
+def import_properties(
+    db: Session,
+    rows: Iterable[Tuple[int, tuple]],
+    progress: Optional[ProgressCallback] = None,
+    commit: bool = True
+) -> Dict[str, Any]:
+    """Validate property rows and bulk insert the valid ones batch by batch. Commits unless commit=False."""
+    begin_write(db)
+    community_map = dict(db.query(models.Community.name, models.Community.id).all())
+
+    errors = []
+    records = validate_rows(
+        rows, lambda row: validate_property_row(row, community_map), errors
+    )
+
+    inserted, insert_errors = bulk_insert(
+        db, models.Property, records,
+        (models.Property.id, models.Property.area, models.Property.price,
+         models.Property.community_id, models.Property.rent, models.Property.rent_ratio),
+        on_batch=progress_reporter(progress, errors)
+    )
+    stats_store.properties_imported(db, inserted)
+    response_cache.bump_data_version(db)
+    if commit:
+        db.commit()
+
+    return {
+        "details": [{"id": row.id, "area": row.area, "price": row.price} for row in inserted],
+        "errors": errors + insert_errors,
+    }
@@ -0,0 +1,389 @@
+# Background Excel import jobs
+#
+# A job's row in import_jobs holds its final state, and is written in the
+# same transaction as the rows it imported: a job is only ever recorded
+# succeeded with its rows in place, and failed without them. Until then the
+# job lives in a JSON file in IMPORT_JOB_DIR that every worker process can
+# read: the job's fields, the owner's host and pid, and the rows processed
+# and errors so far, rewritten after every batch. An import holds SQLite's
+# write lock from start to end, so queueing a job or reporting progress
+# cannot wait for the database.
+#
+# Jobs of all workers run one at a time, under a lock file in IMPORT_JOB_DIR,
+# so they do not queue for the write lock behind each other.
+#
+# The owning process touches the files of its unfinished jobs every
+# IMPORT_JOB_HEARTBEAT_SECONDS. A job whose owner pid is gone, or whose file
+# is no longer touched, was interrupted: polls report it failed at once, and
+# the next worker to start records that; jobs of live workers are left alone.
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app import importer, models
+from app.config import settings
+from app.database import SessionLocal, begin_write
+
+logger = logging.getLogger(__name__)
+
+IMPORTERS = {
+    "community": importer.import_communities,
+    "property": importer.import_properties,
+}
+
+UNFINISHED = ("pending", "running")
+
+JOB_DIR = Path(settings.IMPORT_JOB_DIR)
+
+# Job fields kept in the state file until the job's row is written
+JOB_FIELDS = ("id", "kind", "filename", "status", "created_by", "created_at", "started_at")
+
+# Heartbeats a job may miss before it counts as abandoned
+STALE_HEARTBEATS = 6
+
+HOSTNAME = socket.gethostname()
+
+LOCK_FILENAME = ".import.lock"
+
+# Attempts at recording a failed job while other writers hold the lock
+RECORD_ATTEMPTS = 3
+
+# Bounded pool shared by all import jobs of this process
+_executor = ThreadPoolExecutor(max_workers=settings.IMPORT_WORKERS, thread_name_prefix="import-job")
+
+# Unfinished jobs of this process, kept alive by the heartbeat thread
+_owned: Set[str] = set()
+_owned_lock = threading.Lock()
+_heartbeat: Optional[threading.Thread] = None
+_stopping = threading.Event()
+
+# Jobs submitted to the pool and not finished, with their spooled workbook
+_queued: Dict[str, Tuple[Future, str]] = {}
+_queued_lock = threading.Lock()
+
+
+# ============ Live State ============
+
+def state_path(job_id: str) -> Path:
+    return JOB_DIR / f"{job_id}.json"
+
+
+def write_state(job: models.ImportJob, imported: int = 0, errors: List[str] = ()):
+    """Replace a job's live state file, which also renews its heartbeat."""
+    state = {
+        "job": {
+            name: value.isoformat() if isinstance(value, datetime) else value
+            for name, value in ((name, getattr(job, name)) for name in JOB_FIELDS)
+        },
+        "host": HOSTNAME,
+        "pid": os.getpid(),
+        "rows_processed": imported + len(errors),
+        "imported": imported,
+        "errors": list(errors),
+    }
+    tmp = JOB_DIR / f".{job.id}.tmp"
+    tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, state_path(job.id))
+
+
+def read_state(job_id: str) -> Optional[dict]:
+    """A job's live state with its last heartbeat, or None once it has none."""
+    try:
+        with open(state_path(job_id), encoding="utf-8") as f:
+            state = json.load(f)
+            state["heartbeat"] = os.fstat(f.fileno()).st_mtime
+    except (FileNotFoundError, ValueError):
+        return None
+    return state
+
+
+def state_job(state: dict) -> models.ImportJob:
+    """The job a state file describes, as a row not yet added to any session."""
+    fields = dict(state["job"])
+    for name in ("created_at", "started_at"):
+        if fields[name]:
+            fields[name] = datetime.fromisoformat(fields[name])
+    return models.ImportJob(**fields)
+
+
+def live_job_ids() -> List[str]:
+    """Jobs that have a state file."""
+    return [path.stem for path in JOB_DIR.glob("*.json")]
+
+
+def remove_state(job_id: str):
+    try:
+        os.unlink(state_path(job_id))
+    except FileNotFoundError:
+        pass
+
+
+def owner_alive(job_id: str, state: Optional[dict]) -> bool:
+    """Whether the process that queued a job may still finish it."""
+    if state is None:
+        return False
+    if time.time() - state["heartbeat"] > settings.IMPORT_JOB_HEARTBEAT_SECONDS * STALE_HEARTBEATS:
+        return False
+    if state["host"] != HOSTNAME:
+        return True
+    if state["pid"] == os.getpid():
+        # A previous process with the same pid, e.g. after a container restart
+        with _owned_lock:
+            return job_id in _owned
+    try:
+        os.kill(state["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _beat():
+    while not _stopping.wait(settings.IMPORT_JOB_HEARTBEAT_SECONDS):
+        with _owned_lock:
+            owned = list(_owned)
+        for job_id in owned:
+            try:
+                os.utime(state_path(job_id))
+            except FileNotFoundError:
+                pass
+
+
+def _own(job_id: str):
+    global _heartbeat
+    with _owned_lock:
+        _owned.add(job_id)
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_beat, name="import-job-heartbeat", daemon=True)
+            _heartbeat.start()
+
+
+def _disown(job_id: str):
+    with _owned_lock:
+        _owned.discard(job_id)
+
+
+def mark_interrupted(job: models.ImportJob, state: Optional[dict]):
+    """Fail a job whose owner is gone, keeping its last reported progress."""
+    job.status = "failed"
+    job.message = "Interrupted: the server process running it stopped"
+    job.finished_at = datetime.utcnow()
+    if state:
+        job.rows_processed = state["rows_processed"]
+        job.errors = json.dumps(state["errors"], ensure_ascii=False)
+
+
+@contextmanager
+def import_lock():
+    """Held while a job runs, so the jobs of all workers run one at a time."""
+    with open(JOB_DIR / LOCK_FILENAME, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def record_failure(db: Session, job: models.ImportJob):
+    """Add a failed job's row in a transaction of its own, retrying while the write lock is busy."""
+    for attempt in range(1, RECORD_ATTEMPTS + 1):
+        try:
+            begin_write(db)
+            db.merge(job)
+            db.commit()
+            return
+        except OperationalError as e:
+            db.rollback()
+            if attempt == RECORD_ATTEMPTS:
+                raise
+            logger.warning("Could not record import job %s, retrying: %s", job.id, e)
+
+
+# ============ Jobs ============
+
+def submit_import(kind: str, path: str, filename: str, user_id: int) -> models.ImportJob:
+    """Queue the import of the workbook at path as a pending job."""
+    job = models.ImportJob(
+        id=uuid.uuid4().hex,
+        kind=kind,
+        filename=filename,
+        status="pending",
+        created_by=user_id,
+        created_at=datetime.utcnow()
+    )
+    JOB_DIR.mkdir(parents=True, exist_ok=True)
+    write_state(job)
+    _own(job.id)
+
+    # The job runs on a copy, so the one returned stays as queued
+    running = models.ImportJob(**{name: getattr(job, name) for name in JOB_FIELDS})
+    with _queued_lock:
+        _queued[job.id] = (_executor.submit(run_job, running, path), path)
+    return job
+
+
+def run_job(job: models.ImportJob, path: str):
+    """Run a queued import job, committing its row with the rows it imported."""
+    job_id = job.id
+    db = SessionLocal()
+    live = {"imported": 0, "errors": []}
+    recorded = False
+    try:
+        with import_lock():
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            write_state(job)
+
+            def report(imported: int, errors: List[str]):
+                live.update(imported=imported, errors=errors)
+                write_state(job, imported, errors)
+
+            try:
+                result = IMPORTERS[job.kind](db, importer.iter_sheet_rows(path), progress=report, commit=False)
+                job.status = "succeeded"
+                job.rows_processed = len(result["details"]) + len(result["errors"])
+                job.imported = len(result["details"])
+                job.details = json.dumps(result["details"], ensure_ascii=False)
+                job.errors = json.dumps(result["errors"], ensure_ascii=False)
+                job.finished_at = datetime.utcnow()
+                db.add(job)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.warning("Import job %s failed: %s", job_id, e)
+                job.status = "failed"
+                job.message = str(e)
+                job.rows_processed = live["imported"] + len(live["errors"])
+                job.imported = 0
+                job.details = None
+                job.errors = json.dumps(live["errors"], ensure_ascii=False)
+                job.finished_at = datetime.utcnow()
+                record_failure(db, job)
+            recorded = True
+    except Exception:
+        # Nothing was imported; without its owner the job reads as interrupted
+        logger.exception("Could not record import job %s", job_id)
+    finally:
+        _disown(job_id)
+        with _queued_lock:
+            _queued.pop(job_id, None)
+        # Only once the row is committed, so polls never lose the job
+        if recorded:
+            remove_state(job_id)
+        os.unlink(path)
+        db.close()
+
+
+def get_job_status(db: Session, job_id: str) -> Optional[dict]:
+    """Return a job's state: its row once finished, its live state until then."""
+    job = db.get(models.ImportJob, job_id)
+    live = None
+    if job is None or job.status in UNFINISHED:
+        live = read_state(job_id)
+        if job is None and live is None:
+            # Finished since the row was looked for; read it in a new snapshot
+            db.rollback()
+            job = db.get(models.ImportJob, job_id)
+            if job is None:
+                return None
+        elif not owner_alive(job_id, live):
+            # Recorded by recover_interrupted_jobs, which may wait for the write lock
+            if job is None:
+                job = state_job(live)
+            else:
+                db.expunge(job)
+            mark_interrupted(job, live)
+            live = None
+        elif job is None:
+            job = state_job(live)
+
+    if live:
+        rows_processed = live["rows_processed"]
+        imported = live["imported"]
+        errors = live["errors"]
+    else:
+        rows_processed = job.rows_processed or 0
+        imported = job.imported or 0
+        errors = json.loads(job.errors) if job.errors else []
+
+    rows_per_second = None
+    if job.started_at:
+        elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+        if elapsed > 0:
+            rows_per_second = rows_processed / elapsed
+
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "filename": job.filename,
+        "status": job.status,
+        "rows_processed": rows_processed,
+        "imported": imported,
+        "rows_per_second": rows_per_second,
+        "error_count": len(errors),
+        "errors": errors or None,
+        "details": json.loads(job.details) if job.details else None,
+        "message": job.message,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def recover_interrupted_jobs():
+    """Record unfinished jobs whose owning process is gone as failed, keeping their last progress."""
+    db = SessionLocal()
+    try:
+        begin_write(db)
+        recovered = []
+        # Rows left unfinished by versions that wrote them before the import
+        for job in db.query(models.ImportJob).filter(models.ImportJob.status.in_(UNFINISHED)):
+            state = read_state(job.id)
+            if owner_alive(job.id, state):
+                continue
+            mark_interrupted(job, state)
+            recovered.append(job.id)
+        for job_id in live_job_ids() if JOB_DIR.is_dir() else []:
+            state = read_state(job_id)
+            if state is None or owner_alive(job_id, state) or job_id in recovered:
+                continue
+            if db.get(models.ImportJob, job_id) is None:
+                job = state_job(state)
+                mark_interrupted(job, state)
+                db.add(job)
+            recovered.append(job_id)
+        db.commit()
+        for job_id in recovered:
+            remove_state(job_id)
+    except OperationalError as e:
+        # Another worker's import holds the write lock; the next start retries
+        logger.warning("Could not recover interrupted import jobs: %s", e)
+        db.rollback()
+    finally:
+        db.close()
+
+
+def shutdown():
+    """Stop accepting jobs and drop any that have not started yet, with their workbooks."""
+    _stopping.set()
+    _executor.shutdown(wait=False, cancel_futures=True)
+    with _queued_lock:
+        cancelled = [(job_id, path) for job_id, (future, path) in _queued.items() if future.cancelled()]
+    for job_id, path in cancelled:
+        # Without its owner the job reads as interrupted at once
+        _disown(job_id)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
@@ -1,12 +1,16 @@
 # FastAPI main application
-from pathlib import Path
+import asyncio
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import OperationalError
 
+from app import jobs, media_gc, thumbnails, video_meta
+from app.config import settings
+from app.auth import shutdown_password_hashing
 from app.database import init_db
-from app.routers import auth, communities, properties, stats, upload, import_export
+from app.routers import auth, communities, properties, stats, upload, import_export, search, schools
 
 app = FastAPI(
     title="Housing Finder API",
@@ -21,13 +25,45 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Content-Range", "Accept-Ranges"],
 )
 
 
+# Seconds a client is asked to wait when the database stays locked
+BUSY_RETRY_AFTER = 5
+
+
+@app.exception_handler(OperationalError)
+async def database_busy_handler(request: Request, exc: OperationalError):
+    """Answer 503 when a write waited busy_timeout for the lock, e.g. behind an import."""
+    if "database is locked" not in str(exc.orig):
+        raise exc
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database is busy, please retry"},
+        headers={"Retry-After": str(BUSY_RETRY_AFTER)},
+    )
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup."""
     init_db()
+    jobs.recover_interrupted_jobs()
+    import_export.warm_template_cache()
+    if settings.MEDIA_GC_INTERVAL_HOURS > 0:
+        app.state.media_gc = asyncio.create_task(media_gc.run_periodically(upload.UPLOAD_DIR))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the background worker pools."""
+    if getattr(app.state, "media_gc", None) is not None:
+        app.state.media_gc.cancel()
+    jobs.shutdown()
+    shutdown_password_hashing()
+    thumbnails.shutdown()
+    video_meta.shutdown()
 
 
 @app.get("/health")
@@ -53,8 +89,5 @@ app.include_router(properties.router, prefix="/api")
 app.include_router(stats.router, prefix="/api")
 app.include_router(upload.router, prefix="/api")
 app.include_router(import_export.router, prefix="/api")
-
-# Serve uploaded files
-uploads_dir = Path("uploads")
-uploads_dir.mkdir(exist_ok=True)
-app.mount("/api/upload/files", StaticFiles(directory="uploads"), name="uploads")
+app.include_router(search.router, prefix="/api")
+app.include_router(schools.router, prefix="/api")
@@ -0,0 +1,291 @@
+# Orphaned media collection
+#
+# Deleting a community or property leaves the files named in its photos and
+# videos columns behind, and uploads that were never attached to anything
+# pile up too. collect() finds stored files no column refers to and that
+# are older than MEDIA_GC_GRACE_HOURS (so a file uploaded for a form that
+# has not been saved yet is left alone), and deletes them with their
+# thumbnails, poster and sidecar, or moves them to UPLOAD_DIR/.quarantine.
+# Temp files of uploads and derived files that a killed worker left behind,
+# and derived files whose source is gone, are deleted once older than the
+# grace period too.
+#
+# The reference set is read once per run, selecting only the media columns.
+# Files are then handled in batches of MEDIA_GC_BATCH_SIZE, each in one
+# transaction holding the write lock, in which every file to go is
+# re-checked by name just before it is unlinked: against rows written since
+# the set was read (updated_at is indexed on both tables), and for an upload
+# of the same content, which touches the file (see media_store.store_file).
+# A new reference or upload either wins or comes after the file is gone.
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from app import media_store, models, thumbnails, upload_stream, video_meta
+from app.config import settings
+from app.database import SessionLocal, begin_write
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_DIRNAME = ".quarantine"
+
+LOCK_FILENAME = ".gc.lock"
+
+# Rows written this long before the reference set was read are re-checked
+REFERENCE_OVERLAP = timedelta(seconds=5)
+
+MEDIA_TABLES = (models.Community.__table__.c, models.Property.__table__.c)
+
+# Files being written under a temp name, renamed into place when complete
+TEMP_PREFIXES = (upload_stream.TEMP_PREFIX, thumbnails.TEMP_PREFIX) + video_meta.TEMP_PREFIXES
+
+
+def live_references(db: Session) -> Set[str]:
+    """Every filename named by a photos/videos column."""
+    referenced = set()
+    for table in MEDIA_TABLES:
+        query = select(table.photos, table.videos).where(or_(table.photos != "", table.videos != ""))
+        for row in db.execute(query.execution_options(yield_per=1000)):
+            for value in row:
+                referenced.update(media_store.media_filenames(value))
+    return referenced
+
+
+def referenced_since(db: Session, filename: str, since: datetime) -> bool:
+    """Whether a row written since the given time names filename."""
+    for table in MEDIA_TABLES:
+        query = select(table.photos, table.videos).where(
+            table.updated_at >= since,
+            or_(func.instr(table.photos, filename) > 0, func.instr(table.videos, filename) > 0),
+        )
+        for row in db.execute(query):
+            if any(filename in media_store.media_filenames(value) for value in row):
+                return True
+    return False
+
+
+def stored_names(upload_dir: Path) -> Dict[str, List[str]]:
+    """
+    Media files by the stem of their source: the uploaded original (if it
+    is still there) and the files generated from it. Dotfiles are not media.
+    """
+    by_stem = defaultdict(list)
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False) and not entry.name.startswith("."):
+                by_stem[media_store.source_stem(entry.name)].append(entry.name)
+    return by_stem
+
+
+def stored_files(by_stem: Dict[str, List[str]], upload_dir: Path) -> Iterator[Path]:
+    """Uploaded originals; derived files go with their source."""
+    for names in by_stem.values():
+        for name in names:
+            if not media_store.is_derived_name(name):
+                yield upload_dir / name
+
+
+def orphaned_derivatives(by_stem: Dict[str, List[str]], upload_dir: Path) -> List[Path]:
+    """Derived files whose source is gone, e.g. left behind by older versions."""
+    return [
+        upload_dir / name
+        for names in by_stem.values()
+        if all(media_store.is_derived_name(name) for name in names)
+        for name in names
+    ]
+
+
+def temp_files(upload_dir: Path) -> List[Path]:
+    """Temp files of uploads and derived files, finished or abandoned."""
+    with os.scandir(upload_dir) as entries:
+        return [
+            upload_dir / entry.name for entry in entries
+            if entry.name.startswith(TEMP_PREFIXES) and entry.is_file(follow_symlinks=False)
+        ]
+
+
+def _batches(paths: Iterator[Path], size: int) -> Iterator[List[Path]]:
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _existing(paths: List[Path]) -> List[Path]:
+    return [path for path in paths if path.exists()]
+
+
+def _older(path: Path, cutoff: float) -> bool:
+    try:
+        return path.stat().st_mtime < cutoff
+    except FileNotFoundError:
+        return False
+
+
+def _bytes(paths: List[Path]) -> int:
+    total = 0
+    for path in paths:
+        try:
+            total += path.stat().st_size
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def _quarantine(paths: List[Path], directory: Path):
+    directory.mkdir(parents=True, exist_ok=True)
+    for path in paths:
+        os.replace(path, directory / path.name)
+
+
+def purge_quarantine(upload_dir: Path, dry_run: bool = False) -> int:
+    """Remove quarantine folders older than MEDIA_GC_QUARANTINE_DAYS; return the bytes freed."""
+    root = upload_dir / QUARANTINE_DIRNAME
+    if not root.exists():
+        return 0
+    cutoff = time.time() - settings.MEDIA_GC_QUARANTINE_DAYS * 86400
+    freed = 0
+    for folder in root.iterdir():
+        if folder.is_dir() and folder.stat().st_mtime < cutoff:
+            freed += _bytes(list(folder.iterdir()))
+            if not dry_run:
+                shutil.rmtree(folder, ignore_errors=True)
+    return freed
+
+
+def collect(
+    db: Session,
+    upload_dir: Path,
+    grace_hours: Optional[float] = None,
+    batch_size: Optional[int] = None,
+    quarantine: Optional[bool] = None,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Delete or quarantine unreferenced files older than the grace period.
+
+    Returns counts and the bytes reclaimed (or that would be, with dry_run);
+    quarantined files only count once their quarantine is purged. Abandoned
+    temp files and derived files without a source are deleted, never
+    quarantined.
+    """
+    grace_hours = settings.MEDIA_GC_GRACE_HOURS if grace_hours is None else grace_hours
+    batch_size = batch_size or settings.MEDIA_GC_BATCH_SIZE
+    quarantine = settings.MEDIA_GC_QUARANTINE if quarantine is None else quarantine
+    cutoff = time.time() - grace_hours * 3600
+    quarantine_dir = upload_dir / QUARANTINE_DIRNAME / datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    report = {
+        "scanned": 0, "collected": 0, "quarantined": 0, "temp_files": 0, "derived_files": 0,
+        "reclaimed_bytes": 0, "dry_run": dry_run
+    }
+    since = datetime.utcnow() - REFERENCE_OVERLAP
+    referenced = live_references(db)
+    db.rollback()
+    by_stem = stored_names(upload_dir)
+
+    def with_derived(path: Path) -> List[Path]:
+        return [path] + media_store.derived_files(path, by_stem[path.stem])
+
+    for batch in _batches(stored_files(by_stem, upload_dir), batch_size):
+        report["scanned"] += len(batch)
+        candidates = [path for path in batch if path.name not in referenced and _older(path, cutoff)]
+        if dry_run:
+            for path in candidates:
+                report["collected"] += 1
+                report["reclaimed_bytes"] += _bytes(with_derived(path))
+                logger.info("Would collect %s", path.name)
+            continue
+        if not candidates:
+            continue
+
+        begin_write(db)
+        for path in candidates:
+            # Re-uploaded (the upload touched it) or referenced again since the scan
+            if not _older(path, cutoff) or referenced_since(db, path.name, since):
+                continue
+            db.query(models.MediaFile).filter(models.MediaFile.filename == path.name).delete(
+                synchronize_session=False
+            )
+            # Thumbnails generated since the scan are named by derived_paths
+            files = _existing(list(dict.fromkeys(with_derived(path) + media_store.derived_paths(path))))
+            if quarantine:
+                _quarantine(files, quarantine_dir)
+                report["quarantined"] += 1
+            else:
+                report["reclaimed_bytes"] += _bytes(files)
+                for file in files:
+                    file.unlink(missing_ok=True)
+            report["collected"] += 1
+        db.commit()
+
+    # Listed again, as the batches removed derived files with their source
+    orphans = [path for path in orphaned_derivatives(stored_names(upload_dir), upload_dir) if _older(path, cutoff)]
+    report["derived_files"] = len(orphans)
+    report["reclaimed_bytes"] += _bytes(orphans)
+    for path in orphans:
+        if dry_run:
+            logger.info("Would remove %s, whose source is gone", path.name)
+        else:
+            path.unlink(missing_ok=True)
+
+    # A temp file still being written has a fresh mtime
+    abandoned = [path for path in temp_files(upload_dir) if _older(path, cutoff)]
+    report["temp_files"] = len(abandoned)
+    report["reclaimed_bytes"] += _bytes(abandoned)
+    for path in abandoned:
+        if dry_run:
+            logger.info("Would remove temp file %s", path.name)
+        else:
+            path.unlink(missing_ok=True)
+
+    report["reclaimed_bytes"] += purge_quarantine(upload_dir, dry_run)
+    return report
+
+
+# ============ Background Task ============
+
+def collect_exclusive(upload_dir: Path) -> Optional[dict]:
+    """Run collect() unless another worker process is already running it."""
+    upload_dir.mkdir(exist_ok=True)
+    with open(upload_dir / LOCK_FILENAME, "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        db = SessionLocal()
+        try:
+            return collect(db, upload_dir)
+        finally:
+            db.close()
+
+
+async def run_periodically(upload_dir: Path):
+    """Collect orphaned media every MEDIA_GC_INTERVAL_HOURS, for the life of the app."""
+    while True:
+        await asyncio.sleep(settings.MEDIA_GC_INTERVAL_HOURS * 3600)
+        try:
+            report = await run_in_threadpool(collect_exclusive, upload_dir)
+        except Exception:
+            logger.exception("Media garbage collection failed")
+            continue
+        if report is not None:
+            logger.info(
+                "Media GC: %d scanned, %d collected, %d temp files removed, %d bytes reclaimed",
+                report["scanned"], report["collected"], report["temp_files"], report["reclaimed_bytes"],
+            )
@@ -0,0 +1,194 @@
+# Serving stored media
+#
+# MediaResponse sends a file with strong ETags, Last-Modified, conditional
+# requests (304) and single byte ranges (206), so video players can seek
+# without downloading from the start. Content-addressed names never change
+# their bytes and are cached by browsers for a year; other names revalidate.
+#
+# The body goes out through the ASGI zero-copy extension (sendfile) when the
+# server offers it, otherwise in pread() blocks off the event loop. With
+# MEDIA_X_ACCEL_REDIRECT the body is left to nginx altogether: the response
+# only names the file and nginx serves it from an internal location.
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app import media_store
+from app.config import settings
+from app.http_cache import etag_matches
+
+READ_BLOCK_SIZE = 256 * 1024
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Thumbnails and posters are regenerated when missing, so keep them for a day
+DERIVED_CACHE_CONTROL = "public, max-age=86400"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def cache_control(filename: str) -> str:
+    if media_store.is_content_addressed(filename):
+        return IMMUTABLE_CACHE_CONTROL
+    if media_store.is_derived_name(filename):
+        return DERIVED_CACHE_CONTROL
+    return REVALIDATE_CACHE_CONTROL
+
+
+def strong_etag(filename: str, stat: os.stat_result) -> str:
+    """The content hash for content-addressed names, otherwise inode, size and mtime."""
+    if media_store.is_content_addressed(filename):
+        return f'"{Path(filename).stem}"'
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(value: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    The (start, end) inclusive byte span of a single-range Range header.
+
+    Returns None when the header is absent, malformed or asks for several
+    ranges, in which case the whole file is sent. Raises ValueError when
+    the range lies outside the file.
+    """
+    match = RANGE_PATTERN.match(value.strip()) if value else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+class MediaResponse(Response):
+    """A stored media file, honouring conditional and range requests."""
+
+    def __init__(self, path: Path, stat: Optional[os.stat_result] = None, media_type: Optional[str] = None):
+        self.path = path
+        self.stat = stat or os.stat(path)
+        self.status_code = 200
+        self.background = None
+        self.media_type = media_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        self.init_headers({
+            "content-type": self.media_type,
+            "accept-ranges": "bytes",
+            "etag": strong_etag(path.name, self.stat),
+            "last-modified": formatdate(self.stat.st_mtime, usegmt=True),
+            "cache-control": cache_control(path.name),
+        })
+
+    def _not_modified(self, request_headers: Headers) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return etag_matches(if_none_match, self.headers["etag"])
+        return self._unchanged_since(request_headers.get("if-modified-since"))
+
+    def _unchanged_since(self, http_date: Optional[str]) -> bool:
+        if not http_date:
+            return False
+        try:
+            since = parsedate_to_datetime(http_date).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(self.stat.st_mtime) <= since
+
+    def _range_applies(self, request_headers: Headers) -> bool:
+        """If-Range: only send a part of the file the client already has the rest of."""
+        if_range = request_headers.get("if-range")
+        if if_range is None:
+            return True
+        if if_range.startswith('"'):
+            # Strong comparison
+            return if_range == self.headers["etag"]
+        return self._unchanged_since(if_range)
+
+    def _select(self, request_headers: Headers) -> Optional[Tuple[int, int]]:
+        """Set status and length headers for the request; return the byte span to send."""
+        size = self.stat.st_size
+        if self._not_modified(request_headers):
+            self.status_code = 304
+            del self.headers["content-type"]
+            return None
+
+        span = (0, size - 1)
+        if self._range_applies(request_headers):
+            try:
+                requested = parse_range(request_headers.get("range"), size)
+            except ValueError:
+                self.status_code = 416
+                self.headers["content-range"] = f"bytes */{size}"
+                self.headers["content-length"] = "0"
+                return None
+            if requested is not None:
+                span = requested
+                self.status_code = 206
+                self.headers["content-range"] = f"bytes {span[0]}-{span[1]}/{size}"
+
+        self.headers["content-length"] = str(span[1] - span[0] + 1)
+        return span if size else None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request_headers = Headers(scope=scope)
+        span = self._select(request_headers)
+        send_body = span is not None and scope["method"] != "HEAD"
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not send_body:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        start, end = span
+        fd = await run_in_threadpool(os.open, self.path, os.O_RDONLY)
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": fd,
+                    "offset": start,
+                    "count": end - start + 1,
+                })
+                return
+            offset = start
+            while offset <= end:
+                block = await run_in_threadpool(os.pread, fd, min(READ_BLOCK_SIZE, end - offset + 1), offset)
+                if not block:
+                    # The file shrank under us; the content length can no longer be met
+                    raise RuntimeError(f"{self.path.name} was truncated while being sent")
+                offset += len(block)
+                await send({"type": "http.response.body", "body": block, "more_body": offset <= end})
+        finally:
+            os.close(fd)
+
+
+def accel_redirect_response(path: Path) -> Response:
+    """Hand the transfer of path to nginx, which also handles ranges and conditionals."""
+    return Response(
+        headers={
+            "X-Accel-Redirect": f"{settings.MEDIA_X_ACCEL_PREFIX.rstrip('/')}/{path.name}",
+            "Cache-Control": cache_control(path.name),
+        },
+        media_type=mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+    )
+
+
+def media_response(path: Path) -> Response:
+    if settings.MEDIA_X_ACCEL_REDIRECT:
+        return accel_redirect_response(path)
+    return MediaResponse(path)
@@ -0,0 +1,235 @@
+# Content-addressed media storage
+#
+# Uploads are stored as <sha256>.<ext>, so the same file uploaded twice is
+# stored once and a URL always names the same bytes. media_files counts the
+# uploads of each stored file; delete_file releases one and the file is
+# only unlinked when none remain. Names without a row (files from before
+# this scheme, see migrate_media.py) are treated as having one reference.
+#
+# The row is written before the file is moved into place and removed
+# before the file is unlinked, each inside one database transaction, so
+# with SQLite's single writer an upload and a delete of the same content
+# cannot interleave into a row without a file.
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models, thumbnails, video_meta
+from app.database import begin_write
+from app.upload_stream import FILE_MODE
+
+MEDIA_URL_PREFIX = "/api/upload/files/"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+HASHED_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}\.[0-9a-z]+$")
+
+# Equivalent extensions map to one name, so identical bytes get one file
+EXTENSION_ALIASES = {".jpeg": ".jpg"}
+
+# Columns holding JSON lists of media URLs
+MEDIA_COLUMNS = (
+    (models.Community, "photos"),
+    (models.Community, "videos"),
+    (models.Property, "photos"),
+    (models.Property, "videos"),
+)
+
+
+def content_name(sha256: str, original_filename: str) -> str:
+    ext = Path(original_filename).suffix.lower()
+    return f"{sha256}{EXTENSION_ALIASES.get(ext, ext)}"
+
+
+def is_content_addressed(filename: str) -> bool:
+    return bool(HASHED_NAME_PATTERN.match(filename))
+
+
+def is_derived_name(filename: str) -> bool:
+    """
+    Whether a file in the store was generated from another one.
+
+    Stored names never have a dot in their stem, while thumbnails
+    (<stem>.w320.jpg), posters and metadata sidecars always do.
+    """
+    return "." in Path(filename).stem
+
+
+def derived_paths(path: Path) -> List[Path]:
+    """Files generated from an upload: thumbnails, poster, metadata sidecar."""
+    return thumbnails.derivative_paths(path) + video_meta.derivative_paths(path)
+
+
+def source_stem(filename: str) -> str:
+    """Stem of the stored file a file in the store is, or was generated from."""
+    return filename.split(".", 1)[0]
+
+
+def derived_files(path: Path, names: Optional[Iterable[str]] = None) -> List[Path]:
+    """
+    Existing files generated from path, including <stem>.* leftovers that
+    derived_paths does not name, such as thumbnails of thumbnails. names are
+    the files in its directory if already listed. While another stored file
+    shares the stem, only derived_paths are considered, as the rest may be
+    generated from that file.
+    """
+    if names is None:
+        with os.scandir(path.parent) as entries:
+            names = [entry.name for entry in entries]
+    siblings = [name for name in names if source_stem(name) == path.stem and name != path.name]
+    if not all(is_derived_name(name) for name in siblings):
+        return [derived for derived in derived_paths(path) if derived.exists()]
+    return [path.parent / name for name in siblings]
+
+
+def hash_file(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+# ============ References ============
+
+def add_reference(db: Session, filename: str, sha256: str, size: int) -> bool:
+    """Count one more upload of filename; return True if it is new. Does not commit."""
+    media = models.MediaFile
+    updated = db.query(media).filter(media.filename == filename).update(
+        {media.refcount: media.refcount + 1}, synchronize_session=False
+    )
+    if updated:
+        return False
+    try:
+        with db.begin_nested():
+            db.add(media(filename=filename, sha256=sha256, size=size, refcount=1, created_at=datetime.utcnow()))
+        return True
+    except IntegrityError:
+        # Inserted concurrently by another worker
+        db.query(media).filter(media.filename == filename).update(
+            {media.refcount: media.refcount + 1}, synchronize_session=False
+        )
+        return False
+
+
+def release_reference(db: Session, filename: str) -> int:
+    """Drop one reference to filename and return how many remain. Does not commit."""
+    media = models.MediaFile
+    row = db.get(media, filename)
+    if row is None:
+        return 0
+    if row.refcount > 1:
+        db.query(media).filter(media.filename == filename).update(
+            {media.refcount: media.refcount - 1}, synchronize_session=False
+        )
+        return row.refcount - 1
+    db.delete(row)
+    db.flush()
+    return 0
+
+
+# ============ Store and Delete ============
+
+def store_file(db: Session, temp_path: Path, directory: Path, sha256: str, size: int, original_filename: str) -> Tuple[str, bool]:
+    """
+    Move a received temp file into the store under its content name.
+
+    Returns (filename, created); created is False when identical content
+    was already stored, in which case the temp file is simply dropped.
+    """
+    filename = content_name(sha256, original_filename)
+    try:
+        begin_write(db)
+        created = add_reference(db, filename, sha256, size)
+        destination = directory / filename
+        if created or not destination.exists():
+            os.chmod(temp_path, FILE_MODE)
+            os.replace(temp_path, destination)
+        else:
+            os.unlink(temp_path)
+            # Restart the garbage collector's grace period (see media_gc)
+            os.utime(destination)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        if temp_path.exists():
+            os.unlink(temp_path)
+        raise
+    return filename, created
+
+
+def delete_file(db: Session, path: Path) -> bool:
+    """Release one reference to path; unlink it and its derived files on the last. Returns True if unlinked."""
+    try:
+        begin_write(db)
+        if release_reference(db, path.name):
+            db.commit()
+            return False
+        path.unlink(missing_ok=True)
+        for derivative in derived_files(path):
+            derivative.unlink(missing_ok=True)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return True
+
+
+# ============ Media Columns ============
+
+def media_filenames(value: Optional[str]) -> List[str]:
+    """Stored filenames referenced by a photos/videos column value."""
+    if not value:
+        return []
+    try:
+        urls = json.loads(value)
+    except ValueError:
+        urls = re.split(r"[\s,]+", value)
+    if isinstance(urls, str):
+        urls = [urls]
+    if not isinstance(urls, list):
+        return []
+
+    filenames = []
+    for url in urls:
+        if isinstance(url, str) and url.strip():
+            name = url.strip().split("?", 1)[0].rsplit("/", 1)[-1]
+            if name:
+                filenames.append(name)
+    return filenames
+
+
+def _rename_url(url: str, renames: Dict[str, str]) -> str:
+    base, question, query = url.partition("?")
+    head, slash, name = base.rpartition("/")
+    if name not in renames:
+        return url
+    return f"{head}{slash}{renames[name]}{question}{query}"
+
+
+def rewrite_media_urls(value: str, renames: Dict[str, str]) -> str:
+    """Replace renamed filenames in a photos/videos column value."""
+    try:
+        urls = json.loads(value)
+    except ValueError:
+        urls = None
+    if isinstance(urls, list):
+        urls = [_rename_url(url, renames) if isinstance(url, str) else url for url in urls]
+        # Same layout as JSON.stringify in the frontend
+        return json.dumps(urls, ensure_ascii=False, separators=(",", ":"))
+    return re.sub(r"[^\s,]+", lambda match: _rename_url(match.group(0), renames), value)
+
+
+def iter_media_columns(db: Session) -> Iterator[Tuple[object, str, str]]:
+    """(row, column, value) for every non-empty photos/videos column."""
+    for model, column in MEDIA_COLUMNS:
+        attribute = getattr(model, column)
+        for row in db.query(model).filter(attribute.isnot(None), attribute != "").yield_per(500):
+            yield row, column, getattr(row, column)
@@ -0,0 +1,193 @@
+# Metro lines and locations
+#
+# Community.metro is free text ("地铁9号线, 商场", "1/9/11号线 徐家汇站").
+# parse_metro() pulls the line and station names out of it, and
+# community_metro stores one row per community and token, indexed by
+# token, so "communities on line 9" is an index lookup. Rows are rewritten
+# whenever a community's metro column is written: by crud, the importer
+# and the migration backfill.
+#
+# Communities may also carry latitude/longitude. community_locations is an
+# R-tree over them, kept in sync by triggers, so "within N metres of a
+# point" (say, a station) narrows to a bounding box through the index and
+# only checks the distance of the communities inside it.
+import math
+import re
+import unicodedata
+from itertools import islice
+from typing import Iterable, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app import models
+
+# Lines known by name rather than number
+NAMED_LINES = ("浦江线", "金山线", "磁浮线", "机场联络线")
+
+# "9号线", "1、9、11号线", "1/9号线"
+NUMBERED_LINES = re.compile(r"((?:\d+\s*[、,/和及]\s*)*\d+)\s*号线")
+NAMED_LINE_PATTERN = re.compile("|".join(NAMED_LINES))
+
+TOKEN_SEPARATORS = re.compile(r"[\s,、/;|()（）]+")
+
+# Communities relinked per statement, well within SQLite's variable limit
+LINK_BATCH_SIZE = 500
+
+# Metres per degree of latitude, and of longitude at the equator
+METRES_PER_DEGREE_LAT = 110574.0
+METRES_PER_DEGREE_LON = 111320.0
+
+
+def _normalise(value: str) -> str:
+    # Full-width digits and punctuation (９号线，) as their ASCII forms
+    return unicodedata.normalize("NFKC", value)
+
+
+def parse_metro(value: Optional[str]) -> Set[Tuple[str, str]]:
+    """("line", "9号线") and ("station", "徐家汇") tokens of a metro value."""
+    if not value:
+        return set()
+    value = _normalise(value)
+    tokens = set()
+
+    for match in NUMBERED_LINES.finditer(value):
+        for number in re.findall(r"\d+", match.group(1)):
+            tokens.add(("line", f"{int(number)}号线"))
+    for match in NAMED_LINE_PATTERN.finditer(value):
+        tokens.add(("line", match.group(0)))
+
+    rest = NAMED_LINE_PATTERN.sub(" ", NUMBERED_LINES.sub(" ", value))
+    for word in TOKEN_SEPARATORS.split(rest):
+        word = word.removeprefix("地铁").strip()
+        if len(word) > 1 and word.endswith("站"):
+            tokens.add(("station", word[:-1]))
+    return tokens
+
+
+def normalise_line(value: str) -> Optional[str]:
+    """The line a metro_line= value names: "9", "9号线" and "地铁9号线" are all 9号线."""
+    value = _normalise(value).strip()
+    if value.isdigit():
+        return f"{int(value)}号线"
+    lines = sorted(token for kind, token in parse_metro(value) if kind == "line")
+    return lines[0] if lines else None
+
+
+# ============ Maintenance ============
+
+def _link_batch(db: Session, communities: list) -> int:
+    tokens = {row.id: parse_metro(row.metro) for row in communities}
+    db.query(models.CommunityMetro).filter(
+        models.CommunityMetro.community_id.in_(list(tokens))
+    ).delete(synchronize_session=False)
+
+    values = [
+        {"community_id": community_id, "kind": kind, "name": name}
+        for community_id, community in tokens.items()
+        for kind, name in community
+    ]
+    if values:
+        db.execute(insert(models.CommunityMetro), values)
+    return len(values)
+
+
+def link_communities(db: Session, communities: Iterable) -> int:
+    """
+    Replace the metro tokens of communities (rows with id and metro).
+    Does not commit; returns the number of tokens.
+    """
+    communities = iter(communities)
+    linked = 0
+    while True:
+        batch = list(islice(communities, LINK_BATCH_SIZE))
+        if not batch:
+            return linked
+        linked += _link_batch(db, batch)
+
+
+def link_community(db: Session, community: models.Community):
+    """Rewrite one community's tokens after its metro column changed. Does not commit."""
+    db.flush()
+    link_communities(db, [community])
+
+
+def backfill(db: Session) -> int:
+    """Rebuild every token from the communities table; returns the number of tokens."""
+    db.query(models.CommunityMetro).delete(synchronize_session=False)
+    rows = db.query(models.Community.id, models.Community.metro).yield_per(LINK_BATCH_SIZE)
+    return link_communities(db, rows)
+
+
+def create_location_index(conn: Connection):
+    """Create the community_locations R-tree and its sync triggers, and fill it."""
+    located = "new.latitude IS NOT NULL AND new.longitude IS NOT NULL"
+    insert_new = (
+        "INSERT INTO community_locations (id, min_lat, max_lat, min_lon, max_lon) "
+        f"SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude WHERE {located};"
+    )
+    delete_old = "DELETE FROM community_locations WHERE id = old.id;"
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS community_locations USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+        f"CREATE TRIGGER IF NOT EXISTS community_locations_ai AFTER INSERT ON communities BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS community_locations_ad AFTER DELETE ON communities BEGIN {delete_old} END",
+        "CREATE TRIGGER IF NOT EXISTS community_locations_au AFTER UPDATE OF latitude, longitude ON communities "
+        f"BEGIN {delete_old} {insert_new} END",
+        "DELETE FROM community_locations",
+        "INSERT INTO community_locations (id, min_lat, max_lat, min_lon, max_lon) "
+        "SELECT id, latitude, latitude, longitude, longitude FROM communities "
+        "WHERE latitude IS NOT NULL AND longitude IS NOT NULL",
+    ]
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+# ============ Lookups ============
+
+def check_location(latitude: Optional[float], longitude: Optional[float]):
+    """Reject a proximity filter with only one coordinate."""
+    if (latitude is None) != (longitude is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Give both lat and lon, or neither"
+        )
+
+
+def community_ids_on_line(line: str):
+    """Subquery of the ids of communities on a metro line (any metro_line= spelling)."""
+    CommunityMetro = models.CommunityMetro
+    return select(CommunityMetro.community_id).where(
+        CommunityMetro.kind == "line", CommunityMetro.name == normalise_line(line)
+    )
+
+
+def community_ids_near(latitude: float, longitude: float, metres: float):
+    """
+    Subquery of the ids of communities within metres of a point.
+
+    The R-tree picks the communities inside the bounding box; their
+    distance is then checked on a local flat projection, accurate to well
+    under a percent at city scale.
+    """
+    lat_scale = METRES_PER_DEGREE_LAT
+    lon_scale = METRES_PER_DEGREE_LON * math.cos(math.radians(latitude))
+    dlat, dlon = metres / lat_scale, metres / lon_scale
+
+    box = (
+        select(text("community_locations.id"))
+        .select_from(text("community_locations"))
+        .where(text(
+            "community_locations.min_lat <= :near_lat_max AND community_locations.max_lat >= :near_lat_min "
+            "AND community_locations.min_lon <= :near_lon_max AND community_locations.max_lon >= :near_lon_min"
+        ).bindparams(
+            near_lat_min=latitude - dlat, near_lat_max=latitude + dlat,
+            near_lon_min=longitude - dlon, near_lon_max=longitude + dlon,
+        ))
+    )
+    Community = models.Community
+    dy = (Community.latitude - latitude) * lat_scale
+    dx = (Community.longitude - longitude) * lon_scale
+    return select(Community.id).where(and_(Community.id.in_(box), dy * dy + dx * dx <= metres * metres))
@@ -0,0 +1,172 @@
+# Schema migrations
+#
+# Each migration runs once, in version order, inside its own transaction,
+# and is recorded in the schema_migrations table.
+#
+# Migration 1 creates the tables from the current models, so a fresh
+# database already has everything later migrations add. Later migrations
+# must therefore be idempotent (CREATE ... IF NOT EXISTS, column checks).
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import WRITE_TRANSACTION, Base
+
+
+def create_tables(conn: Connection):
+    """Create any missing tables from the models."""
+    from app import models  # noqa: F401  (registers models with Base)
+    Base.metadata.create_all(bind=conn)
+
+
+def add_filter_indexes(conn: Connection):
+    """Index the columns used by the community and property list filters."""
+    statements = [
+        "CREATE INDEX IF NOT EXISTS ix_communities_district ON communities (district)",
+        "CREATE INDEX IF NOT EXISTS ix_properties_community_id_price ON properties (community_id, price)",
+        "CREATE INDEX IF NOT EXISTS ix_properties_price ON properties (price)",
+        "CREATE INDEX IF NOT EXISTS ix_properties_area ON properties (area)",
+        "CREATE INDEX IF NOT EXISTS ix_properties_rent_ratio ON properties (rent_ratio)",
+        "CREATE INDEX IF NOT EXISTS ix_properties_visit_date ON properties (visit_date)",
+    ]
+    for statement in statements:
+        conn.execute(text(statement))
+    # Refresh planner statistics for the new indexes
+    conn.execute(text("ANALYZE"))
+
+
+def add_sort_indexes(conn: Connection):
+    """Index the remaining keyset pagination sort keys."""
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_properties_price_per_sqm ON properties (price_per_sqm)"
+    ))
+
+
+def add_district_stats(conn: Connection):
+    """Create the district_stats summary table and fill it from existing rows."""
+    from app import models, stats_store
+
+    models.DistrictStats.__table__.create(bind=conn, checkfirst=True)
+    db = Session(bind=conn)
+    stats_store.rebuild(db)
+    db.close()
+
+
+def add_data_version(conn: Connection):
+    """Create the single-row data_version counter used by the response cache."""
+    from app import models
+
+    models.DataVersion.__table__.create(bind=conn, checkfirst=True)
+    conn.execute(text("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)"))
+
+
+def add_media_files(conn: Connection):
+    """Create the media_files reference count table."""
+    from app import models
+
+    models.MediaFile.__table__.create(bind=conn, checkfirst=True)
+
+
+def add_search_index(conn: Connection):
+    """Create the FTS5 search indexes and their sync triggers."""
+    from app import search
+
+    for kind in search.SEARCH_KINDS:
+        search.create_index(conn, kind)
+
+
+def add_schools(conn: Connection):
+    """Create the school dimension and link existing communities to it."""
+    from app import models, schools
+
+    models.School.__table__.create(bind=conn, checkfirst=True)
+    models.CommunitySchool.__table__.create(bind=conn, checkfirst=True)
+    db = Session(bind=conn)
+    schools.backfill(db)
+    db.flush()
+    db.close()
+
+
+def add_metro_index(conn: Connection):
+    """Parse metro lines/stations into community_metro and index community locations."""
+    from app import metro, models
+
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(communities)"))}
+    for column in ("latitude", "longitude"):
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE communities ADD COLUMN {column} FLOAT"))
+
+    models.CommunityMetro.__table__.create(bind=conn, checkfirst=True)
+    db = Session(bind=conn)
+    metro.backfill(db)
+    db.flush()
+    db.close()
+    metro.create_location_index(conn)
+
+
+def add_updated_at_index(conn: Connection):
+    """Index properties.updated_at, which the analytics snapshot refreshes from."""
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_properties_updated_at ON properties (updated_at)"
+    ))
+
+
+def add_community_updated_at_index(conn: Connection):
+    """Index communities.updated_at, which media GC re-checks new references from."""
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_communities_updated_at ON communities (updated_at)"
+    ))
+
+
+# (version, name, upgrade)
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "create_tables", create_tables),
+    (2, "add_filter_indexes", add_filter_indexes),
+    (3, "add_sort_indexes", add_sort_indexes),
+    (4, "add_district_stats", add_district_stats),
+    (5, "add_data_version", add_data_version),
+    (6, "add_media_files", add_media_files),
+    (7, "add_search_index", add_search_index),
+    (8, "add_schools", add_schools),
+    (9, "add_metro_index", add_metro_index),
+    (10, "add_updated_at_index", add_updated_at_index),
+    (11, "add_community_updated_at_index", add_community_updated_at_index),
+]
+
+
+def applied_versions(conn: Connection) -> set:
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(engine: Engine) -> List[str]:
+    """Apply pending migrations and return the names of those applied."""
+    from app.models import SchemaMigration
+
+    # Workers starting together queue for the write lock rather than failing
+    engine = engine.execution_options(**WRITE_TRANSACTION)
+    with engine.begin() as conn:
+        SchemaMigration.__table__.create(bind=conn, checkfirst=True)
+        done = applied_versions(conn)
+
+    applied = []
+    for version, name, upgrade in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                upgrade(conn)
+                conn.execute(
+                    SchemaMigration.__table__.insert().values(
+                        version=version, name=name, applied_at=datetime.utcnow()
+                    )
+                )
+        except IntegrityError:
+            # Another worker process applied it first; migrations are idempotent
+            continue
+        applied.append(name)
+
+    return applied
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -20,7 +20,7 @@ class Community(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(Text, nullable=False)
-    district = Column(Text)
+    district = Column(Text, index=True)
     address = Column(Text)
     property_fee = Column(Text)
     parking = Column(Text)
@@ -32,10 +32,15 @@ class Community(Base):
     photos = Column(Text)
     videos = Column(Text)
     notes = Column(Text)
+    # Optional WGS84 position, indexed by the community_locations R-tree
+    latitude = Column(Float)
+    longitude = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     properties = relationship("Property", back_populates="community", cascade="all, delete-orphan")
+    school_links = relationship("CommunitySchool", cascade="all, delete-orphan")
+    metro_links = relationship("CommunityMetro", cascade="all, delete-orphan")
 
 
 class Property(Base):
@@ -46,21 +51,121 @@ class Property(Base):
     building = Column(Text)
     unit = Column(Text)
     room = Column(Text)
-    area = Column(Float)
+    area = Column(Float, index=True)
     layout = Column(Text)
     floor = Column(Text)
     orientation = Column(Text)
     decoration = Column(Text)
-    price = Column(Float)
-    price_per_sqm = Column(Float)
+    price = Column(Float, index=True)
+    price_per_sqm = Column(Float, index=True)
     rent = Column(Float)
-    rent_ratio = Column(Float)
+    rent_ratio = Column(Float, index=True)
     expected_price = Column(Float)
-    visit_date = Column(DateTime)
+    visit_date = Column(DateTime, index=True)
     photos = Column(Text)
     videos = Column(Text)
     notes = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Indexed for the analytics snapshot's incremental refresh
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     community = relationship("Community", back_populates="properties")
+
+    __table_args__ = (
+        # Covers community_id lookups (filters, district joins, cascades)
+        # as well as price ranges within a community
+        Index("ix_properties_community_id_price", "community_id", "price"),
+    )
+
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    filename = Column(Text)
+    status = Column(String, default="pending", nullable=False)
+    rows_processed = Column(Integer, default=0)
+    imported = Column(Integer, default=0)
+    details = Column(Text)
+    errors = Column(Text)
+    message = Column(Text)
+    created_by = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+
+class DistrictStats(Base):
+    __tablename__ = "district_stats"
+
+    district = Column(Text, primary_key=True)
+    community_count = Column(Integer, default=0, nullable=False)
+    property_count = Column(Integer, default=0, nullable=False)
+    price_sum = Column(Float, default=0, nullable=False)
+    price_count = Column(Integer, default=0, nullable=False)
+    rent_sum = Column(Float, default=0, nullable=False)
+    rent_count = Column(Integer, default=0, nullable=False)
+    rent_ratio_sum = Column(Float, default=0, nullable=False)
+    rent_ratio_count = Column(Integer, default=0, nullable=False)
+
+
+class DataVersion(Base):
+    __tablename__ = "data_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+
+class MediaFile(Base):
+    __tablename__ = "media_files"
+
+    filename = Column(String, primary_key=True)
+    sha256 = Column(String, nullable=False, index=True)
+    size = Column(Integer, nullable=False)
+    refcount = Column(Integer, default=1, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class School(Base):
+    __tablename__ = "schools"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(Text, nullable=False)
+    # Normalised name (see schools.school_key), what lookups match on
+    key = Column(Text, nullable=False, unique=True)
+
+
+class CommunitySchool(Base):
+    __tablename__ = "community_schools"
+
+    community_id = Column(Integer, ForeignKey("communities.id", ondelete="CASCADE"), primary_key=True)
+    school_id = Column(Integer, ForeignKey("schools.id"), primary_key=True)
+    # "primary" or "middle": which column of the community named the school
+    level = Column(String, primary_key=True)
+
+    __table_args__ = (
+        # school -> communities; community -> schools is the primary key
+        Index("ix_community_schools_school_id", "school_id", "community_id"),
+    )
+
+
+class CommunityMetro(Base):
+    __tablename__ = "community_metro"
+
+    community_id = Column(Integer, ForeignKey("communities.id", ondelete="CASCADE"), primary_key=True)
+    # "line" (9号线) or "station" (徐家汇), parsed from Community.metro
+    kind = Column(String, primary_key=True)
+    name = Column(Text, primary_key=True)
+
+    __table_args__ = (
+        Index("ix_community_metro_kind_name", "kind", "name", "community_id"),
+    )
+
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,130 @@
+# Keyset (cursor) pagination
+import base64
+import json
+import math
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from sqlalchemy import DateTime, and_, tuple_
+from sqlalchemy.orm import Query
+
+
+# Range of SQLite INTEGER
+MAX_INTEGER = 2 ** 63 - 1
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _number(value: Any) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return -MAX_INTEGER - 1 <= value <= MAX_INTEGER
+    return isinstance(value, float) and math.isfinite(value)
+
+
+def encode_cursor(sort: str, order: str, value: Any, last_id: int) -> str:
+    """Encode the sort key and id of the last row of a page as an opaque cursor."""
+    if isinstance(value, datetime):
+        value = {"dt": value.isoformat()}
+    payload = json.dumps({"s": sort, "o": order, "v": value, "id": last_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, order: str, sort_column) -> Tuple[Any, int]:
+    """
+    Decode a cursor into (sort value, id), checking it matches the requested
+    sort. The value must be None, a number, or a datetime if the sort column
+    is a DateTime.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        value, last_id = payload["v"], payload["id"]
+        if isinstance(value, dict) and value.keys() == {"dt"} and isinstance(value["dt"], str):
+            value = datetime.fromisoformat(value["dt"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+
+    if payload.get("s") != sort or payload.get("o") != order:
+        raise InvalidCursor("Cursor does not match the requested sort")
+    if not (isinstance(last_id, int) and _number(last_id)):
+        raise InvalidCursor("Malformed cursor")
+    datetime_sort = isinstance(sort_column.type, DateTime)
+    if value is not None and not (isinstance(value, datetime) if datetime_sort else _number(value)):
+        raise InvalidCursor("Malformed cursor")
+    return value, last_id
+
+
+def order_by_key(query: Query, sort_column, id_column, order: str) -> Query:
+    """Order by (sort key, id) so every row has a unique position."""
+    if order == "desc":
+        return query.order_by(sort_column.desc(), id_column.desc())
+    return query.order_by(sort_column.asc(), id_column.asc())
+
+
+def after_key(sort_column, id_column, order: str, value: Any, last_id: int) -> list:
+    """
+    Conditions selecting the rows positioned after (value, last_id).
+
+    SQLite sorts NULLs first in ascending order and last in descending
+    order. Where the remaining rows span both NULL and non-NULL keys they
+    are returned as two conditions, to be read one after the other, since
+    each of them alone can seek straight to its start through the sort
+    column's index while an OR of the two cannot.
+    """
+    if sort_column is id_column:
+        return [id_column > last_id if order == "asc" else id_column < last_id]
+
+    if order == "asc":
+        if value is None:
+            return [and_(sort_column.is_(None), id_column > last_id), sort_column.isnot(None)]
+        return [tuple_(sort_column, id_column) > tuple_(value, last_id)]
+
+    if value is None:
+        return [and_(sort_column.is_(None), id_column < last_id)]
+    return [tuple_(sort_column, id_column) < tuple_(value, last_id), sort_column.is_(None)]
+
+
+def keyset_page(
+    query: Query,
+    sort: str,
+    sort_column,
+    id_column,
+    order: str = "asc",
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100
+) -> list:
+    """
+    Fetch one page ordered by (sort key, id).
+
+    With a cursor the page starts right after it through an index seek, so
+    fetching any page costs the same. Without one, skip is applied as a
+    plain offset.
+    """
+    if not cursor:
+        query = order_by_key(query, sort_column, id_column, order)
+        if skip:
+            query = query.offset(skip)
+        return query.limit(limit).all()
+
+    value, last_id = decode_cursor(cursor, sort, order, sort_column)
+
+    items = []
+    for condition in after_key(sort_column, id_column, order, value, last_id):
+        segment = order_by_key(query.filter(condition), sort_column, id_column, order)
+        items.extend(segment.limit(limit - len(items)).all())
+        if len(items) == limit:
+            break
+    return items
+
+
+def next_cursor(items: list, sort: str, order: str, limit: int) -> Optional[str]:
+    """Cursor for the page after items, or None if items was the last page."""
+    if len(items) < limit:
+        return None
+    last = items[-1]
+    return encode_cursor(sort, order, getattr(last, sort), last.id)
@@ -0,0 +1,114 @@
+# Read-through response cache keyed on a global data version
+#
+# Every write path bumps data_version.version in the same transaction as
+# the write. Cached responses are tagged with the version they were built
+# at, so a write anywhere, in any worker process, invalidates them all.
+# The version is also part of the ETag, which lets unchanged dashboards
+# revalidate with a 304 and no further database work.
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+
+from app import models
+from app.http_cache import etag_matches
+
+# Responses are per-user authenticated, so only the browser may cache them,
+# and it must revalidate every time
+CACHE_CONTROL = "private, no-cache"
+
+# Distinct keys (endpoint + query parameters) kept per process
+MAX_ENTRIES = 256
+
+# {key: (version, body, headers)}
+_entries: "OrderedDict[Hashable, Tuple[int, bytes, Dict[str, str]]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+# ============ Data Version ============
+
+def get_data_version(db: Session) -> int:
+    version = db.query(models.DataVersion.version).filter(models.DataVersion.id == 1).scalar()
+    return version or 0
+
+
+def bump_data_version(db: Session):
+    """Invalidate cached responses; call inside the transaction of a write."""
+    updated = db.query(models.DataVersion).filter(models.DataVersion.id == 1).update(
+        {models.DataVersion.version: models.DataVersion.version + 1},
+        synchronize_session=False
+    )
+    if not updated:
+        db.add(models.DataVersion(id=1, version=1))
+        db.flush()
+
+
+# ============ Cache ============
+
+def make_etag(key: Hashable, version: int) -> str:
+    digest = hashlib.sha1(f"{key!r}:{version}".encode("utf-8")).hexdigest()
+    return f'"{digest}"'
+
+
+def lookup(key: Hashable, version: int) -> Optional[Tuple[bytes, Dict[str, str]]]:
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        _entries.move_to_end(key)
+        return entry[1], entry[2]
+
+
+def store(key: Hashable, version: int, body: bytes, headers: Dict[str, str]):
+    with _lock:
+        _entries[key] = (version, body, headers)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def serialize_page(items: list, headers: Dict[str, str], schema) -> Tuple[list, Dict[str, str]]:
+    """Convert a page of ORM rows into a build() result for cached_response."""
+    return [schema.model_validate(item) for item in items], headers
+
+
+def cached_response(
+    request: Request,
+    db: Session,
+    key: Hashable,
+    build: Callable[[], Tuple[Any, Dict[str, str]]]
+) -> Response:
+    """
+    Serve a JSON response through the cache.
+
+    build returns (payload, extra headers) and only runs on a miss. A
+    request whose If-None-Match carries the current ETag gets a 304.
+    """
+    version = get_data_version(db)
+    etag = make_etag(key, version)
+
+    cached = lookup(key, version)
+    extra_headers = cached[1] if cached else {}
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={**headers, **extra_headers})
+
+    if cached:
+        body = cached[0]
+    else:
+        payload, extra_headers = build()
+        body = json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        store(key, version, body, extra_headers)
+
+    return Response(body, media_type="application/json", headers={**headers, **extra_headers})
@@ -0,0 +1,203 @@
+# Resumable chunked uploads
+#
+# A session is a directory under UPLOAD_DIR/.sessions holding session.json,
+# a data file preallocated to the final size, and one empty marker file per
+# received chunk. Chunk i covers bytes [i * chunk_size, (i + 1) * chunk_size)
+# and is written in place with pwrite, so chunks can arrive in any order or
+# in parallel, from any worker process, and finishing the upload moves
+# the data file into the store rather than copying it. session.json is
+# touched by every chunk, so its mtime is when the session was last used.
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, List, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import settings
+
+SESSIONS_DIRNAME = ".sessions"
+
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def sessions_dir(upload_dir: Path) -> Path:
+    return upload_dir / SESSIONS_DIRNAME
+
+
+def session_path(upload_dir: Path, session_id: str) -> Path:
+    if not SESSION_ID_PATTERN.match(session_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    return sessions_dir(upload_dir) / session_id
+
+
+def chunk_count(session: dict) -> int:
+    return -(-session["size"] // session["chunk_size"])
+
+
+def chunk_span(session: dict, index: int) -> Tuple[int, int]:
+    """(offset, length) of a chunk."""
+    offset = index * session["chunk_size"]
+    return offset, min(session["chunk_size"], session["size"] - offset)
+
+
+# ============ Session Files ============
+
+def create_session(upload_dir: Path, original_name: str, size: int, user_id: int) -> dict:
+    session = {
+        "id": uuid.uuid4().hex,
+        "original_name": original_name,
+        "size": size,
+        "chunk_size": settings.UPLOAD_SESSION_CHUNK_SIZE,
+        "created_by": user_id,
+        "created_at": time.time(),
+    }
+    path = sessions_dir(upload_dir) / session["id"]
+    (path / "chunks").mkdir(parents=True)
+    with open(path / "data", "wb") as data:
+        data.truncate(size)
+    (path / "session.json").write_text(json.dumps(session), encoding="utf-8")
+    return session
+
+
+def load_session(upload_dir: Path, session_id: str, user_id: int) -> dict:
+    """Read a session, which only its creator may use."""
+    try:
+        path = session_path(upload_dir, session_id)
+        session = json.loads((path / "session.json").read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        session = None
+    if session is None or session["created_by"] != user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    return session
+
+
+def received_chunks(upload_dir: Path, session: dict) -> List[int]:
+    names = os.listdir(session_path(upload_dir, session["id"]) / "chunks")
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+def received_ranges(session: dict, chunks: List[int]) -> List[List[int]]:
+    """Merge received chunks into [start, end) byte ranges."""
+    ranges = []
+    for index in chunks:
+        offset, length = chunk_span(session, index)
+        if ranges and ranges[-1][1] == offset:
+            ranges[-1][1] = offset + length
+        else:
+            ranges.append([offset, offset + length])
+    return ranges
+
+
+def session_status(upload_dir: Path, session: dict) -> dict:
+    chunks = received_chunks(upload_dir, session)
+    received = set(chunks)
+    return {
+        "session_id": session["id"],
+        "original_name": session["original_name"],
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "chunk_count": chunk_count(session),
+        "received": received_ranges(session, chunks),
+        "missing": [index for index in range(chunk_count(session)) if index not in received],
+    }
+
+
+def touch_session(upload_dir: Path, session: dict):
+    """Record that a session is in use, restarting its expiry."""
+    try:
+        os.utime(session_path(upload_dir, session["id"]) / "session.json")
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+
+
+def remove_session(upload_dir: Path, session_id: str):
+    shutil.rmtree(session_path(upload_dir, session_id), ignore_errors=True)
+
+
+def expire_sessions(upload_dir: Path) -> int:
+    """Remove sessions unused for UPLOAD_SESSION_TTL_HOURS; return how many."""
+    root = sessions_dir(upload_dir)
+    if not root.exists():
+        return 0
+    cutoff = time.time() - settings.UPLOAD_SESSION_TTL_HOURS * 3600
+    removed = 0
+    for path in root.iterdir():
+        try:
+            expired = (path / "session.json").stat().st_mtime < cutoff
+        except FileNotFoundError:
+            # A session being created, or one half removed
+            expired = path.stat().st_mtime < cutoff
+        if expired:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+# ============ Chunks ============
+
+def _pwrite_all(fd: int, data: bytes, offset: int):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+async def write_chunk(upload_dir: Path, session: dict, index: int, body: AsyncIterator[bytes]):
+    """Stream one chunk into its place in the data file and mark it received."""
+    if not 0 <= index < chunk_count(session):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Chunk index out of range")
+    offset, length = chunk_span(session, index)
+    path = session_path(upload_dir, session["id"])
+    # Before and after, so a slow chunk does not expire mid-write either
+    await run_in_threadpool(touch_session, upload_dir, session)
+
+    fd = await run_in_threadpool(os.open, path / "data", os.O_WRONLY)
+    try:
+        written = 0
+        buffer = bytearray()
+        async for data in body:
+            if written + len(buffer) + len(data) > length:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Chunk {index} must be {length} bytes"
+                )
+            buffer += data
+            if len(buffer) >= settings.UPLOAD_CHUNK_SIZE:
+                await run_in_threadpool(_pwrite_all, fd, bytes(buffer), offset + written)
+                written += len(buffer)
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(_pwrite_all, fd, bytes(buffer), offset + written)
+            written += len(buffer)
+    finally:
+        await run_in_threadpool(os.close, fd)
+
+    if written != length:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Chunk {index} must be {length} bytes, got {written}"
+        )
+    # The marker is only created once the bytes are in place
+    await run_in_threadpool((path / "chunks" / str(index)).touch)
+    await run_in_threadpool(touch_session, upload_dir, session)
+
+
+def assemble(upload_dir: Path, session: dict) -> Path:
+    """Check every chunk arrived and return the path of the assembled data file."""
+    missing = session_status(upload_dir, session)["missing"]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload incomplete, missing chunks: {missing[:20]}"
+        )
+    data = session_path(upload_dir, session["id"]) / "data"
+    with open(data, "rb+") as file:
+        os.fsync(file.fileno())
+    return data
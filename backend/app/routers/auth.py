@@ -1,80 +1,96 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from app.database import get_db
 from app import crud, schemas
 from app.auth import (
-    get_current_user,
+    Principal,
     require_admin,
-    verify_password,
-    get_password_hash,
-    create_access_token
+    verify_password_async,
+    get_password_hash_async,
+    needs_rehash,
+    create_user_token,
+    invalidate_principals
 )
 from app.models import User
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+# Password hashing runs on the bounded pool in app.auth; these routes are
+# async so that waiting for it holds no request thread.
+
 
 @router.post("/login", response_model=schemas.Token)
-def login(request: schemas.LoginRequest, db: Session = Depends(get_db)):
-    user = crud.get_user_by_username(db, request.username)
-    if not user or not verify_password(request.password, user.password_hash):
+async def login(request: schemas.LoginRequest, db: Session = Depends(get_db)):
+    user = await run_in_threadpool(crud.get_user_by_username, db, request.username)
+    if not user or not await verify_password_async(request.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
 
-    access_token = create_access_token(data={"sub": user.username})
+    # Upgrade hashes made with a different work factor while the password is at hand
+    if needs_rehash(user.password_hash):
+        password_hash = await get_password_hash_async(request.password)
+        await run_in_threadpool(crud.set_password_hash, db, user, password_hash)
+
+    access_token = create_user_token(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.post("/init")
-def init_admin(request: schemas.InitAdminRequest, db: Session = Depends(get_db)):
-    existing_user = crud.get_user_by_username(db, request.username)
+async def init_admin(request: schemas.InitAdminRequest, db: Session = Depends(get_db)):
+    existing_user = await run_in_threadpool(crud.get_user_by_username, db, request.username)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Admin user already exists"
         )
 
-    user = crud.create_user(db, schemas.UserCreate(
+    hashed_password = await get_password_hash_async(request.password)
+    user = await run_in_threadpool(crud.create_user, db, schemas.UserCreate(
         username=request.username,
         password=request.password,
         role="admin"
-    ))
+    ), hashed_password)
     return {"message": "Admin user created successfully", "user_id": user.id}
 
 
 @router.post("/change-password")
-def change_password(
+async def change_password(
     request: schemas.ChangePasswordRequest,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
-    if not verify_password(request.old_password, current_user.password_hash):
+    user = await run_in_threadpool(db.get, User, current_user.id)
+    if not await verify_password_async(request.old_password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect old password"
         )
 
-    current_user.password_hash = get_password_hash(request.new_password)
-    db.commit()
+    password_hash = await get_password_hash_async(request.new_password)
+    await run_in_threadpool(crud.set_password_hash, db, user, password_hash)
+    invalidate_principals(user.username)
     return {"message": "Password changed successfully"}
 
 
 @router.post("/create-user")
-def create_viewer(
+async def create_viewer(
     request: schemas.UserCreate,
-    current_user: User = Depends(require_admin),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
     """Create a viewer user (admin only)"""
-    existing = crud.get_user_by_username(db, request.username)
+    existing = await run_in_threadpool(crud.get_user_by_username, db, request.username)
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already exists"
         )
 
-    user = crud.create_user(db, request)
+    hashed_password = await get_password_hash_async(request.password)
+    user = await run_in_threadpool(crud.create_user, db, request, hashed_password)
+    invalidate_principals(user.username)
     return {"message": "User created successfully", "user_id": user.id}
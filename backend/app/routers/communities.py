@@ -1,31 +1,67 @@
 from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.orm import Session
 
 from app.database import get_db
-from app import crud, schemas
-from app.auth import get_current_user, require_admin
-from app.models import User
+from app import crud, metro, pagination, response_cache, schemas
+from app.auth import Principal, get_current_user, require_admin
 
 router = APIRouter(prefix="/communities", tags=["communities"])
 
 
 @router.get("", response_model=List[schemas.CommunityResponse])
 def get_communities(
+    request: Request,
+    response: Response,
     district: Optional[str] = Query(None),
+    metro_line: Optional[str] = Query(None, description="Metro line, e.g. 9 or 9号线"),
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Latitude of a point (e.g. a station)"),
+    lon: Optional[float] = Query(None, ge=-180, le=180, description="Longitude of the point"),
+    within: float = Query(1000, ge=1, le=50000, description="Metres from lat/lon"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
-    return crud.get_communities(db, district=district, skip=skip, limit=limit)
+    if cursor and skip:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either cursor or skip, not both"
+        )
+    metro.check_location(lat, lon)
+
+    def load_page():
+        try:
+            communities = crud.get_communities(
+                db, district=district, metro_line=metro_line, near_lat=lat, near_lon=lon, within=within,
+                order=order, cursor=cursor, skip=skip, limit=limit
+            )
+        except pagination.InvalidCursor as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        next_cursor = pagination.next_cursor(communities, "id", order, limit)
+        return communities, {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+    # The first page is what the list view opens on; serve it from the cache
+    if not cursor and not skip:
+        key = ("communities", district, metro_line, lat, lon, within, order, limit)
+        return response_cache.cached_response(
+            request, db, key,
+            lambda: response_cache.serialize_page(*load_page(), schemas.CommunityResponse)
+        )
+
+    communities, headers = load_page()
+    response.headers.update(headers)
+    return communities
 
 
 @router.get("/{community_id}", response_model=schemas.CommunityResponse)
 def get_community(
     community_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     community = crud.get_community(db, community_id)
     if not community:
@@ -40,7 +76,7 @@ def get_community(
 def create_community(
     community: schemas.CommunityCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: Principal = Depends(require_admin)
 ):
     return crud.create_community(db, community)
 
@@ -50,7 +86,7 @@ def update_community(
     community_id: int,
     community: schemas.CommunityUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: Principal = Depends(require_admin)
 ):
     updated = crud.update_community(db, community_id, community)
     if not updated:
@@ -65,7 +101,7 @@ def update_community(
 def delete_community(
     community_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: Principal = Depends(require_admin)
 ):
     if not crud.delete_community(db, community_id):
         raise HTTPException(
@@ -1,292 +1,328 @@
 # Import/Export router for Excel file handling
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
 from io import BytesIO
-from typing import List, Dict, Any, Optional
+from typing import Callable, Dict, Optional, Tuple
 
-import openpyxl
 from openpyxl import Workbook
-from fastapi import APIRouter, File, HTTPException, UploadFile, Depends
+from fastapi import APIRouter, File, HTTPException, UploadFile, Depends, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 
-from app.auth import get_current_user
-from app.models import User, Community, Property
+from app.auth import Principal, get_current_user, get_verified_user
 from app.database import get_db
-from app import crud
+from app import exporter, http_cache, importer, jobs, metro, schemas
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/import-export", tags=["import-export"])
 
+# Templates only change with a deploy; the ETag lets clients revalidate
+TEMPLATE_CACHE_CONTROL = "public, max-age=86400"
+
 
 # ============ Excel Template Generation ============
 
-def generate_community_template() -> bytes:
-    """Generate Excel template for community data entry."""
+COMMUNITY_TEMPLATE = {
+    "title": "小区信息",
+    "filename": "community_template.xlsx",
+    "headers": importer.COMMUNITY_HEADERS,
+    "example": [
+        "示例小区", "浦东新区", "XX路123号", "2.5元/平/月", "地上50个,地下100个",
+        2015, "地铁9号线, 商场", "明珠小学", "明珠中学", 8, "小区环境好"
+    ],
+    "widths": {
+        "A": 15,  # name
+        "B": 12,  # district
+        "C": 25,  # address
+        "D": 15,  # property_fee
+        "E": 20,  # parking
+        "F": 10,  # build_year
+        "G": 20,  # metro
+        "H": 15,  # primary_school
+        "I": 15,  # middle_school
+        "J": 12,  # environment_score
+        "K": 30,  # notes
+    },
+}
+
+PROPERTY_TEMPLATE = {
+    "title": "房源信息",
+    "filename": "property_template.xlsx",
+    "headers": importer.PROPERTY_HEADERS,
+    "example": [
+        "示例小区", "1", "1", "101", 120, "3室2厅",
+        "中楼层", "南", "精装", 800, 6000,
+        750, "2024-01-15", "采光好"
+    ],
+    "widths": {
+        "A": 15,  # community_name
+        "B": 8,   # building
+        "C": 8,   # unit
+        "D": 8,   # room
+        "E": 12,  # area
+        "F": 12,  # layout
+        "G": 10,  # floor
+        "H": 10,  # orientation
+        "I": 12,  # decoration
+        "J": 15,  # price
+        "K": 15,  # rent
+        "L": 15,  # expected_price
+        "M": 18,  # visit_date
+        "N": 30,  # notes
+    },
+}
+
+# Built templates keyed by spec hash: {key: bytes}
+_template_cache: Dict[str, bytes] = {}
+
+
+def build_template(spec: dict) -> bytes:
+    """Build an Excel template workbook from a template spec."""
     wb = Workbook()
     ws = wb.active
-    ws.title = "小区信息"
+    ws.title = spec["title"]
 
     # Headers
-    headers = [
-        "小区名称*", "所属区*", "详细地址", "物业费", "停车位", "建成年份",
-        "周边配套/地铁", "对口小学", "对口中学", "环境打分(1-10)", "备注"
-    ]
-    ws.append(headers)
+    ws.append(spec["headers"])
 
     # Example row
-    example = [
-        "示例小区", "浦东新区", "XX路123号", "2.5元/平/月", "地上50个,地下100个",
-        2015, "地铁9号线, 商场", "明珠小学", "明珠中学", 8, "小区环境好"
-    ]
-    ws.append(example)
+    ws.append(spec["example"])
 
     # Set column widths
-    ws.column_dimensions['A'].width = 15  # name
-    ws.column_dimensions['B'].width = 12  # district
-    ws.column_dimensions['C'].width = 25  # address
-    ws.column_dimensions['D'].width = 15  # property_fee
-    ws.column_dimensions['E'].width = 20  # parking
-    ws.column_dimensions['F'].width = 10  # build_year
-    ws.column_dimensions['G'].width = 20  # metro
-    ws.column_dimensions['H'].width = 15  # primary_school
-    ws.column_dimensions['I'].width = 15  # middle_school
-    ws.column_dimensions['J'].width = 12  # environment_score
-    ws.column_dimensions['K'].width = 30  # notes
+    for column, width in spec["widths"].items():
+        ws.column_dimensions[column].width = width
 
     output = BytesIO()
     wb.save(output)
     return output.getvalue()
 
 
+def template_key(spec: dict) -> str:
+    """Hash a template spec, so any change to it yields a new key."""
+    encoded = json.dumps(spec, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def get_template(spec: dict) -> Tuple[bytes, str]:
+    """Return (content, key) for a template, building it on first use."""
+    key = template_key(spec)
+    content = _template_cache.get(key)
+    if content is None:
+        content = _template_cache.setdefault(key, build_template(spec))
+    return content, key
+
+
+def warm_template_cache():
+    """Build all templates ahead of the first download."""
+    for spec in (COMMUNITY_TEMPLATE, PROPERTY_TEMPLATE):
+        get_template(spec)
+
+
+def generate_community_template() -> bytes:
+    """Generate Excel template for community data entry."""
+    return get_template(COMMUNITY_TEMPLATE)[0]
+
+
 def generate_property_template() -> bytes:
     """Generate Excel template for property data entry."""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "房源信息"
+    return get_template(PROPERTY_TEMPLATE)[0]
 
-    # Headers
-    headers = [
-        "小区名称*", "楼号", "单元", "房号", "面积(㎡)*", "户型",
-        "楼层", "朝向", "装修情况", "挂牌价格(万)*", "租金(元/月)",
-        "预计价格(万)", "看房日期(YYYY-MM-DD)", "备注"
-    ]
-    ws.append(headers)
 
-    # Example row
-    example = [
-        "示例小区", "1", "1", "101", 120, "3室2厅",
-        "中楼层", "南", "精装", 800, 6000,
-        750, "2024-01-15", "采光好"
-    ]
-    ws.append(example)
+def template_response(spec: dict, request: Request) -> Response:
+    """Serve a cached template, answering 304 when the client's copy is current."""
+    content, key = get_template(spec)
+    etag = f'"{key}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": TEMPLATE_CACHE_CONTROL,
+        "Content-Disposition": f"attachment; filename={spec['filename']}",
+    }
 
-    # Set column widths
-    ws.column_dimensions['A'].width = 15  # community_name
-    ws.column_dimensions['B'].width = 8   # building
-    ws.column_dimensions['C'].width = 8   # unit
-    ws.column_dimensions['D'].width = 8   # room
-    ws.column_dimensions['E'].width = 12  # area
-    ws.column_dimensions['F'].width = 12  # layout
-    ws.column_dimensions['G'].width = 10  # floor
-    ws.column_dimensions['H'].width = 10  # orientation
-    ws.column_dimensions['I'].width = 12  # decoration
-    ws.column_dimensions['J'].width = 15  # price
-    ws.column_dimensions['K'].width = 15  # rent
-    ws.column_dimensions['L'].width = 15  # expected_price
-    ws.column_dimensions['M'].width = 18  # visit_date
-    ws.column_dimensions['N'].width = 30  # notes
+    if http_cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-    output = BytesIO()
-    wb.save(output)
-    return output.getvalue()
+    return Response(content, media_type=exporter.XLSX_MEDIA_TYPE, headers=headers)
 
 
 @router.get("/template/community")
-async def download_community_template():
+def download_community_template(request: Request):
     """Download community Excel template."""
-    content = generate_community_template()
-    return StreamingResponse(
-        BytesIO(content),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=community_template.xlsx"}
-    )
+    return template_response(COMMUNITY_TEMPLATE, request)
 
 
 @router.get("/template/property")
-async def download_property_template():
+def download_property_template(request: Request):
     """Download property Excel template."""
-    content = generate_property_template()
-    return StreamingResponse(
-        BytesIO(content),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=property_template.xlsx"}
-    )
+    return template_response(PROPERTY_TEMPLATE, request)
 
 
 # ============ Excel Import ============
 
-def parse_community_row(row: list) -> Dict[str, Any]:
-    """Parse a community row from Excel."""
-    return {
-        "name": str(row[0]).strip() if row[0] else "",
-        "district": str(row[1]).strip() if row[1] else "",
-        "address": str(row[2]).strip() if len(row) > 2 and row[2] else "",
-        "property_fee": str(row[3]).strip() if len(row) > 3 and row[3] else "",
-        "parking": str(row[4]).strip() if len(row) > 4 and row[4] else "",
-        "build_year": int(row[5]) if len(row) > 5 and row[5] and str(row[5]).isdigit() else None,
-        "metro": str(row[6]).strip() if len(row) > 6 and row[6] else "",
-        "primary_school": str(row[7]).strip() if len(row) > 7 and row[7] else "",
-        "middle_school": str(row[8]).strip() if len(row) > 8 and row[8] else "",
-        "environment_score": int(row[9]) if len(row) > 9 and row[9] and str(row[9]).isdigit() else None,
-        "notes": str(row[10]).strip() if len(row) > 10 and row[10] else "",
-    }
+# Bytes copied per read when spooling an upload to disk
+SPOOL_CHUNK_SIZE = 1024 * 1024
 
 
-def parse_property_row(row: list, community_map: Dict[str, int]) -> Optional[Dict[str, Any]]:
-    """Parse a property row from Excel."""
-    community_name = str(row[0]).strip() if row[0] else ""
+def spool_upload(file: UploadFile) -> str:
+    """Copy an uploaded workbook to a named temp file and return its path."""
+    with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as tmp:
+        file.file.seek(0)
+        shutil.copyfileobj(file.file, tmp, SPOOL_CHUNK_SIZE)
+        return tmp.name
 
-    if community_name not in community_map:
-        return None
 
-    # Parse visit_date
-    visit_date = None
-    if len(row) > 12 and row[12]:
-        try:
-            from datetime import datetime
-            visit_date = datetime.strptime(str(row[12]).strip(), "%Y-%m-%d")
-        except ValueError:
-            pass
+def run_import(file: UploadFile, import_rows: Callable, db: Session) -> dict:
+    """Spool the upload, then stream its rows through an importer."""
+    path = spool_upload(file)
+    try:
+        result = import_rows(db, importer.iter_sheet_rows(path))
+    finally:
+        os.unlink(path)
 
     return {
-        "community_id": community_map[community_name],
-        "building": str(row[1]).strip() if len(row) > 1 and row[1] else "",
-        "unit": str(row[2]).strip() if len(row) > 2 and row[2] else "",
-        "room": str(row[3]).strip() if len(row) > 3 and row[3] else "",
-        "area": float(row[4]) if len(row) > 4 and row[4] else None,
-        "layout": str(row[5]).strip() if len(row) > 5 and row[5] else "",
-        "floor": str(row[6]).strip() if len(row) > 6 and row[6] else "",
-        "orientation": str(row[7]).strip() if len(row) > 7 and row[7] else "",
-        "decoration": str(row[8]).strip() if len(row) > 8 and row[8] else "",
-        "price": float(row[9]) if len(row) > 9 and row[9] else None,
-        "rent": float(row[10]) if len(row) > 10 and row[10] else None,
-        "expected_price": float(row[11]) if len(row) > 11 and row[11] else None,
-        "visit_date": visit_date,
-        "notes": str(row[12]).strip() if len(row) > 13 and row[13] else "",
+        "success": True,
+        "imported": len(result["details"]),
+        "details": result["details"],
+        "errors": result["errors"] or None
     }
 
 
+def start_import_job(file: UploadFile, kind: str, user: Principal) -> dict:
+    """Spool the upload and queue it as a background import job."""
+    path = spool_upload(file)
+    job = jobs.submit_import(kind, path, file.filename, user.id)
+    return {"success": True, "job_id": job.id, "status": job.status}
+
+
 @router.post("/community")
 async def import_communities(
+    response: Response,
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    background: bool = Query(False, description="Run as a background job and return its id"),
+    current_user: Principal = Depends(get_verified_user),
     db: Session = Depends(get_db)
 ) -> dict:
     """Import communities from Excel file."""
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Only Excel files (.xlsx, .xls) are supported")
 
-    try:
-        content = await file.read()
-        wb = openpyxl.load_workbook(BytesIO(content))
-        ws = wb.active
-
-        # Skip header row
-        rows = list(ws.iter_rows(min_row=2, values_only=True))
-
-        imported = []
-        errors = []
-
-        for idx, row in enumerate(rows):
-            if not row or not row[0]:  # Skip empty rows
-                continue
-
-            try:
-                data = parse_community_row(row)
-
-                # Validate required fields
-                if not data["name"]:
-                    errors.append(f"Row {idx + 2}: 小区名称不能为空")
-                    continue
-                if not data["district"]:
-                    errors.append(f"Row {idx + 2}: 所属区不能为空")
-                    continue
-
-                # Create community
-                from app.schemas import CommunityCreate
-                community = crud.create_community(db, CommunityCreate(**data))
-                imported.append({"id": community.id, "name": community.name})
-
-            except Exception as e:
-                errors.append(f"Row {idx + 2}: {str(e)}")
-
-        return {
-            "success": True,
-            "imported": len(imported),
-            "details": imported,
-            "errors": errors if errors else None
-        }
+    if background:
+        response.status_code = status.HTTP_202_ACCEPTED
+        return await run_in_threadpool(start_import_job, file, "community", current_user)
 
+    try:
+        # Parsing and inserting are blocking, keep them off the event loop
+        return await run_in_threadpool(run_import, file, importer.import_communities, db)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to parse Excel file: {str(e)}")
 
 
 @router.post("/property")
 async def import_properties(
+    response: Response,
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    background: bool = Query(False, description="Run as a background job and return its id"),
+    current_user: Principal = Depends(get_verified_user),
     db: Session = Depends(get_db)
 ) -> dict:
     """Import properties from Excel file."""
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Only Excel files (.xlsx, .xls) are supported")
 
-    try:
-        content = await file.read()
-        wb = openpyxl.load_workbook(BytesIO(content))
-        ws = wb.active
-
-        # First, get all existing communities to build name->id map
-        communities = db.query(Community).all()
-        community_map = {c.name: c.id for c in communities}
-
-        # Skip header row
-        rows = list(ws.iter_rows(min_row=2, values_only=True))
-
-        imported = []
-        errors = []
-
-        for idx, row in enumerate(rows):
-            if not row or not row[0]:  # Skip empty rows
-                continue
-
-            try:
-                data = parse_property_row(row, community_map)
-
-                if not data:
-                    errors.append(f"Row {idx + 2}: 小区 '{row[0]}' 不存在，请先创建小区")
-                    continue
-
-                # Validate required fields
-                if not data["area"]:
-                    errors.append(f"Row {idx + 2}: 面积不能为空")
-                    continue
-                if not data["price"]:
-                    errors.append(f"Row {idx + 2}: 挂牌价格不能为空")
-                    continue
-
-                # Create property
-                from app.schemas import PropertyCreate
-                property_obj = crud.create_property(db, PropertyCreate(**data))
-                imported.append({"id": property_obj.id, "area": property_obj.area, "price": property_obj.price})
-
-            except Exception as e:
-                errors.append(f"Row {idx + 2}: {str(e)}")
-
-        return {
-            "success": True,
-            "imported": len(imported),
-            "details": imported,
-            "errors": errors if errors else None
-        }
+    if background:
+        response.status_code = status.HTTP_202_ACCEPTED
+        return await run_in_threadpool(start_import_job, file, "property", current_user)
 
+    try:
+        # Parsing and inserting are blocking, keep them off the event loop
+        return await run_in_threadpool(run_import, file, importer.import_properties, db)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to parse Excel file: {str(e)}")
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.ImportJobResponse)
+def get_import_job(
+    job_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Poll the progress and result of a background import job."""
+    job = jobs.get_job_status(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
+# ============ Export ============
+
+def export_response(fmt: str, name: str, title: str, headers: list, row_source: Callable) -> StreamingResponse:
+    """Build a chunked download response for an export."""
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return StreamingResponse(
+        exporter.export_stream(fmt, title, headers, row_source),
+        media_type=exporter.CSV_MEDIA_TYPE if fmt == "csv" else exporter.XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+@router.get("/export/communities")
+def export_communities(
+    fmt: str = Query("xlsx", alias="format", pattern="^(xlsx|csv)$"),
+    district: Optional[str] = Query(None),
+    metro_line: Optional[str] = Query(None),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    within: float = Query(1000, ge=1, le=50000),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Export communities as Excel or CSV."""
+    metro.check_location(lat, lon)
+    filters = dict(district=district, metro_line=metro_line, near_lat=lat, near_lon=lon, within=within)
+    return export_response(
+        fmt, "communities", "小区信息", exporter.COMMUNITY_EXPORT_HEADERS,
+        lambda db: exporter.iter_community_rows(db, **filters)
+    )
+
+
+@router.get("/export/properties")
+def export_properties(
+    fmt: str = Query("xlsx", alias="format", pattern="^(xlsx|csv)$"),
+    community_id: Optional[int] = Query(None),
+    district: Optional[str] = Query(None),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    min_area: Optional[float] = Query(None, ge=0),
+    max_area: Optional[float] = Query(None, ge=0),
+    min_rent_ratio: Optional[float] = Query(None, ge=0),
+    max_rent_ratio: Optional[float] = Query(None, ge=0),
+    school: Optional[str] = Query(None),
+    metro_line: Optional[str] = Query(None),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    within: float = Query(1000, ge=1, le=50000),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Export properties matching the list filters as Excel or CSV."""
+    metro.check_location(lat, lon)
+    filters = dict(
+        community_id=community_id,
+        district=district,
+        min_price=min_price,
+        max_price=max_price,
+        min_area=min_area,
+        max_area=max_area,
+        min_rent_ratio=min_rent_ratio,
+        max_rent_ratio=max_rent_ratio,
+        school=school,
+        metro_line=metro_line,
+        near_lat=lat,
+        near_lon=lon,
+        within=within
+    )
+    return export_response(
+        fmt, "properties", "房源信息", exporter.PROPERTY_EXPORT_HEADERS,
+        lambda db: exporter.iter_property_rows(db, **filters)
+    )
@@ -1,17 +1,23 @@
 from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.orm import Session
 
-from app.database import get_db
-from app import crud, schemas
-from app.auth import get_current_user, require_admin
-from app.models import User
+from app.database import begin_write, get_db
+from app import crud, derived, metro, pagination, response_cache, schemas
+from app.auth import Principal, get_current_user, require_admin
 
 router = APIRouter(prefix="/properties", tags=["properties"])
 
 
+def includes_community(include: str) -> bool:
+    """Whether an include= parameter asks for the nested community."""
+    return "community" in {name.strip() for name in include.split(",")}
+
+
 @router.get("", response_model=List[schemas.PropertyResponse])
 def get_properties(
+    request: Request,
+    response: Response,
     community_id: Optional[int] = Query(None),
     district: Optional[str] = Query(None),
     min_price: Optional[float] = Query(None, ge=0),
@@ -20,33 +26,82 @@ def get_properties(
     max_area: Optional[float] = Query(None, ge=0),
     min_rent_ratio: Optional[float] = Query(None, ge=0),
     max_rent_ratio: Optional[float] = Query(None, ge=0),
+    school: Optional[str] = Query(None, description="Primary or middle school (学区); a name prefix also matches"),
+    metro_line: Optional[str] = Query(None, description="Metro line, e.g. 9 or 9号线"),
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Latitude of a point (e.g. a station)"),
+    lon: Optional[float] = Query(None, ge=-180, le=180, description="Longitude of the point"),
+    within: float = Query(1000, ge=1, le=50000, description="Metres from lat/lon"),
+    sort: str = Query("id", pattern="^(id|price|price_per_sqm|rent_ratio|area|visit_date)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    include: str = Query("community", description="Nested objects to include; empty for none"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
-    return crud.get_properties(
-        db,
-        community_id=community_id,
-        district=district,
-        min_price=min_price,
-        max_price=max_price,
-        min_area=min_area,
-        max_area=max_area,
-        min_rent_ratio=min_rent_ratio,
-        max_rent_ratio=max_rent_ratio,
-        skip=skip,
-        limit=limit
-    )
+    if cursor and skip:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either cursor or skip, not both"
+        )
+    metro.check_location(lat, lon)
+
+    def load_page():
+        try:
+            properties = crud.get_properties(
+                db,
+                community_id=community_id,
+                district=district,
+                min_price=min_price,
+                max_price=max_price,
+                min_area=min_area,
+                max_area=max_area,
+                min_rent_ratio=min_rent_ratio,
+                max_rent_ratio=max_rent_ratio,
+                school=school,
+                metro_line=metro_line,
+                near_lat=lat,
+                near_lon=lon,
+                within=within,
+                sort=sort,
+                order=order,
+                cursor=cursor,
+                skip=skip,
+                limit=limit,
+                include_community=includes_community(include)
+            )
+        except pagination.InvalidCursor as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        next_cursor = pagination.next_cursor(properties, sort, order, limit)
+        return properties, {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+    # The first page is what the list view opens on; serve it from the cache
+    if not cursor and not skip:
+        key = (
+            "properties", community_id, district, min_price, max_price, min_area, max_area,
+            min_rent_ratio, max_rent_ratio, school, metro_line, lat, lon, within,
+            sort, order, includes_community(include), limit
+        )
+        return response_cache.cached_response(
+            request, db, key,
+            lambda: response_cache.serialize_page(*load_page(), schemas.PropertyResponse)
+        )
+
+    properties, headers = load_page()
+    response.headers.update(headers)
+    return properties
 
 
 @router.get("/{property_id}", response_model=schemas.PropertyResponse)
 def get_property(
     property_id: int,
+    include: str = Query("community", description="Nested objects to include; empty for none"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
-    property = crud.get_property(db, property_id)
+    property = crud.get_property(db, property_id, include_community=includes_community(include))
     if not property:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -59,9 +114,10 @@ def get_property(
 def create_property(
     property: schemas.PropertyCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: Principal = Depends(require_admin)
 ):
-    # Verify community exists
+    # Verify community exists, in the transaction that adds the property
+    begin_write(db)
     community = crud.get_community(db, property.community_id)
     if not community:
         raise HTTPException(
@@ -71,12 +127,23 @@ def create_property(
     return crud.create_property(db, property)
 
 
+@router.post("/recompute-derived", response_model=schemas.DerivedRecomputeResponse)
+def recompute_derived(
+    dry_run: bool = Query(True, description="Only report the differences"),
+    show: int = Query(derived.DEFAULT_SHOW, ge=0, le=1000, description="Differences to list"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_admin)
+):
+    """Recompute rent_ratio and price_per_sqm of every property in one UPDATE."""
+    return derived.recompute(db, dry_run=dry_run, show=show)
+
+
 @router.put("/{property_id}", response_model=schemas.PropertyResponse)
 def update_property(
     property_id: int,
     property: schemas.PropertyUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: Principal = Depends(require_admin)
 ):
     updated = crud.update_property(db, property_id, property)
     if not updated:
@@ -91,7 +158,7 @@ def update_property(
 def delete_property(
     property_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: Principal = Depends(require_admin)
 ):
     if not crud.delete_property(db, property_id):
         raise HTTPException(
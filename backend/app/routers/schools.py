@@ -0,0 +1,24 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app import response_cache, schemas, schools
+from app.auth import Principal, get_current_user
+
+router = APIRouter(prefix="/schools", tags=["schools"])
+
+
+@router.get("", response_model=List[schemas.SchoolStats])
+def get_school_stats(
+    request: Request,
+    level: Optional[str] = Query(None, pattern="^(primary|middle)$"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Communities, properties and median price per m² of every school, most listings first."""
+    return response_cache.cached_response(
+        request, db, ("schools", level),
+        lambda: response_cache.serialize_page(schools.school_stats(db, level), {}, schemas.SchoolStats)
+    )
@@ -0,0 +1,24 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app import schemas, search
+from app.auth import Principal, get_current_user
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+
+@router.get("", response_model=schemas.SearchResponse)
+def search_all(
+    q: str = Query(..., min_length=1, max_length=200, description="Space-separated terms, all must match"),
+    type: Optional[str] = Query(None, pattern="^(community|property)$"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Search community names, addresses, metro and schools, and property notes."""
+    items, total = search.search(db, q, kind=type, skip=skip, limit=limit)
+    return {"total": total, "items": items}
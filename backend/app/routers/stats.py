@@ -1,17 +1,40 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.orm import Session
 
 from app.database import get_db
-from app import crud, schemas
-from app.auth import get_current_user
-from app.models import User
+from app import analytics, crud, response_cache, schemas
+from app.auth import Principal, get_current_user
 
 router = APIRouter(prefix="/stats", tags=["stats"])
 
 
 @router.get("", response_model=schemas.StatsResponse)
 def get_stats(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    return response_cache.cached_response(
+        request, db, ("stats",),
+        lambda: (schemas.StatsResponse.model_validate(crud.get_stats(db)), {})
+    )
+
+
+@router.get("/distribution", response_model=schemas.DistributionResponse)
+def get_distribution(
+    request: Request,
+    district: Optional[str] = Query(None),
+    community_id: Optional[int] = Query(None),
+    bins: int = Query(analytics.DEFAULT_BINS, ge=1, le=100, description="Price per m² histogram bins"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
-    return crud.get_stats(db)
+    """Price per m² percentiles and histogram, rent ratio quantiles and area buckets, overall and per district."""
+    return response_cache.cached_response(
+        request, db, ("stats_distribution", district, community_id, bins),
+        lambda: (schemas.DistributionResponse.model_validate(
+            analytics.distribution(db, district=district, community_id=community_id, bins=bins)
+        ), {})
+    )
@@ -1,15 +1,18 @@
 # File upload router
 import os
-import uuid
-from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, File, HTTPException, UploadFile, Depends
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, Request, Depends, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
 
-from app.auth import get_current_user
-from app.models import User
+from app import media_store, models, resumable_upload, schemas, thumbnails, video_meta
+from app.media_response import media_response
+from app.auth import Principal, get_verified_user
+from app.config import settings
+from app.database import get_db
+from app.upload_stream import receive_file
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
@@ -22,6 +25,23 @@ ALLOWED_PHOTOS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
 ALLOWED_VIDEOS = {".mp4", ".webm", ".mov", ".avi"}
 ALLOWED_ALL = ALLOWED_PHOTOS | ALLOWED_VIDEOS
 
+# The body is parsed by receive_file rather than a File() parameter, so
+# describe the form for the OpenAPI docs here
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
 
 def get_file_extension(filename: str) -> str:
     """Get file extension in lowercase."""
@@ -39,87 +59,252 @@ def validate_file(filename: str) -> str:
     return ext
 
 
-def generate_unique_filename(original_filename: str) -> str:
-    """Generate unique filename with timestamp."""
-    ext = get_file_extension(original_filename)
-    unique_id = str(uuid.uuid4())[:8]
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    return f"{timestamp}_{unique_id}{ext}"
+def validate_video(filename: str) -> str:
+    """Validate that a file is an allowed video type."""
+    ext = validate_file(filename)
+    if ext not in ALLOWED_VIDEOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Video type not allowed. Allowed: {', '.join(ALLOWED_VIDEOS)}"
+        )
+    return ext
+
+
+def upload_response(filename: str, original_name: str) -> dict:
+    return {
+        "filename": filename,
+        "url": f"/api/upload/files/{filename}",
+        "original_name": original_name
+    }
 
 
-@router.post("/photo")
+async def video_response(filename: str, original_name: str, created: bool) -> dict:
+    """
+    Upload response for a stored video.
+
+    Poster and metadata are extracted in the background; they are included
+    if ready within VIDEO_META_WAIT_SECONDS, otherwise they can be fetched
+    later from /files/{filename}/metadata. A video that was already stored
+    reuses its sidecar.
+    """
+    video = UPLOAD_DIR / filename
+    metadata = None if created else await run_in_threadpool(video_meta.read_sidecar, video)
+    if metadata is None:
+        metadata = await video_meta.wait_for_metadata(video_meta.enqueue(video))
+    poster = metadata.get("poster") if metadata else None
+    return {
+        **upload_response(filename, original_name),
+        "poster_url": f"/api/upload/files/{poster}" if poster else None,
+        "metadata": metadata
+    }
+
+
+def store_received(db: Session, path: Path, sha256: str, size: int, original_name: str):
+    """Move a fully received file into the content-addressed store."""
+    return media_store.store_file(db, path, UPLOAD_DIR, sha256, size, original_name)
+
+
+@router.post("/photo", openapi_extra=UPLOAD_REQUEST_BODY)
 async def upload_photo(
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_verified_user)
 ) -> dict:
     """Upload a photo file."""
-    validate_file(file.filename)
+    received = await receive_file(
+        request, UPLOAD_DIR, settings.UPLOAD_MAX_PHOTO_SIZE, validate=validate_file
+    )
 
-    filename = generate_unique_filename(file.filename)
-    file_path = UPLOAD_DIR / filename
+    filename, created = await run_in_threadpool(
+        store_received, db, received.path, received.sha256, received.size, received.filename
+    )
+    if created:
+        thumbnails.enqueue(UPLOAD_DIR / filename)
 
-    content = await file.read()
-    file_path.write_bytes(content)
-
-    return {
-        "filename": filename,
-        "url": f"/api/upload/files/{filename}",
-        "original_name": file.filename
-    }
+    return upload_response(filename, received.filename)
 
 
-@router.post("/video")
+@router.post("/video", openapi_extra=UPLOAD_REQUEST_BODY)
 async def upload_video(
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_verified_user)
 ) -> dict:
     """Upload a video file."""
-    ext = validate_file(file.filename)
-
-    if ext not in ALLOWED_VIDEOS:
+    received = await receive_file(
+        request, UPLOAD_DIR, settings.UPLOAD_MAX_VIDEO_SIZE, validate=validate_video
+    )
+
+    filename, created = await run_in_threadpool(
+        store_received, db, received.path, received.sha256, received.size, received.filename
+    )
+    return await video_response(filename, received.filename, created)
+
+
+# ============ Resumable Video Uploads ============
+#
+# POST   /video/sessions                        {filename, size} -> session
+# PUT    /video/sessions/{id}/chunks/{index}    raw bytes of chunk index
+# GET    /video/sessions/{id}                   received ranges, missing chunks
+# POST   /video/sessions/{id}/complete          -> same payload as /video
+# DELETE /video/sessions/{id}                   abort
+#
+# Chunk i starts at byte i * chunk_size; chunks may be sent in any order
+# and in parallel, and re-sending one is harmless.
+
+@router.post(
+    "/video/sessions",
+    response_model=schemas.UploadSessionResponse,
+    status_code=status.HTTP_201_CREATED
+)
+async def create_video_session(
+    request: schemas.UploadSessionCreate,
+    current_user: Principal = Depends(get_verified_user)
+):
+    """Start a resumable video upload."""
+    validate_video(request.filename)
+    if request.size > settings.UPLOAD_MAX_VIDEO_SIZE:
         raise HTTPException(
-            status_code=400,
-            detail=f"Video type not allowed. Allowed: {', '.join(ALLOWED_VIDEOS)}"
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size is {settings.UPLOAD_MAX_VIDEO_SIZE // (1024 * 1024)} MB"
         )
 
-    filename = generate_unique_filename(file.filename)
-    file_path = UPLOAD_DIR / filename
+    await run_in_threadpool(resumable_upload.expire_sessions, UPLOAD_DIR)
+    session = await run_in_threadpool(
+        resumable_upload.create_session, UPLOAD_DIR, request.filename, request.size, current_user.id
+    )
+    return await run_in_threadpool(resumable_upload.session_status, UPLOAD_DIR, session)
+
+
+@router.get("/video/sessions/{session_id}", response_model=schemas.UploadSessionResponse)
+async def get_video_session(
+    session_id: str,
+    current_user: Principal = Depends(get_verified_user)
+):
+    """Report which byte ranges of a resumable upload have arrived."""
+    session = await run_in_threadpool(resumable_upload.load_session, UPLOAD_DIR, session_id, current_user.id)
+    return await run_in_threadpool(resumable_upload.session_status, UPLOAD_DIR, session)
+
+
+@router.put(
+    "/video/sessions/{session_id}/chunks/{index}",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}},
+        }
+    }
+)
+async def upload_video_chunk(
+    session_id: str,
+    index: int,
+    request: Request,
+    current_user: Principal = Depends(get_verified_user)
+) -> dict:
+    """Store one chunk of a resumable upload."""
+    session = await run_in_threadpool(resumable_upload.load_session, UPLOAD_DIR, session_id, current_user.id)
+    await resumable_upload.write_chunk(UPLOAD_DIR, session, index, request.stream())
 
-    content = await file.read()
-    file_path.write_bytes(content)
+    offset, length = resumable_upload.chunk_span(session, index)
+    return {"index": index, "offset": offset, "length": length}
 
-    return {
-        "filename": filename,
-        "url": f"/api/upload/files/{filename}",
-        "original_name": file.filename
-    }
 
+@router.post("/video/sessions/{session_id}/complete")
+async def complete_video_session(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_verified_user)
+) -> dict:
+    """Move a fully received upload into the store."""
+    session = await run_in_threadpool(resumable_upload.load_session, UPLOAD_DIR, session_id, current_user.id)
 
-@router.get("/files/{filename}")
-async def get_file(filename: str):
-    """Serve uploaded files."""
-    file_path = UPLOAD_DIR / filename
+    def finish():
+        data = resumable_upload.assemble(UPLOAD_DIR, session)
+        # Chunks arrive out of order, so the hash needs one pass over the result
+        sha256 = media_store.hash_file(data)
+        stored = store_received(db, data, sha256, session["size"], session["original_name"])
+        resumable_upload.remove_session(UPLOAD_DIR, session_id)
+        return stored
+
+    filename, created = await run_in_threadpool(finish)
+    return await video_response(filename, session["original_name"], created)
 
-    if not file_path.exists():
+
+@router.delete("/video/sessions/{session_id}")
+async def abort_video_session(
+    session_id: str,
+    current_user: Principal = Depends(get_verified_user)
+) -> dict:
+    """Abandon a resumable upload and free its space."""
+    await run_in_threadpool(resumable_upload.load_session, UPLOAD_DIR, session_id, current_user.id)
+    await run_in_threadpool(resumable_upload.remove_session, UPLOAD_DIR, session_id)
+    return {"message": "Upload session deleted"}
+
+
+def stored_file(filename: str) -> Path:
+    """Path of a stored file; temp files and upload sessions are not served."""
+    file_path = UPLOAD_DIR / filename
+    if filename.startswith(".") or not file_path.is_file():
         raise HTTPException(status_code=404, detail="File not found")
+    return file_path
 
-    return FileResponse(file_path)
+
+@router.api_route("/files/{filename}", methods=["GET", "HEAD"])
+async def get_file(
+    filename: str,
+    size: Optional[int] = Query(None, description="Thumbnail width, one of THUMBNAIL_WIDTHS"),
+    format: str = Query("original", pattern="^(original|webp)$", description="Thumbnail format"),
+    db: Session = Depends(get_db),
+):
+    """
+    Serve uploaded files, or a thumbnail of a photo with size=. Supports
+    Range and conditional requests. Thumbnails are only made of uploads
+    recorded in media_files, never of derived files.
+    """
+    file_path = stored_file(filename)
+
+    if size is not None:
+        if size not in settings.THUMBNAIL_WIDTHS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported size. Allowed: {', '.join(map(str, settings.THUMBNAIL_WIDTHS))}"
+            )
+        if media_store.is_derived_name(filename):
+            raise HTTPException(status_code=400, detail="Sizes are only available for uploaded files")
+        if await run_in_threadpool(db.get, models.MediaFile, filename) is None:
+            raise HTTPException(status_code=404, detail="Thumbnail not available")
+        # Without Pillow, or for videos, the original is the only size there is
+        if thumbnails.available() and thumbnails.is_thumbnail_source(file_path):
+            file_path = await thumbnails.ensure_thumbnail(file_path, size, format)
+
+    return media_response(file_path)
+
+
+@router.get("/files/{filename}/metadata")
+async def get_video_metadata(filename: str) -> dict:
+    """Poster and metadata of a video, once extracted."""
+    file_path = UPLOAD_DIR / filename
+    metadata = None
+    if not filename.startswith(".") and file_path.is_file():
+        metadata = await run_in_threadpool(video_meta.read_sidecar, file_path)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="Metadata not available")
+
+    poster = metadata.get("poster")
+    return {**metadata, "poster_url": f"/api/upload/files/{poster}" if poster else None}
 
 
 @router.delete("/files/{filename}")
 async def delete_file(
     filename: str,
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_verified_user)
 ) -> dict:
-    """Delete an uploaded file."""
+    """Delete an uploaded file; shared content is kept until its last reference goes."""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admin can delete files")
 
-    file_path = UPLOAD_DIR / filename
-
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
-
-    file_path.unlink()
+    file_path = stored_file(filename)
+    await run_in_threadpool(media_store.delete_file, db, file_path)
 
     return {"message": "File deleted successfully"}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
 
@@ -56,6 +56,8 @@ class CommunityBase(BaseModel):
     photos: Optional[str] = None
     videos: Optional[str] = None
     notes: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 
 class CommunityCreate(CommunityBase):
@@ -123,3 +125,105 @@ class StatsResponse(BaseModel):
     average_rent: Optional[float]
     average_rent_ratio: Optional[float]
     district_stats: List[dict]
+
+
+class Quantiles(BaseModel):
+    count: int
+    # p10, p25, p50, p75, p90
+    percentiles: Dict[str, Optional[float]]
+
+
+class PriceDistribution(Quantiles):
+    # Counts per bin of DistributionResponse.price_per_sqm_edges
+    histogram: List[int]
+
+
+class DistrictDistribution(BaseModel):
+    district: Optional[str] = None
+    property_count: int
+    price_per_sqm: PriceDistribution
+    rent_ratio: Quantiles
+    # Counts per bucket of DistributionResponse.area_bucket_edges
+    area_buckets: List[int]
+
+
+class DistributionResponse(BaseModel):
+    price_per_sqm_edges: List[float]
+    area_bucket_edges: List[float]
+    overall: DistrictDistribution
+    districts: List[DistrictDistribution]
+
+
+class SchoolStats(BaseModel):
+    id: int
+    name: str
+    community_count: int
+    property_count: int
+    median_price_per_sqm: Optional[float] = None
+
+
+# Derived metrics schemas
+class DerivedChange(BaseModel):
+    id: int
+    field: str
+    stored: Optional[float] = None
+    computed: Optional[float] = None
+
+
+class DerivedRecomputeResponse(BaseModel):
+    checked: int
+    mismatched: int
+    mismatched_by_field: Dict[str, int]
+    changes: List[DerivedChange]
+    dry_run: bool
+    updated: int
+
+
+# Import job schemas
+class ImportJobResponse(BaseModel):
+    id: str
+    kind: str
+    filename: Optional[str] = None
+    status: str
+    rows_processed: int
+    imported: int
+    rows_per_second: Optional[float] = None
+    error_count: int
+    errors: Optional[List[str]] = None
+    details: Optional[List[dict]] = None
+    message: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+# Resumable upload schemas
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(..., gt=0)
+
+
+class UploadSessionResponse(BaseModel):
+    session_id: str
+    original_name: str
+    size: int
+    chunk_size: int
+    chunk_count: int
+    received: List[List[int]]
+    missing: List[int]
+
+
+# Search schemas
+class SearchHit(BaseModel):
+    kind: str
+    id: int
+    community_id: int
+    title: str
+    district: Optional[str] = None
+    snippet: Optional[str] = None
+    rank: float
+
+
+class SearchResponse(BaseModel):
+    total: int
+    items: List[SearchHit]
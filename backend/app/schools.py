@@ -0,0 +1,176 @@
+# School districts (学区)
+#
+# primary_school and middle_school are free text on communities, possibly
+# naming several schools ("徐汇实验小学、汇师小学"). Each name is stored
+# once in schools, keyed by a normalised form, and community_schools links
+# it to the communities that list it, so "listings for school X" is an
+# index lookup school -> communities -> properties instead of a scan with
+# string matching. Links are rewritten whenever a community's school
+# columns are written: by crud, the importer and the migration backfill.
+import re
+import unicodedata
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app import models
+
+# Level -> community column naming schools of that level
+LEVEL_COLUMNS = {"primary": "primary_school", "middle": "middle_school"}
+
+NAME_SEPARATORS = re.compile(r"[,，、;；/|\n]+")
+
+# Communities relinked per statement, well within SQLite's variable limit
+LINK_BATCH_SIZE = 500
+
+
+def split_school_names(value: Optional[str]) -> List[str]:
+    """School names in a primary_school/middle_school value."""
+    if not value:
+        return []
+    return [name.strip() for name in NAME_SEPARATORS.split(value) if name.strip()]
+
+
+def school_key(name: str) -> str:
+    """Full-width forms, case and whitespace folded, so spelling variants meet."""
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", name)).casefold()
+
+
+def school_links(primary_school: Optional[str], middle_school: Optional[str]) -> Set[Tuple[str, str, str]]:
+    """(level, key, name) of every school named by a community's columns."""
+    links = set()
+    for level, value in (("primary", primary_school), ("middle", middle_school)):
+        for name in split_school_names(value):
+            links.add((level, school_key(name), name))
+    return links
+
+
+# ============ Maintenance ============
+
+def school_ids(db: Session, names: Dict[str, str]) -> Dict[str, int]:
+    """Ids of the schools with the given keys ({key: name}), creating missing ones."""
+    if not names:
+        return {}
+    db.execute(
+        insert(models.School)
+        .values([{"key": key, "name": name} for key, name in names.items()])
+        .on_conflict_do_nothing(index_elements=["key"])
+    )
+    rows = db.execute(select(models.School.key, models.School.id).where(models.School.key.in_(names)))
+    return dict(rows.all())
+
+
+def _link_batch(db: Session, communities: list) -> int:
+    links = {row.id: school_links(row.primary_school, row.middle_school) for row in communities}
+    db.query(models.CommunitySchool).filter(
+        models.CommunitySchool.community_id.in_(list(links))
+    ).delete(synchronize_session=False)
+
+    names = {key: name for community in links.values() for _, key, name in community}
+    ids = school_ids(db, names)
+    values = [
+        {"community_id": community_id, "school_id": ids[key], "level": level}
+        for community_id, community in links.items()
+        for level, key, _ in community
+    ]
+    if values:
+        db.execute(insert(models.CommunitySchool), values)
+    return len(values)
+
+
+def link_communities(db: Session, communities: Iterable) -> int:
+    """
+    Replace the school links of communities (rows with id, primary_school
+    and middle_school). Does not commit; returns the number of links.
+    """
+    communities = iter(communities)
+    linked = 0
+    while True:
+        batch = list(islice(communities, LINK_BATCH_SIZE))
+        if not batch:
+            return linked
+        linked += _link_batch(db, batch)
+
+
+def link_community(db: Session, community: models.Community):
+    """Rewrite one community's links after its school columns changed. Does not commit."""
+    db.flush()
+    link_communities(db, [community])
+
+
+def backfill(db: Session) -> int:
+    """Rebuild every link from the communities table; returns the number of links."""
+    db.query(models.CommunitySchool).delete(synchronize_session=False)
+    rows = db.query(
+        models.Community.id, models.Community.primary_school, models.Community.middle_school
+    ).yield_per(LINK_BATCH_SIZE)
+    return link_communities(db, rows)
+
+
+# ============ Lookups ============
+
+def matching_school_ids(name: str):
+    """
+    Subquery of the schools a name refers to: the exact school if there is
+    one, otherwise every school whose name starts with it ("徐汇实验" finds
+    徐汇实验小学). Both are ranges on the unique key index.
+    """
+    School = models.School
+    key = school_key(name)
+    exact = select(School.id).where(School.key == key).exists()
+    return (
+        select(School.id)
+        .where(School.key >= key, School.key < key + "\U0010ffff")
+        .where((School.key == key) | ~exact)
+    )
+
+
+def community_ids_for_school(name: str):
+    """Subquery of the ids of communities linked to the schools a name refers to."""
+    return (
+        select(models.CommunitySchool.community_id)
+        .where(models.CommunitySchool.school_id.in_(matching_school_ids(name)))
+    )
+
+
+SCHOOL_STATS_SQL = """
+WITH links AS (
+    SELECT DISTINCT school_id, community_id FROM community_schools
+    {level_filter}
+),
+counts AS (
+    SELECT links.school_id,
+           COUNT(DISTINCT links.community_id) AS community_count,
+           COUNT(p.id) AS property_count
+    FROM links LEFT JOIN properties p ON p.community_id = links.community_id
+    GROUP BY links.school_id
+),
+ranked AS (
+    SELECT links.school_id, p.price_per_sqm AS value,
+           ROW_NUMBER() OVER (PARTITION BY links.school_id ORDER BY p.price_per_sqm) AS position,
+           COUNT(*) OVER (PARTITION BY links.school_id) AS total
+    FROM links JOIN properties p ON p.community_id = links.community_id
+    WHERE p.price_per_sqm IS NOT NULL
+),
+medians AS (
+    SELECT school_id, AVG(value) AS median_price_per_sqm
+    FROM ranked
+    WHERE position IN ((total + 1) / 2, (total + 2) / 2)
+    GROUP BY school_id
+)
+SELECT s.id, s.name, counts.community_count, counts.property_count, medians.median_price_per_sqm
+FROM counts
+JOIN schools s ON s.id = counts.school_id
+LEFT JOIN medians ON medians.school_id = counts.school_id
+ORDER BY counts.property_count DESC, s.name
+"""
+
+
+def school_stats(db: Session, level: Optional[str] = None) -> List[dict]:
+    """Communities, properties and median price per m² of every linked school."""
+    level_filter = "WHERE level = :level" if level else ""
+    rows = db.execute(text(SCHOOL_STATS_SQL.format(level_filter=level_filter)), {"level": level})
+    return [dict(row) for row in rows.mappings()]
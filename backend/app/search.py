@@ -0,0 +1,188 @@
+# Full-text search
+#
+# communities_fts and properties_fts are FTS5 indexes over the searchable
+# text columns, using the content of the base tables (external content) and
+# kept in sync by triggers, so every write path - crud, the importer's bulk
+# inserts, cascaded deletes - updates them without extra code.
+#
+# The trigram tokenizer matches any substring of three or more characters,
+# which suits Chinese text with no word boundaries. Shorter terms (two
+# character names like 徐汇 are common) cannot use the index and fall back
+# to LIKE on the base tables.
+#
+# Results are paginated with skip/limit like the other list endpoints.
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.config import settings
+
+MIN_INDEXED_TERM = 3
+
+SNIPPET_WIDTH = 32
+
+# (table, indexed columns, bm25 weights)
+SEARCH_INDEXES = {
+    "community": ("communities", ("name", "address", "metro", "primary_school", "middle_school"),
+                  (10.0, 4.0, 2.0, 2.0, 2.0)),
+    "property": ("properties", ("notes",), (1.0,)),
+}
+
+SEARCH_KINDS = tuple(SEARCH_INDEXES)
+
+TEXT_COLUMNS = max(len(columns) for _, columns, _ in SEARCH_INDEXES.values())
+
+
+# ============ Index ============
+
+def create_index(conn: Connection, kind: str):
+    """Create the FTS table and sync triggers of one kind and fill it from its table."""
+    table, columns, _ = SEARCH_INDEXES[kind]
+    fts = f"{table}_fts"
+    names = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    delete_old = f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values});"
+    insert_new = f"INSERT INTO {fts} (rowid, {names}) VALUES (new.id, {new_values});"
+
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{names}, content='{table}', content_rowid='id', tokenize='trigram')"
+    ))
+    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN {insert_new} END"))
+    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN {delete_old} END"))
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON {table} "
+        f"BEGIN {delete_old} {insert_new} END"
+    ))
+    conn.execute(text(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')"))
+
+
+# ============ Queries ============
+
+def split_terms(q: str) -> Tuple[List[str], List[str]]:
+    """Split a query into terms the index can match and terms too short for it."""
+    indexed, short = [], []
+    for term in q.split():
+        (indexed if len(term) >= MIN_INDEXED_TERM else short).append(term)
+    return indexed, short
+
+
+def match_expression(terms: List[str]) -> str:
+    """All terms, each as a quoted phrase so FTS5 query syntax in them is literal."""
+    return " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def snippet(texts: List[Optional[str]], terms: List[str], width: int = SNIPPET_WIDTH) -> Optional[str]:
+    """The stretch of the first text containing a term, around its first occurrence."""
+    for value in texts:
+        if not value:
+            continue
+        folded = value.casefold()
+        positions = [folded.find(term.casefold()) for term in terms]
+        positions = [position for position in positions if position >= 0]
+        if positions:
+            start = max(min(positions) - width // 2, 0)
+            end = start + width
+            return ("…" if start else "") + value[start:end] + ("…" if end < len(value) else "")
+    return None
+
+
+def _hits_filter(kind: str, indexed: List[str], short: List[str], params: dict) -> Tuple[str, str, str]:
+    """(FROM, hit id column, WHERE) selecting kind's hits for the terms."""
+    table, columns, _ = SEARCH_INDEXES[kind]
+    fts = f"{table}_fts"
+    conditions = []
+
+    for i, term in enumerate(short):
+        key = f"{kind}_short_{i}"
+        params[key] = _like_pattern(term)
+        conditions.append(
+            "(" + " OR ".join(f"t.{column} LIKE :{key} ESCAPE '\\'" for column in columns) + ")"
+        )
+
+    if not indexed:
+        return f"{table} t", "t.id", " AND ".join(conditions)
+
+    params[f"{kind}_match"] = match_expression(indexed)
+    conditions.insert(0, f"{fts} MATCH :{kind}_match")
+    source = f"{fts} JOIN {table} t ON t.id = {fts}.rowid" if short else fts
+    return source, f"{fts}.rowid", " AND ".join(conditions)
+
+
+def _kind_select(kind: str, source: str, hit_id: str, where: str, ranked: bool) -> str:
+    """
+    SELECT of kind's best skip + limit hits with their rows.
+
+    The hits are picked on the index alone and only those are joined to
+    their rows, so a common term costs one pass over its matches rather
+    than a join per match.
+    """
+    table, columns, weights = SEARCH_INDEXES[kind]
+    rank = f"bm25({table}_fts, {', '.join(map(str, weights))})" if ranked else "0.0"
+    hits = f"SELECT {hit_id} AS id, {rank} AS rank FROM {source} WHERE {where} ORDER BY rank, id DESC LIMIT :window"
+
+    # Padded to the same width for every kind, as UNION ALL requires
+    texts = ", ".join(
+        f"t.{columns[i]} AS text_{i}" if i < len(columns) else f"NULL AS text_{i}"
+        for i in range(TEXT_COLUMNS)
+    )
+    if kind == "community":
+        return (
+            f"SELECT 'community' AS kind, t.id AS id, t.id AS community_id, t.name AS title, "
+            f"t.district AS district, {texts}, hits.rank AS rank "
+            f"FROM ({hits}) hits JOIN {table} t ON t.id = hits.id"
+        )
+    return (
+        f"SELECT 'property' AS kind, t.id AS id, t.community_id AS community_id, "
+        f"c.name || COALESCE(' ' || t.building || '-' || t.room, '') AS title, "
+        f"c.district AS district, {texts}, hits.rank AS rank "
+        f"FROM ({hits}) hits JOIN {table} t ON t.id = hits.id JOIN communities c ON c.id = t.community_id"
+    )
+
+
+def search(db: Session, q: str, kind: Optional[str] = None, skip: int = 0, limit: int = 20) -> Tuple[List[dict], int]:
+    """
+    Hits for q across communities and properties, and their total.
+
+    Every whitespace-separated term must occur. Best matches come first
+    (bm25, weighted towards community names). Scoring costs time per
+    match, so hits found only through short terms, and those of a kind
+    with more than SEARCH_RANK_MAX_HITS matches, are not scored and
+    follow newest first.
+    """
+    indexed, short = split_terms(q)
+    if not indexed and not short:
+        return [], 0
+
+    params = {"limit": limit, "skip": skip, "window": skip + limit}
+    selects, total = [], 0
+    for name in ([kind] if kind else SEARCH_KINDS):
+        source, hit_id, where = _hits_filter(name, indexed, short, params)
+        count = db.execute(text(f"SELECT COUNT(*) FROM {source} WHERE {where}"), params).scalar()
+        if not count:
+            continue
+        total += count
+        ranked = bool(indexed) and count <= settings.SEARCH_RANK_MAX_HITS
+        # Compound SELECT members cannot carry their own ORDER BY/LIMIT
+        selects.append(f"SELECT * FROM ({_kind_select(name, source, hit_id, where, ranked)})")
+
+    if not total:
+        return [], 0
+    rows = db.execute(
+        text(f"{' UNION ALL '.join(selects)} ORDER BY rank, kind, id DESC LIMIT :limit OFFSET :skip"), params
+    ).mappings()
+
+    items = []
+    for row in rows:
+        item = {key: row[key] for key in ("kind", "id", "community_id", "title", "district", "rank")}
+        item["snippet"] = snippet([row[f"text_{i}"] for i in range(TEXT_COLUMNS)], indexed + short)
+        items.append(item)
+    return items, total
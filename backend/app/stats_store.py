@@ -0,0 +1,248 @@
+# Incrementally maintained dashboard statistics
+#
+# district_stats holds running counts and sums per district. Every write
+# path applies its delta inside its own transaction, so reading the stats
+# costs one row per district instead of aggregating the whole tables.
+# Sums are floats and may drift by rounding over many updates; rebuild()
+# recomputes them from scratch.
+#
+# Two numbers differ from the communities LEFT JOIN properties GROUP BY
+# district that /api/stats used to run. A district's community_count counts
+# each community once rather than once per property, so the districts add
+# up to total_communities. Communities with an empty and with no district
+# share one "未知" row rather than being listed as two.
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import models
+
+COUNTERS = (
+    "community_count", "property_count",
+    "price_sum", "price_count",
+    "rent_sum", "rent_count",
+    "rent_ratio_sum", "rent_ratio_count",
+)
+
+# Tolerance for float sums in check()
+SUM_TOLERANCE = 1e-6
+
+
+def district_key(district: Optional[str]) -> str:
+    """Communities without a district are counted under an empty key."""
+    return district or ""
+
+
+def empty_delta() -> Dict[str, float]:
+    return dict.fromkeys(COUNTERS, 0)
+
+
+def property_delta(price: Optional[float], rent: Optional[float], rent_ratio: Optional[float], sign: int = 1) -> Dict[str, float]:
+    """Contribution of one property to its district's counters."""
+    delta = empty_delta()
+    delta["property_count"] = sign
+    for name, value in (("price", price), ("rent", rent), ("rent_ratio", rent_ratio)):
+        if value is not None:
+            delta[f"{name}_sum"] = sign * value
+            delta[f"{name}_count"] = sign
+    return delta
+
+
+def apply_delta(db: Session, district: Optional[str], delta: Dict[str, float]):
+    """Add delta to a district's counters, creating its row if needed."""
+    if not any(delta.values()):
+        return
+
+    key = district_key(district)
+    stats = models.DistrictStats
+    updated = db.query(stats).filter(stats.district == key).update(
+        {getattr(stats, name): getattr(stats, name) + value for name, value in delta.items() if value},
+        synchronize_session=False
+    )
+    if not updated:
+        db.add(stats(district=key, **delta))
+        db.flush()
+
+
+def community_properties_delta(db: Session, community_id: int, sign: int = 1) -> Dict[str, float]:
+    """Combined contribution of all properties of a community."""
+    p = models.Property
+    row = db.query(
+        func.count(p.id),
+        func.coalesce(func.sum(p.price), 0), func.count(p.price),
+        func.coalesce(func.sum(p.rent), 0), func.count(p.rent),
+        func.coalesce(func.sum(p.rent_ratio), 0), func.count(p.rent_ratio),
+    ).filter(p.community_id == community_id).one()
+
+    delta = empty_delta()
+    for name, value in zip(COUNTERS[1:], row):
+        delta[name] = sign * value
+    return delta
+
+
+# ============ Write Hooks ============
+
+def property_added(db: Session, community_id: int, price, rent, rent_ratio, sign: int = 1):
+    """Count a property in (or, with sign=-1, out of) its community's district."""
+    # Lookup by primary key, so a property of a missing community is skipped
+    community = db.get(models.Community, community_id)
+    if community is not None:
+        apply_delta(db, community.district, property_delta(price, rent, rent_ratio, sign))
+
+
+def property_removed(db: Session, community_id: int, price, rent, rent_ratio):
+    property_added(db, community_id, price, rent, rent_ratio, sign=-1)
+
+
+def community_added(db: Session, district: Optional[str]):
+    delta = empty_delta()
+    delta["community_count"] = 1
+    apply_delta(db, district, delta)
+
+
+def community_removed(db: Session, community_id: int, district: Optional[str]):
+    """Remove a community and, as deletes cascade, all of its properties."""
+    delta = community_properties_delta(db, community_id, sign=-1)
+    delta["community_count"] = -1
+    apply_delta(db, district, delta)
+
+
+def community_moved(db: Session, community_id: int, old_district: Optional[str], new_district: Optional[str]):
+    """Move a community and its properties to another district."""
+    if district_key(old_district) == district_key(new_district):
+        return
+    delta = community_properties_delta(db, community_id)
+    delta["community_count"] = 1
+    apply_delta(db, old_district, {name: -value for name, value in delta.items()})
+    apply_delta(db, new_district, delta)
+
+
+def communities_imported(db: Session, districts: Iterable[Optional[str]]):
+    """Count a batch of newly inserted communities."""
+    counts = defaultdict(int)
+    for district in districts:
+        counts[district_key(district)] += 1
+    for key, count in counts.items():
+        delta = empty_delta()
+        delta["community_count"] = count
+        apply_delta(db, key, delta)
+
+
+def properties_imported(db: Session, rows: Iterable):
+    """Count a batch of newly inserted properties (community_id, price, rent, rent_ratio)."""
+    by_community = defaultdict(empty_delta)
+    for row in rows:
+        delta = by_community[row.community_id]
+        for name, value in property_delta(row.price, row.rent, row.rent_ratio).items():
+            delta[name] += value
+
+    if not by_community:
+        return
+
+    districts = dict(
+        db.query(models.Community.id, models.Community.district)
+        .filter(models.Community.id.in_(by_community.keys()))
+        .all()
+    )
+    by_district = defaultdict(empty_delta)
+    for community_id, delta in by_community.items():
+        if community_id not in districts:
+            continue
+        total = by_district[district_key(districts[community_id])]
+        for name, value in delta.items():
+            total[name] += value
+
+    for key, delta in by_district.items():
+        apply_delta(db, key, delta)
+
+
+# ============ Reads ============
+
+def stats_from_rows(rows: List[models.DistrictStats]) -> dict:
+    """Build the StatsResponse payload from per-district counters."""
+    totals = empty_delta()
+    for row in rows:
+        for name in COUNTERS:
+            totals[name] += getattr(row, name)
+
+    def average(total: float, count: int) -> Optional[float]:
+        return total / count if count else None
+
+    return {
+        "total_communities": int(totals["community_count"]),
+        "total_properties": int(totals["property_count"]),
+        "average_price": average(totals["price_sum"], totals["price_count"]),
+        "average_rent": average(totals["rent_sum"], totals["rent_count"]),
+        "average_rent_ratio": average(totals["rent_ratio_sum"], totals["rent_ratio_count"]),
+        "district_stats": [
+            {
+                "district": row.district or "未知",
+                "community_count": row.community_count,
+                "property_count": row.property_count,
+                "average_price": average(row.price_sum, row.price_count)
+            }
+            for row in rows
+            if row.community_count or row.property_count
+        ]
+    }
+
+
+def read_stats(db: Session) -> dict:
+    """Dashboard stats from the summary table, O(districts)."""
+    rows = db.query(models.DistrictStats).order_by(models.DistrictStats.district).all()
+    return stats_from_rows(rows)
+
+
+# ============ Rebuild and Check ============
+
+def compute_from_tables(db: Session) -> Dict[str, Dict[str, float]]:
+    """Aggregate the counters per district from the communities and properties tables."""
+    c = models.Community
+    p = models.Property
+    result = defaultdict(empty_delta)
+
+    for district, count in db.query(c.district, func.count(c.id)).group_by(c.district):
+        result[district_key(district)]["community_count"] += count
+
+    property_rows = db.query(
+        c.district,
+        func.count(p.id),
+        func.coalesce(func.sum(p.price), 0), func.count(p.price),
+        func.coalesce(func.sum(p.rent), 0), func.count(p.rent),
+        func.coalesce(func.sum(p.rent_ratio), 0), func.count(p.rent_ratio),
+    ).join(c, c.id == p.community_id).group_by(c.district)
+
+    for district, *values in property_rows:
+        counters = result[district_key(district)]
+        for name, value in zip(COUNTERS[1:], values):
+            counters[name] += value
+
+    return dict(result)
+
+
+def rebuild(db: Session):
+    """Recompute district_stats from scratch. Does not commit."""
+    db.query(models.DistrictStats).delete(synchronize_session=False)
+    for key, counters in compute_from_tables(db).items():
+        db.add(models.DistrictStats(district=key, **counters))
+    db.flush()
+
+
+def check(db: Session) -> List[str]:
+    """Compare district_stats with a full aggregation; return the mismatches."""
+    expected = compute_from_tables(db)
+    actual = {
+        row.district: {name: getattr(row, name) for name in COUNTERS}
+        for row in db.query(models.DistrictStats)
+    }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        want = expected.get(key, empty_delta())
+        have = actual.get(key, empty_delta())
+        for name in COUNTERS:
+            if abs(want[name] - have[name]) > SUM_TOLERANCE * max(1, abs(want[name])):
+                mismatches.append(f"{key or '未知'}.{name}: expected {want[name]}, stored {have[name]}")
+    return mismatches
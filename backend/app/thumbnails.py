@@ -0,0 +1,150 @@
+# Photo thumbnails
+#
+# Each uploaded photo gets resized copies at THUMBNAIL_WIDTHS, in its own
+# format and as WebP, stored next to the original as
+# <stem>.w<width>.<ext>. They are generated on a process pool right after
+# upload, and any that are missing are generated on first request.
+# Requires Pillow; without it every size falls back to the original.
+import asyncio
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+from app.config import settings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Formats a thumbnail can be requested in; "original" keeps the photo's type
+THUMBNAIL_FORMATS = ("original", "webp")
+
+# Source extensions and the format their same-type thumbnails are saved in
+SOURCE_FORMATS = {
+    ".jpg": ("JPEG", ".jpg"),
+    ".jpeg": ("JPEG", ".jpg"),
+    ".png": ("PNG", ".png"),
+    ".webp": ("WEBP", ".webp"),
+    # Only the first frame of an animation is kept
+    ".gif": ("PNG", ".png"),
+}
+
+# Name prefix of thumbnails being written
+TEMP_PREFIX = ".thumb-"
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def is_thumbnail_source(path: Path) -> bool:
+    return path.suffix.lower() in SOURCE_FORMATS
+
+
+def thumbnail_path(source: Path, width: int, fmt: str = "original") -> Path:
+    ext = ".webp" if fmt == "webp" else SOURCE_FORMATS[source.suffix.lower()][1]
+    return source.with_name(f"{source.stem}.w{width}{ext}")
+
+
+def derivative_paths(source: Path) -> List[Path]:
+    """Every thumbnail path a photo can have, whether generated or not."""
+    if not is_thumbnail_source(source):
+        return []
+    return [
+        thumbnail_path(source, width, fmt)
+        for width in settings.THUMBNAIL_WIDTHS
+        for fmt in THUMBNAIL_FORMATS
+    ]
+
+
+# ============ Resizing (runs in worker processes) ============
+
+def _save_atomic(image, destination: Path, pil_format: str):
+    fd, tmp = tempfile.mkstemp(dir=destination.parent, prefix=TEMP_PREFIX, suffix=destination.suffix)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            options = {"quality": settings.THUMBNAIL_QUALITY} if pil_format in ("JPEG", "WEBP") else {}
+            image.save(file, pil_format, **options)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, destination)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def render_thumbnails(source: str, widths: List[int], formats: List[str]) -> List[str]:
+    """Write the thumbnails of source at widths in formats; return their paths."""
+    source = Path(source)
+    written = []
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        pil_format = SOURCE_FORMATS[source.suffix.lower()][0]
+        if pil_format == "JPEG" and original.mode not in ("RGB", "L"):
+            original = original.convert("RGB")
+        elif original.mode == "P":
+            original = original.convert("RGBA")
+
+        for width in sorted(widths, reverse=True):
+            image = original.copy()
+            # Never upscales; keeps the aspect ratio
+            image.thumbnail((width, width * 10), Image.LANCZOS)
+            for fmt in formats:
+                destination = thumbnail_path(source, width, fmt)
+                _save_atomic(image, destination, "WEBP" if fmt == "webp" else pil_format)
+                written.append(str(destination))
+    return written
+
+
+# ============ Scheduling ============
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS)
+    return _pool
+
+
+def _log_failure(future):
+    error = future.exception()
+    if error is not None:
+        logger.warning("Thumbnail generation failed: %s", error)
+
+
+def enqueue(source: Path):
+    """Generate all thumbnails of a freshly uploaded photo in the background."""
+    if not available() or not is_thumbnail_source(source):
+        return
+    future = _get_pool().submit(
+        render_thumbnails, str(source), list(settings.THUMBNAIL_WIDTHS), list(THUMBNAIL_FORMATS)
+    )
+    future.add_done_callback(_log_failure)
+
+
+async def ensure_thumbnail(source: Path, width: int, fmt: str) -> Path:
+    """
+    Path of a thumbnail, generating it first if it does not exist yet.
+
+    Falls back to the source if it cannot be decoded as an image.
+    """
+    destination = thumbnail_path(source, width, fmt)
+    if not destination.exists():
+        future = _get_pool().submit(render_thumbnails, str(source), [width], [fmt])
+        try:
+            await asyncio.wrap_future(future)
+        except Exception as error:
+            logger.warning("Thumbnail of %s failed: %s", source.name, error)
+            return source
+    return destination
+
+
+def shutdown():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,172 @@
+# Streaming multipart uploads
+#
+# The request body is parsed as it arrives and the file part is written to
+# a temp file in the destination directory, in UPLOAD_CHUNK_SIZE blocks on
+# a worker thread. Memory per upload is bounded by the chunk size, the size
+# limit is enforced while receiving, and the file only appears under its
+# final name, through an atomic rename, once it is complete. The SHA-256
+# of the content is computed on the way through.
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from fastapi import HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import settings
+
+# Permissions of stored uploads; temp files are created owner-only
+FILE_MODE = 0o644
+
+# Name prefix of uploads still being received
+TEMP_PREFIX = ".upload-"
+
+# Allowance for multipart boundaries and part headers in Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+@dataclass
+class ReceivedFile:
+    path: Path
+    filename: str
+    size: int
+    sha256: str
+
+
+def too_large(max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large. Maximum size is {max_size // (1024 * 1024)} MB"
+    )
+
+
+def _write_block(file, sha256, data: bytes):
+    sha256.update(data)
+    file.write(data)
+
+
+class _FilePartWriter:
+    """Collects the bytes of one multipart file field between parser writes."""
+
+    def __init__(self, field: str):
+        self.field = field.encode("latin-1")
+        self.headers = {}
+        self.header_field = b""
+        self.header_value = b""
+        self.in_file = False
+        self.filename: Optional[str] = None
+        self.started = False
+        self.finished = False
+        self.buffer = bytearray()
+        self.size = 0
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self.headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        # Only the first matching file field is taken
+        self.in_file = (
+            not self.started
+            and options.get(b"name") == self.field
+            and b"filename" in options
+        )
+        if self.in_file:
+            self.started = True
+            self.filename = options[b"filename"].decode("utf-8", errors="replace")
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.in_file:
+            self.buffer += data[start:end]
+            self.size += end - start
+
+    def on_part_end(self):
+        if self.in_file:
+            self.in_file = False
+            self.finished = True
+
+
+async def receive_file(
+    request: Request,
+    directory: Path,
+    max_size: int,
+    validate: Optional[Callable[[str], object]] = None,
+    field: str = "file"
+) -> ReceivedFile:
+    """
+    Stream the file field of a multipart request into a temp file in directory.
+
+    validate is called with the client filename before any data is written
+    and may raise HTTPException. The caller must move the temp file into
+    place or remove it.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size + MULTIPART_OVERHEAD:
+        raise too_large(max_size)
+
+    part = _FilePartWriter(field)
+    parser = MultipartParser(params[b"boundary"], part.callbacks())
+    tmp = None
+    sha256 = hashlib.sha256()
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+
+            if part.started and tmp is None:
+                if validate is not None:
+                    validate(part.filename)
+                tmp = await run_in_threadpool(
+                    tempfile.NamedTemporaryFile, dir=directory, prefix=TEMP_PREFIX, delete=False
+                )
+
+            if part.size > max_size:
+                raise too_large(max_size)
+            if part.buffer and (len(part.buffer) >= settings.UPLOAD_CHUNK_SIZE or part.finished):
+                await run_in_threadpool(_write_block, tmp, sha256, bytes(part.buffer))
+                part.buffer.clear()
+
+            if part.finished:
+                break
+
+        parser.finalize()
+        if tmp is None or not part.finished:
+            raise HTTPException(status_code=400, detail=f"Missing file field '{field}'")
+        await run_in_threadpool(tmp.close)
+    except BaseException:
+        if tmp is not None:
+            tmp.close()
+            os.unlink(tmp.name)
+        raise
+
+    return ReceivedFile(path=Path(tmp.name), filename=part.filename, size=part.size, sha256=sha256.hexdigest())
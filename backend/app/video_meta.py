@@ -0,0 +1,151 @@
+# Video posters and metadata
+#
+# After a video upload, a worker runs ffprobe for duration, dimensions and
+# bitrate and ffmpeg for a poster frame, stored next to the video as
+# <stem>.poster.jpg and a <stem>.meta.json sidecar. Needs ffmpeg/ffprobe on
+# PATH; without them videos simply have no poster or metadata.
+import asyncio
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Name prefixes of posters and sidecars being written
+TEMP_PREFIXES = (".poster-", ".meta-")
+
+# The work happens in ffmpeg subprocesses, so threads are enough
+_executor = ThreadPoolExecutor(max_workers=settings.VIDEO_WORKERS, thread_name_prefix="video-meta")
+
+
+def available() -> bool:
+    return shutil.which("ffprobe") is not None and shutil.which("ffmpeg") is not None
+
+
+def poster_path(video: Path) -> Path:
+    return video.with_name(f"{video.stem}.poster.jpg")
+
+
+def sidecar_path(video: Path) -> Path:
+    return video.with_name(f"{video.stem}.meta.json")
+
+
+def derivative_paths(video: Path) -> List[Path]:
+    return [poster_path(video), sidecar_path(video)]
+
+
+def read_sidecar(video: Path) -> Optional[dict]:
+    try:
+        return json.loads(sidecar_path(video).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+# ============ ffprobe / ffmpeg ============
+
+def probe(video: Path) -> dict:
+    """Duration (s), dimensions and bitrate (bit/s) of a video."""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", str(video)],
+        capture_output=True, check=True, timeout=settings.VIDEO_TOOL_TIMEOUT
+    )
+    info = json.loads(result.stdout)
+    fmt = info.get("format", {})
+    stream = next((s for s in info.get("streams", []) if s.get("codec_type") == "video"), {})
+
+    def number(value, cast):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        "duration": number(fmt.get("duration") or stream.get("duration"), float),
+        "width": number(stream.get("width"), int),
+        "height": number(stream.get("height"), int),
+        "bitrate": number(fmt.get("bit_rate") or stream.get("bit_rate"), int),
+        "codec": stream.get("codec_name"),
+    }
+
+
+def extract_poster(video: Path, duration: Optional[float]) -> Optional[Path]:
+    """Grab a frame a little way in, scaled down to at most POSTER_WIDTH."""
+    # Skip black lead-in frames, but stay inside short clips
+    at = min(3.0, duration / 10) if duration else 0
+    destination = poster_path(video)
+    fd, tmp = tempfile.mkstemp(dir=video.parent, prefix=TEMP_PREFIXES[0], suffix=".jpg")
+    os.close(fd)
+    try:
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-y", "-ss", f"{at:.3f}", "-i", str(video),
+             "-frames:v", "1", "-vf", f"scale='min({settings.POSTER_WIDTH},iw)':-2", "-q:v", "3", tmp],
+            capture_output=True, check=True, timeout=settings.VIDEO_TOOL_TIMEOUT
+        )
+        if os.path.getsize(tmp) == 0:
+            os.unlink(tmp)
+            return None
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, destination)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return destination
+
+
+def process(video: Path) -> dict:
+    """Probe a video, extract its poster and write the sidecar."""
+    metadata = probe(video)
+    poster = extract_poster(video, metadata["duration"])
+    metadata["poster"] = poster.name if poster else None
+
+    fd, tmp = tempfile.mkstemp(dir=video.parent, prefix=TEMP_PREFIXES[1], suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        json.dump(metadata, file)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, sidecar_path(video))
+    return metadata
+
+
+# ============ Scheduling ============
+
+def _log_failure(future: Future):
+    error = future.exception()
+    if error is not None:
+        logger.warning("Video metadata extraction failed: %s", error)
+
+
+def enqueue(video: Path) -> Optional[Future]:
+    if not available():
+        return None
+    future = _executor.submit(process, video)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+async def wait_for_metadata(future: Optional[Future]) -> Optional[dict]:
+    """
+    The result of an enqueued job if it finishes within VIDEO_META_WAIT_SECONDS.
+
+    Otherwise None; the job keeps running and its sidecar appears later.
+    """
+    if future is None:
+        return None
+    try:
+        return await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(future)), settings.VIDEO_META_WAIT_SECONDS
+        )
+    except Exception:
+        return None
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
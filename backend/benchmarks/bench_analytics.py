@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Compare the NumPy analytics snapshot with the equivalent SQL for /api/stats/distribution.
+
+Times the first (full) snapshot load, an incremental refresh after a few
+writes, and a distribution from the snapshot against the same figures
+computed in SQL. Exits non-zero if the two disagree.
+
+Usage:
+    python benchmarks/bench_analytics.py [--rows 100000]
+"""
+import argparse
+import math
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app import analytics, crud, importer, schemas
+from app.database import make_engine
+from app.migrations import run_migrations
+
+REPEAT = 10
+
+DISTRICTS = ["浦东新区", "静安区", "徐汇区", "黄浦区", "长宁区", "普陀区", "虹口区", "杨浦区",
+             "闵行区", "宝山区", "嘉定区", "松江区", "青浦区", "奉贤区", "金山区", "崇明区"]
+
+
+def seed(db, count: int):
+    rng = random.Random(1)
+    communities = max(count // 20, 1)
+    rows = (
+        (f"小区{i}", DISTRICTS[i % len(DISTRICTS)], None, None, None, 2000 + i % 20, None, None, None, None, None)
+        for i in range(communities)
+    )
+    importer.import_communities(db, enumerate(rows, start=2))
+    rows = (
+        (f"小区{i % communities}", "1", "1", str(i), round(rng.uniform(30, 200), 1), "2室1厅", None, None, None,
+         round(rng.uniform(150, 2000)), round(rng.uniform(2000, 20000)) if i % 4 else None, None, None, None)
+        for i in range(count)
+    )
+    importer.import_properties(db, enumerate(rows, start=2))
+    # As if imported a while ago, so the incremental refresh only sees write_some()
+    db.execute(text("UPDATE properties SET updated_at = datetime(updated_at, '-1 hour')"))
+    db.commit()
+
+
+def write_some(db):
+    """A few edits, a delete and a district move, through the regular crud paths."""
+    for property_id in (1, 2, 3):
+        crud.update_property(db, property_id, schemas.PropertyUpdate(community_id=1, price=999, area=99))
+    crud.delete_property(db, 4)
+    crud.update_community(db, 2, schemas.CommunityUpdate(name="小区1", district="崇明区"))
+
+
+def same(a, b, path="") -> bool:
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same(a[key], b[key], f"{path}.{key}") for key in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(same(x, y, f"{path}[{i}]") for i, (x, y) in enumerate(zip(a, b)))
+    if isinstance(a, float) and isinstance(b, float):
+        if math.isclose(a, b, rel_tol=1e-9):
+            return True
+    elif a == b:
+        return True
+    print(f"mismatch at {path}: {a!r} != {b!r}")
+    return False
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    if analytics.np is None:
+        sys.exit("NumPy is not installed; /api/stats/distribution falls back to SQL")
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{tmp}/bench.db")
+        run_migrations(engine)
+        db = sessionmaker(bind=engine)()
+        start = time.perf_counter()
+        seed(db, args.rows)
+        print(f"seeded {args.rows} properties in {time.perf_counter() - start:.1f}s")
+
+        snapshot = analytics.Snapshot()
+        start = time.perf_counter()
+        snapshot.refresh(db)
+        print(f"full snapshot load          {(time.perf_counter() - start) * 1000:>8.2f} ms")
+
+        write_some(db)
+        start = time.perf_counter()
+        snapshot.refresh(db)
+        print(f"incremental refresh         {(time.perf_counter() - start) * 1000:>8.2f} ms")
+
+        for label, filters in (("all districts", {}), ("one district", {"district": "静安区"}),
+                               ("one community", {"community_id": 7})):
+            failures += not same(snapshot.distribution(**filters), analytics.sql_distribution(db, **filters))
+            numpy_ms = timed(lambda: snapshot.distribution(**filters))
+            sql_ms = timed(lambda: analytics.sql_distribution(db, **filters))
+            print(f"{label:<16} numpy {numpy_ms:>8.2f} ms   sql {sql_ms:>8.2f} ms")
+
+        db.close()
+        engine.dispose()
+
+    if failures:
+        print(f"{failures} distribution(s) differ between the snapshot and SQL")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark Excel import throughput: per-row crud path vs bulk importer.
+
+Usage:
+    python benchmarks/bench_import.py [--rows 5000]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, importer, schemas
+from app.database import Base
+
+
+def make_rows(count: int):
+    """Build raw sheet rows shaped like the community template."""
+    return [
+        (
+            f"小区{i}", "浦东新区", f"XX路{i}号", "2.5元/平/月", "地上50个",
+            2015, "地铁9号线, 商场", "明珠小学", "明珠中学", 8, "小区环境好"
+        )
+        for i in range(count)
+    ]
+
+
+def per_row_import(db, rows):
+    """The original import loop: one create_community (commit + refresh) per row."""
+    for row in rows:
+        data = importer.parse_community_row(row)
+        crud.create_community(db, schemas.CommunityCreate(**data))
+
+
+def bulk_import(db, rows):
+    importer.import_communities(db, enumerate(rows, start=2))
+
+
+def run(label: str, func, rows) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        try:
+            start = time.perf_counter()
+            func(db, rows)
+            elapsed = time.perf_counter() - start
+        finally:
+            db.close()
+            engine.dispose()
+
+    rate = len(rows) / elapsed
+    print(f"{label:<10} {len(rows):>7} rows  {elapsed:8.2f}s  {rate:10.0f} rows/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    before = run("per-row", per_row_import, rows)
+    after = run("bulk", bulk_import, rows)
+    print(f"speedup    {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
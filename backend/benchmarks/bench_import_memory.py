@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Measure peak RSS of a streaming community import for growing sheet sizes.
+
+Each size runs in a fresh subprocess so peak RSS is not shared between runs.
+
+Usage:
+    python benchmarks/bench_import_memory.py [--rows 10000 50000 100000]
+"""
+import argparse
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def write_workbook(path: str, count: int):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["小区名称*", "所属区*"])
+    for i in range(count):
+        ws.append([
+            f"小区{i}", "浦东新区", f"XX路{i}号", "2.5元/平/月", "地上50个",
+            2015, "地铁9号线, 商场", "明珠小学", "明珠中学", 8, "小区环境好"
+        ])
+    wb.save(path)
+
+
+def measure(count: int):
+    """Import a generated sheet of count rows and print throughput and peak RSS."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app import importer
+    from app.database import Base
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/sheet.xlsx"
+        write_workbook(path, count)
+
+        engine = create_engine(f"sqlite:///{tmp}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        importer.import_communities(db, importer.iter_sheet_rows(path))
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        db.close()
+        engine.dispose()
+
+    print(f"{count:>8} rows  {elapsed:7.2f}s  {count / elapsed:8.0f} rows/s  "
+          f"peak RSS {peak / 1024:7.1f} MB (+{(peak - baseline) / 1024:.1f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args.child)
+        return
+
+    for count in args.rows:
+        subprocess.run([sys.executable, __file__, "--child", str(count)], check=True)
+
+
+if __name__ == "__main__":
+    main()
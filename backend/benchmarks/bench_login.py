@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Measure login latency under a burst of concurrent logins.
+
+Fires --concurrency simultaneous POST /api/auth/login requests against the
+application in-process and reports p50/p99 latency, together with the
+latency of /health requests issued during the burst to show whether
+password hashing starves the rest of the server.
+
+Usage:
+    python benchmarks/bench_login.py [--concurrency 50] [--rounds 3] [--work-factor 12]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def timed_request(client, method: str, url: str, **kwargs) -> float:
+    start = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    response.raise_for_status()
+    return (time.perf_counter() - start) * 1000
+
+
+async def burst(client, concurrency: int) -> tuple:
+    credentials = {"username": "admin", "password": "benchmark-password"}
+    logins = [
+        asyncio.create_task(timed_request(client, "POST", "/api/auth/login", json=credentials))
+        for _ in range(concurrency)
+    ]
+
+    probes = []
+    while not all(task.done() for task in logins):
+        probes.append(await timed_request(client, "GET", "/health"))
+        await asyncio.sleep(0.01)
+
+    return await asyncio.gather(*logins), probes
+
+
+async def run(args):
+    import httpx
+
+    from app.database import init_db
+    from app.main import app
+
+    init_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        response = await client.post(
+            "/api/auth/init", json={"username": "admin", "password": "benchmark-password"}
+        )
+        response.raise_for_status()
+
+        logins, probes = [], []
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            round_logins, round_probes = await burst(client, args.concurrency)
+            logins.extend(round_logins)
+            probes.extend(round_probes)
+        elapsed = time.perf_counter() - start
+
+    print(f"{len(logins)} logins in {elapsed:.2f}s ({len(logins) / elapsed:.1f}/s), "
+          f"{args.concurrency} concurrent, work factor {args.work_factor}")
+    print(f"login   p50 {percentile(logins, 0.5):8.1f} ms   p99 {percentile(logins, 0.99):8.1f} ms")
+    if probes:
+        print(f"health  p50 {percentile(probes, 0.5):8.1f} ms   p99 {percentile(probes, 0.99):8.1f} ms   "
+              f"max {max(probes):8.1f} ms ({len(probes)} probes)")
+    else:
+        print("health  no probes completed during the burst")
+    print(f"login mean {statistics.mean(logins):.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--work-factor", type=int, default=12)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Settings are read at import time, so configure before importing the app
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        os.environ["BCRYPT_ROUNDS"] = str(args.work_factor)
+        os.chdir(tmp)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Compare offset and cursor pagination cost at increasing page depths.
+
+Usage:
+    python benchmarks/bench_pagination.py [--rows 200000] [--limit 50]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, importer, models, pagination
+from app.database import make_engine
+from app.migrations import run_migrations
+
+REPEAT = 20
+
+
+def seed(db, count: int):
+    db.add(models.Community(name="基准小区", district="浦东新区"))
+    db.commit()
+    rows = (
+        ("基准小区", "1", "1", str(i), 60 + i % 90, "2室1厅",
+         None, None, None, 300 + (i * 7919) % 700, 5000, None, None, None)
+        for i in range(count)
+    )
+    importer.import_properties(db, enumerate(rows, start=2))
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{tmp}/bench.db")
+        run_migrations(engine)
+        db = sessionmaker(bind=engine)()
+        seed(db, args.rows)
+
+        print(f"{'page':>6}  {'offset ms':>10}  {'cursor ms':>10}")
+        for page in (1, 10, 100, 1000, args.rows // args.limit - 1):
+            skip = (page - 1) * args.limit
+            # Cursor of the previous page, as a client would hold it
+            cursor = None
+            if skip:
+                previous = crud.get_properties(db, sort="price", skip=skip - 1, limit=1)
+                cursor = pagination.encode_cursor("price", "asc", previous[0].price, previous[0].id)
+
+            offset_ms = timed(lambda: crud.get_properties(db, sort="price", skip=skip, limit=args.limit))
+            cursor_ms = timed(lambda: crud.get_properties(db, sort="price", cursor=cursor, limit=args.limit))
+            db.expunge_all()
+            print(f"{page:>6}  {offset_ms:>10.2f}  {cursor_ms:>10.2f}")
+
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
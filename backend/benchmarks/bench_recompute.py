@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Time the bulk recompute of derived property metrics and check it against crud's formulas.
+
+Seeds properties with SQL, corrupts a share of their rent_ratio and
+price_per_sqm, then times a dry run and the recompute. Exits non-zero if
+anything is still off afterwards, a sample is not exactly what
+crud.calculate_rent_ratio / crud.calculate_price_per_sqm compute, or
+district_stats no longer matches the tables.
+
+Usage:
+    python benchmarks/bench_recompute.py [--rows 1000000]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, derived, stats_store
+from app.database import make_engine
+from app.migrations import run_migrations
+
+COMMUNITIES = 1000
+
+SAMPLE = 2000
+
+SEED_PROPERTIES = """
+WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :rows)
+INSERT INTO properties (community_id, price, rent, area, created_at, updated_at)
+SELECT 1 + i % :communities,
+       CASE WHEN i % 97 = 0 THEN NULL ELSE 150 + abs(random()) % 1850 END,
+       CASE WHEN i % 4 = 0 THEN NULL ELSE 2000 + abs(random()) % 18000 END,
+       CASE WHEN i % 89 = 0 THEN 0 ELSE 30 + (abs(random()) % 1700) / 10.0 END,
+       datetime('now', '-1 day'), datetime('now', '-1 day')
+FROM n
+"""
+
+# Historical damage: an older rent formula, missing and stale values
+CORRUPT = [
+    "UPDATE properties SET rent_ratio = rent * 12 / (price * 10000) WHERE id % 10 = 0",
+    "UPDATE properties SET price_per_sqm = NULL WHERE id % 7 = 0",
+    "UPDATE properties SET price_per_sqm = 1 WHERE id % 97 = 0",
+]
+
+
+def seed(db, rows: int):
+    db.execute(text(
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :communities) "
+        "INSERT INTO communities (name, district) SELECT '小区' || i, '区' || (i % 16) FROM n"
+    ), {"communities": COMMUNITIES})
+    db.execute(text(SEED_PROPERTIES), {"rows": rows, "communities": COMMUNITIES})
+    # Correct values to start from, through the same path as a recompute
+    derived.recompute(db)
+    for statement in CORRUPT:
+        db.execute(text(statement))
+    db.commit()
+
+
+def sample_mismatches(db) -> int:
+    """Sampled properties whose stored values differ from crud's Python formulas."""
+    mismatches = 0
+    rows = db.execute(text(
+        "SELECT id, price, rent, area, rent_ratio, price_per_sqm FROM properties ORDER BY random() LIMIT :n"
+    ), {"n": SAMPLE})
+    for row in rows:
+        for stored, expected in ((row.rent_ratio, crud.calculate_rent_ratio(row.price, row.rent)),
+                                 (row.price_per_sqm, crud.calculate_price_per_sqm(row.price, row.area))):
+            # Exact: SQLite and Python share the double arithmetic
+            if stored != expected:
+                print(f"property {row.id}: stored {stored!r}, crud computes {expected!r}")
+                mismatches += 1
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{tmp}/bench.db")
+        run_migrations(engine)
+        db = sessionmaker(bind=engine)()
+        start = time.perf_counter()
+        seed(db, args.rows)
+        print(f"seeded {args.rows} properties in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        result = derived.recompute(db, dry_run=True)
+        print(f"dry run      {time.perf_counter() - start:>7.2f}s  "
+              f"{result['mismatched']} off {result['mismatched_by_field']}")
+
+        start = time.perf_counter()
+        result = derived.recompute(db)
+        print(f"recompute    {time.perf_counter() - start:>7.2f}s  {result['updated']} updated")
+
+        remaining = derived.count_changes(db)["mismatched"]
+        mismatches = sample_mismatches(db)
+        drift = stats_store.check(db)
+        print(f"after: {remaining} still off, {mismatches} of {SAMPLE} sampled differ from crud, "
+              f"{len(drift)} district_stats mismatch(es)")
+
+        db.close()
+        engine.dispose()
+
+    if remaining or mismatches or drift:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Compare FTS5 search with a LIKE '%...%' scan over property notes and community text.
+
+Usage:
+    python benchmarks/bench_search.py [--rows 100000]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app import importer, search
+from app.database import make_engine
+from app.migrations import run_migrations
+
+REPEAT = 20
+
+WORDS = ["南北通透", "满五唯一", "近地铁", "采光好", "精装修", "学区房", "业主急售", "高楼层",
+         "小区安静", "带车位", "朝南", "次新房", "看房方便", "税费低", "临近公园"]
+SCHOOLS = ["实验小学", "第一中学", "外国语学校", "师范附小", "模范中学"]
+QUERIES = ["业主急售", "外国语学校", "12号线", "近地铁 采光好"]
+
+
+def seed(db, count: int):
+    rng = random.Random(1)
+    communities = count // 20
+    rows = (
+        (f"小区{i}", "浦东新区", f"某某路{i}号", None, None, 2000 + i % 20, f"{i % 18 + 1}号线",
+         f"{i % 97}{rng.choice(SCHOOLS)}", f"{i % 89}{rng.choice(SCHOOLS)}", None, None, None, None)
+        for i in range(communities)
+    )
+    importer.import_communities(db, enumerate(rows, start=2))
+    rows = (
+        (f"小区{i % communities}", "1", "1", str(i), 90, "2室1厅", None, None, None, 500, 5000, None,
+         None, "，".join(rng.sample(WORDS, 4)))
+        for i in range(count)
+    )
+    importer.import_properties(db, enumerate(rows, start=2))
+
+
+def like_scan(db, q: str):
+    """The same hits and total the endpoint returns, found with LIKE."""
+    conditions, params = [], {}
+    for i, term in enumerate(q.split()):
+        params[f"t{i}"] = f"%{term}%"
+        conditions.append(
+            f"(c.name LIKE :t{i} OR c.address LIKE :t{i} OR c.metro LIKE :t{i} "
+            f"OR c.primary_school LIKE :t{i} OR c.middle_school LIKE :t{i})"
+        )
+    community_where = " AND ".join(conditions)
+    property_where = " AND ".join(f"p.notes LIKE :t{i}" for i in range(len(params)))
+    total = db.execute(text(f"SELECT COUNT(*) FROM communities c WHERE {community_where}"), params).scalar()
+    total += db.execute(text(f"SELECT COUNT(*) FROM properties p WHERE {property_where}"), params).scalar()
+    communities = db.execute(text(f"SELECT c.id FROM communities c WHERE {community_where} LIMIT 20"), params).all()
+    properties = db.execute(text(f"SELECT p.id FROM properties p WHERE {property_where} LIMIT 20"), params).all()
+    return communities + properties, total
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{tmp}/bench.db")
+        run_migrations(engine)
+        db = sessionmaker(bind=engine)()
+        start = time.perf_counter()
+        seed(db, args.rows)
+        print(f"seeded {args.rows} properties in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'query':<16} {'hits':>7}  {'fts ms':>8}  {'like ms':>8}")
+        for q in QUERIES:
+            _, total = search.search(db, q)
+            fts_ms = timed(lambda: search.search(db, q))
+            like_ms = timed(lambda: like_scan(db, q))
+            print(f"{q:<16} {total:>7}  {fts_ms:>8.2f}  {like_ms:>8.2f}")
+
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark read throughput while a bulk import is writing.
+
+Runs the same workload against a default SQLite connection (rollback
+journal) and against the configured performance profile (WAL and pragmas
+from Settings).
+
+Usage:
+    python benchmarks/bench_sqlite_concurrency.py [--rows 50000] [--readers 4]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, importer, models
+from app.database import Base, make_engine
+
+SEED_PROPERTIES = 20000
+
+
+def seed(Session):
+    db = Session()
+    db.add(models.Community(name="基准小区", district="浦东新区"))
+    db.commit()
+    importer.import_properties(db, enumerate(property_rows(SEED_PROPERTIES), start=2))
+    db.close()
+
+
+def property_rows(count: int):
+    for i in range(count):
+        yield ("基准小区", "1", "1", str(i), 60 + i % 90, "2室1厅",
+               None, None, None, 300 + i % 700, 5000, None, None, None)
+
+
+def reader(Session, stop: threading.Event, stats: dict, lock: threading.Lock):
+    db = Session()
+    queries = failures = 0
+    while not stop.is_set():
+        try:
+            crud.get_properties(db, min_price=random.randint(300, 900), limit=50)
+            queries += 1
+        except OperationalError:
+            failures += 1
+        db.rollback()
+    db.close()
+    with lock:
+        stats["queries"] += queries
+        stats["failures"] += failures
+
+
+def run(label: str, rows: int, readers: int, pragmas):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{tmp}/bench.db", pragmas=pragmas)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+        seed(Session)
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {"queries": 0, "failures": 0}
+        threads = [
+            threading.Thread(target=reader, args=(Session, stop, stats, lock))
+            for _ in range(readers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        writer_db = Session()
+        start = time.perf_counter()
+        importer.import_properties(writer_db, enumerate(property_rows(rows), start=2))
+        elapsed = time.perf_counter() - start
+        writer_db.close()
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    print(f"{label:<10} import {rows / elapsed:8.0f} rows/s  "
+          f"reads {stats['queries'] / elapsed:8.0f} q/s  failed reads {stats['failures']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+
+    run("default", args.rows, args.readers, pragmas={})
+    run("profile", args.rows, args.readers, pragmas=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Fail if an import that fails after inserting rows leaves any of them behind.
+
+Imports communities and properties in several small batches, including a
+row the database rejects (replayed row by row in savepoints), and makes
+the step after the inserts raise. After the rollback no row may remain:
+the batches' savepoints must sit inside the import's single transaction
+rather than each committing on its own. A successful import with a
+rejected row must still commit the other rows.
+
+Usage:
+    python benchmarks/check_import_atomicity.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from app import importer, models, stats_store
+from app.database import make_engine
+from app.migrations import run_migrations
+
+BATCH_SIZE = 2
+
+
+def community_rows(prefix: str, count: int):
+    return enumerate(((f"{prefix}{i}", "浦东新区", None, None, None, None, "1号线") for i in range(count)), start=2)
+
+
+def property_rows(count: int):
+    rows = [("小区0", "1", "1", str(i), 90, "2室1厅", None, None, None, 500, 5000, None, None, None)
+            for i in range(count)]
+    # Passes validation but violates NOT NULL, so its batch is replayed row by row
+    rows[1] = rows[1][:4] + (None,) + rows[1][5:]
+    return enumerate(rows, start=2)
+
+
+def count(db, model) -> int:
+    return db.execute(select(func.count()).select_from(model)).scalar()
+
+
+def failed_import(db, label: str, target: str, run) -> int:
+    """Run an import whose step after the inserts raises; 1 if rows survive the rollback."""
+    before = count(db, models.Community), count(db, models.Property)
+    with mock.patch.object(stats_store, target, side_effect=RuntimeError("boom")):
+        try:
+            run()
+        except RuntimeError:
+            db.rollback()
+        else:
+            print(f"FAIL {label}: the import did not raise")
+            return 1
+    after = count(db, models.Community), count(db, models.Property)
+    ok = after == before
+    print(f"{'ok  ' if ok else 'FAIL'} {label}: communities/properties {before} before, {after} after rollback")
+    return not ok
+
+
+def main():
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp, mock.patch.object(importer, "BATCH_SIZE", BATCH_SIZE):
+        engine = make_engine(f"sqlite:///{tmp}/atomicity.db")
+        run_migrations(engine)
+        db = sessionmaker(bind=engine)()
+
+        failures += failed_import(
+            db, "failed community import", "communities_imported",
+            lambda: importer.import_communities(db, community_rows("失败小区", 5))
+        )
+
+        result = importer.import_communities(db, community_rows("小区", 1))
+        ok = len(result["details"]) == 1 and count(db, models.Community) == 1
+        print(f"{'ok  ' if ok else 'FAIL'} community import committed: {count(db, models.Community)} row(s)")
+        failures += not ok
+
+        failures += failed_import(
+            db, "failed property import", "properties_imported",
+            lambda: importer.import_properties(db, property_rows(5))
+        )
+
+        result = importer.import_properties(db, property_rows(5))
+        ok = len(result["details"]) == 4 and len(result["errors"]) == 1 and count(db, models.Property) == 4
+        print(f"{'ok  ' if ok else 'FAIL'} property import with a rejected row: "
+              f"{count(db, models.Property)} row(s), {len(result['errors'])} error(s)")
+        failures += not ok
+
+        db.close()
+        engine.dispose()
+
+    if failures:
+        print(f"{failures} check(s) failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Fail if media responses stop honouring range or conditional requests.
+
+Serves a file through app.media_response.MediaResponse and checks status,
+Content-Range and body for plain, ranged, suffix, unsatisfiable and
+conditional requests, and that content-addressed names are cached as
+immutable.
+
+Usage:
+    python benchmarks/check_media_serving.py
+"""
+import asyncio
+import hashlib
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.media_response import IMMUTABLE_CACHE_CONTROL, MediaResponse
+
+
+def request(path: Path, headers: dict, method: str = "GET"):
+    """Run one request through MediaResponse; return (status, headers, body)."""
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    }
+    asyncio.run(MediaResponse(path)(scope, None, send))
+    start = messages[0]
+    response_headers = {name.decode(): value.decode() for name, value in start["headers"]}
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], response_headers, body
+
+
+def main():
+    data = bytes(range(256)) * 4096
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / f"{hashlib.sha256(data).hexdigest()}.mp4"
+        path.write_bytes(data)
+
+        _, headers, _ = request(path, {})
+        etag = headers["etag"]
+        # (name, request headers, method, status, body, Content-Range)
+        checks = [
+            ("full file", {}, "GET", 200, data, None),
+            ("byte range", {"Range": "bytes=100-199"}, "GET", 206, data[100:200], f"bytes 100-199/{len(data)}"),
+            ("open range", {"Range": f"bytes={len(data) - 5}-"}, "GET", 206, data[-5:],
+             f"bytes {len(data) - 5}-{len(data) - 1}/{len(data)}"),
+            ("suffix range", {"Range": "bytes=-10"}, "GET", 206, data[-10:],
+             f"bytes {len(data) - 10}-{len(data) - 1}/{len(data)}"),
+            ("past the end", {"Range": f"bytes={len(data)}-"}, "GET", 416, b"", f"bytes */{len(data)}"),
+            ("etag matches", {"If-None-Match": etag}, "GET", 304, b"", None),
+            ("not modified", {"If-Modified-Since": headers["last-modified"]}, "GET", 304, b"", None),
+            ("stale if-range", {"Range": "bytes=0-9", "If-Range": '"other"'}, "GET", 200, data, None),
+            ("head", {}, "HEAD", 200, b"", None),
+        ]
+        failures = 0
+        for name, request_headers, method, status, body, content_range in checks:
+            got_status, got_headers, got_body = request(path, request_headers, method)
+            ok = (
+                got_status == status
+                and got_body == body
+                and got_headers.get("content-range") == content_range
+            )
+            failures += not ok
+            print(f"{'ok' if ok else 'FAIL':<5} {name:<16} {got_status} {got_headers.get('content-range', '')}")
+
+        immutable = headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        failures += not immutable
+        print(f"{'ok' if immutable else 'FAIL':<5} {'immutable':<16} {headers['cache-control']}")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Fail if serialising property listings or authenticating issues more queries than expected.
+
+Lists properties spread over many communities, serialises them through
+schemas.PropertyResponse as the API does, and counts the SQL statements.
+Communities must be loaded in one batched query, not one per property, and
+not at all when the nested community is not requested. Authenticating a
+token with signed role claims must need no query, and a repeated token at
+most one.
+
+Usage:
+    python benchmarks/check_query_counts.py
+"""
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app import auth, crud, importer, schemas
+from app.database import make_engine
+from app.migrations import run_migrations
+
+
+@contextmanager
+def count_queries(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # The BEGIN the engine emits opens a transaction, it is not a query
+        if not statement.startswith("BEGIN"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def seed(db):
+    importer.import_communities(db, enumerate(((f"小区{i}", "浦东新区") for i in range(50)), start=2))
+    rows = (
+        (f"小区{i % 50}", "1", "1", str(i), 90, "2室1厅", None, None, None, 500, 5000, None, None, None)
+        for i in range(500)
+    )
+    importer.import_properties(db, enumerate(rows, start=2))
+
+
+def seed_user(db) -> tuple:
+    """A token with role claims and a claim-less one, as issued before they existed."""
+    user = crud.create_user(db, schemas.UserCreate(username="viewer", password="x", role="viewer"), "unused")
+    return auth.create_user_token(user), auth.create_access_token(data={"sub": user.username})
+
+
+def authenticate_twice(db, token: str, dependency):
+    for _ in range(2):
+        dependency(token=token, db=db)
+
+
+def serialise(items):
+    return [schemas.PropertyResponse.model_validate(item).model_dump() for item in items]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{tmp}/counts.db")
+        run_migrations(engine)
+        Session = sessionmaker(bind=engine)
+        seed_db = Session()
+        seed(seed_db)
+        token, legacy_token = seed_user(seed_db)
+        seed_db.close()
+
+        failures = run_checks(engine, Session, token, legacy_token)
+        engine.dispose()
+
+    if failures:
+        sys.exit(1)
+
+
+def run_checks(engine, Session, token: str, legacy_token: str) -> int:
+    # (name, callable, maximum statements)
+    checks = [
+        ("list 500 with community", lambda db: serialise(crud.get_properties(db, limit=500)), 2),
+        ("list 500 without community",
+         lambda db: serialise(crud.get_properties(db, limit=500, include_community=False)), 1),
+        ("detail with community",
+         lambda db: serialise([crud.get_property(db, 1, include_community=True)]), 1),
+        ("detail without community",
+         lambda db: serialise([crud.get_property(db, 1, include_community=False)]), 1),
+        ("auth with role claims", lambda db: authenticate_twice(db, token, auth.get_current_user), 0),
+        ("auth without claims", lambda db: authenticate_twice(db, legacy_token, auth.get_current_user), 1),
+        ("auth verified", lambda db: authenticate_twice(db, token, auth.get_verified_user), 1),
+    ]
+    failures = 0
+
+    for name, run, maximum in checks:
+        db = Session()
+        with count_queries(engine) as statements:
+            run(db)
+        db.close()
+
+        status = "FAIL" if len(statements) > maximum else "ok"
+        failures += len(statements) > maximum
+        print(f"{status:<5} {name:<30} {len(statements)} queries (max {maximum})")
+
+    return failures
+
+
+if __name__ == "__main__":
+    main()
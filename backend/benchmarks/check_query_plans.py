@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Fail if any list filter or cursor page is planned as a full table scan.
+
+Builds a migrated SQLite database with sample data, runs EXPLAIN QUERY PLAN
+for every filter of crud.get_properties and crud.get_communities and for
+cursor pages of every sort key, and exits non-zero if a plan contains a
+SCAN of a table instead of an index SEARCH (or a constrained R-tree lookup).
+
+Usage:
+    python benchmarks/check_query_plans.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, importer, models, pagination
+from app.database import make_engine
+from app.migrations import run_migrations
+
+DISTRICTS = ["浦东新区", "静安区", "徐汇区", "黄浦区", "长宁区", "普陀区", "虹口区", "杨浦区"]
+
+PROPERTY_FILTERS = {
+    "community_id": {"community_id": 7},
+    "district": {"district": "静安区"},
+    "min_price": {"min_price": 950},
+    "max_price": {"max_price": 320},
+    "price_range": {"min_price": 500, "max_price": 520},
+    "min_area": {"min_area": 140},
+    "max_area": {"max_area": 62},
+    "min_rent_ratio": {"min_rent_ratio": 2.5},
+    "max_rent_ratio": {"max_rent_ratio": 0.5},
+    "community_id_price": {"community_id": 7, "min_price": 600},
+    "school": {"school": "第3实验小学"},
+    "school_prefix": {"school": "第1"},
+    "metro_line": {"metro_line": "9"},
+    "near": {"near_lat": 31.2, "near_lon": 121.4, "within": 1000},
+}
+
+COMMUNITY_FILTERS = {
+    "district": {"district": "静安区"},
+    "metro_line": {"metro_line": "9号线"},
+    "near": {"near_lat": 31.2, "near_lon": 121.4, "within": 1000},
+}
+
+
+def seed(db):
+    community_rows = [
+        (f"小区{i}", DISTRICTS[i % len(DISTRICTS)], None, None, None, None, f"{i % 18 + 1}号线", f"第{i % 20}实验小学")
+        for i in range(200)
+    ]
+    importer.import_communities(db, enumerate(community_rows, start=2))
+    # A 20 x 10 grid, about 1km apart
+    db.execute(text("UPDATE communities SET latitude = 31.1 + (id % 20) * 0.01, longitude = 121.3 + (id / 20) * 0.01"))
+
+    property_rows = (
+        (f"小区{i % 200}", "1", "1", str(i), 60 + i % 90, "2室1厅",
+         None, None, None, 300 + i % 700, 3000 + i % 9000, None,
+         f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}" if i % 5 else None, None)
+        for i in range(20000)
+    )
+    importer.import_properties(db, enumerate(property_rows, start=2))
+    db.execute(text("ANALYZE"))
+    db.commit()
+
+
+def is_table_scan(step: str) -> bool:
+    """A SCAN step, other than a virtual table (R-tree) lookup with constraints like 2:B0D1."""
+    if not step.startswith("SCAN "):
+        return False
+    constraints = step.partition(" VIRTUAL TABLE INDEX ")[2].partition(":")[2]
+    return not constraints
+
+
+def query_plan(db, query) -> list:
+    sql = str(query.statement.compile(db.bind, compile_kwargs={"literal_binds": True}))
+    return [row[3] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+
+def cursor_queries(db):
+    """Queries for the page after a cursor, for every sort key and order."""
+    for sort, column in crud.PROPERTY_SORT_COLUMNS.items():
+        for order in ("asc", "desc"):
+            for value in (500, None):
+                conditions = pagination.after_key(column, models.Property.id, order, value, 10000)
+                for index, condition in enumerate(conditions):
+                    query = pagination.order_by_key(
+                        db.query(models.Property).filter(condition), column, models.Property.id, order
+                    )
+                    yield f"cursor.{sort}.{order}.{value}.{index}", query
+
+
+def main():
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{tmp}/plans.db")
+        run_migrations(engine)
+        db = sessionmaker(bind=engine)()
+        seed(db)
+
+        checks = [
+            (f"properties.{name}", crud.filter_properties(db.query(models.Property), **filters))
+            for name, filters in PROPERTY_FILTERS.items()
+        ] + [
+            (f"communities.{name}", crud.filter_communities(db.query(models.Community), **filters))
+            for name, filters in COMMUNITY_FILTERS.items()
+        ] + list(cursor_queries(db))
+
+        for name, query in checks:
+            plan = query_plan(db, query.limit(100))
+            scans = [step for step in plan if is_table_scan(step)]
+            status = "FAIL" if scans else "ok"
+            failures += bool(scans)
+            print(f"{status:<5} {name:<36} {' | '.join(plan)}")
+
+        db.close()
+        engine.dispose()
+
+    if failures:
+        print(f"{failures} query plan(s) fall back to a full table scan")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
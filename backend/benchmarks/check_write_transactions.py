@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Fail if a write path breaks when another connection commits after it has read.
+
+Under WAL, a transaction that began with a read and then writes fails at
+once with "database is locked" if another connection committed in between;
+busy_timeout does not help. For each write path, session A reads (as the
+authentication dependency does), session B commits a write, and then A
+runs the path. Every path must take the write lock before its first read
+and succeed.
+
+Usage:
+    python benchmarks/check_write_transactions.py
+"""
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from app import auth, crud, derived, importer, jobs, media_store, models, schemas
+from app.database import make_engine
+from app.migrations import run_migrations
+from app.routers import auth as auth_router
+from app.routers import properties as properties_router
+
+ADMIN = auth.Principal(id=1, username="admin", role="admin")
+
+# Cheap hashes; the work factor does not matter here
+BCRYPT_ROUNDS = 4
+
+
+def interleaved(Session, label: str, write) -> int:
+    """Read in session A, commit in session B, then write in A; 1 if the write fails."""
+    a, b = Session(), Session()
+    try:
+        a.execute(select(func.count()).select_from(models.User)).scalar()
+        b.add(models.Community(name=f"并发小区{time.monotonic_ns()}"))
+        b.commit()
+        started = time.perf_counter()
+        try:
+            write(a)
+        except Exception as e:
+            a.rollback()
+            print(f"FAIL {label}: {type(e).__name__} after {time.perf_counter() - started:.2f}s: {e}")
+            return 1
+        print(f"ok   {label}")
+        return 0
+    finally:
+        a.close()
+        b.close()
+
+
+def wait_for_job(Session, job_id: str, timeout: float = 10):
+    """Raise unless the job reaches a final state within timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db = Session()
+        try:
+            # The row is written when the job finishes
+            job = db.get(models.ImportJob, job_id)
+        finally:
+            db.close()
+        if job is not None:
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"job {job_id} did not finish")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{tmp}/writes.db")
+        run_migrations(engine)
+        Session = sessionmaker(bind=engine)
+        jobs.SessionLocal = Session
+        jobs.JOB_DIR = Path(tmp) / "import_jobs"
+        auth.settings.BCRYPT_ROUNDS = BCRYPT_ROUNDS
+
+        seed = Session()
+        admin = crud.create_user(seed, schemas.UserCreate(username="admin", password="old", role="admin"),
+                                 auth.get_password_hash("old"))
+        assert admin.id == ADMIN.id
+        importer.import_communities(seed, enumerate(((f"小区{i}", "浦东新区") for i in range(3)), start=2))
+        community_id = seed.execute(select(models.Community.id)).scalars().first()
+        property_id = crud.create_property(seed, schemas.PropertyCreate(community_id=community_id, price=500)).id
+        seed.close()
+
+        upload_dir = Path(tmp) / "uploads"
+        upload_dir.mkdir()
+
+        stored = []
+
+        def store(db):
+            temp = upload_dir / ".upload-check"
+            temp.write_bytes(b"photo")
+            stored.append(media_store.store_file(db, temp, upload_dir, media_store.hash_file(temp), 5, "a.jpg")[0])
+
+        def delete(db):
+            media_store.delete_file(db, upload_dir / stored[0])
+
+        def submit(db):
+            # The workbook is not valid, so the job runs and records its failure
+            spool = Path(tmp) / "spool.xlsx"
+            spool.write_bytes(b"")
+            job = jobs.submit_import("community", str(spool), "spool.xlsx", ADMIN.id)
+            wait_for_job(Session, job.id)
+
+        checks = [
+            ("crud.create_user", lambda db: crud.create_user(
+                db, schemas.UserCreate(username="viewer", password="x"), "unused")),
+            ("crud.create_community", lambda db: crud.create_community(db, schemas.CommunityCreate(name="新小区"))),
+            ("crud.update_community", lambda db: crud.update_community(
+                db, community_id, schemas.CommunityUpdate(name="小区0", district="徐汇区"))),
+            ("properties.create_property", lambda db: properties_router.create_property(
+                schemas.PropertyCreate(community_id=community_id, price=300), db=db, current_user=ADMIN)),
+            ("crud.update_property", lambda db: crud.update_property(
+                db, property_id, schemas.PropertyUpdate(community_id=community_id, price=600))),
+            ("crud.delete_property", lambda db: crud.delete_property(db, property_id)),
+            ("auth.change_password", lambda db: asyncio.run(auth_router.change_password(
+                schemas.ChangePasswordRequest(old_password="old", new_password="new"), current_user=ADMIN, db=db))),
+            ("auth.login rehash", lambda db: asyncio.run(auth_router.login(
+                schemas.LoginRequest(username="admin", password="new"), db=db))),
+            ("media_store.store_file", store),
+            ("media_store.delete_file", delete),
+            ("jobs.run_job", submit),
+            ("derived.recompute", lambda db: derived.recompute(db)),
+            ("crud.delete_community", lambda db: crud.delete_community(db, community_id)),
+        ]
+
+        failures = 0
+        for label, write in checks:
+            # Login rehashes passwords made with another work factor
+            auth.settings.BCRYPT_ROUNDS = BCRYPT_ROUNDS + (label == "auth.login rehash")
+            failures += interleaved(Session, label, write)
+
+        jobs.shutdown()
+        engine.dispose()
+
+    if failures:
+        print(f"{failures} check(s) failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
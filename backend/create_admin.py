@@ -4,13 +4,14 @@ import os
 sys.path.insert(0, '/var/www/housing-finder/backend')
 
 import bcrypt
-from app.database import SessionLocal, init_db
+from app.database import SessionLocal, begin_write, init_db
 from app.models import User
 
 def main():
     init_db()
     db = SessionLocal()
     try:
+        begin_write(db)
         user = db.query(User).first()
         if user:
             print(f'User exists: {user.username}')
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Remove uploaded files that no community or property refers to.
+
+Files named in no photos/videos column and older than the grace period are
+deleted together with their thumbnails, poster and metadata sidecar, or
+moved to uploads/.quarantine with --quarantine. Temp files left by
+interrupted uploads, and thumbnails or posters whose source is gone, are
+removed once older than the grace period. The API
+runs the same collection every MEDIA_GC_INTERVAL_HOURS.
+
+Usage:
+    python gc_media.py                    # collect ./uploads
+    python gc_media.py --dry-run          # only report what would go
+    python gc_media.py --grace-hours 1 --quarantine
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app import media_gc
+from app.config import settings
+from app.database import SessionLocal, init_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove uploaded files that nothing refers to.")
+    parser.add_argument("--upload-dir", default="uploads", help="directory holding the uploads")
+    parser.add_argument("--grace-hours", type=float, default=settings.MEDIA_GC_GRACE_HOURS,
+                        help="leave files younger than this alone")
+    parser.add_argument("--batch-size", type=int, default=settings.MEDIA_GC_BATCH_SIZE,
+                        help="files checked per transaction")
+    parser.add_argument("--quarantine", action="store_true", default=settings.MEDIA_GC_QUARANTINE,
+                        help="move files to uploads/.quarantine instead of deleting them")
+    parser.add_argument("--dry-run", action="store_true", help="report without changing anything")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    init_db()
+    db = SessionLocal()
+    try:
+        report = media_gc.collect(
+            db, Path(args.upload_dir), args.grace_hours, args.batch_size, args.quarantine, args.dry_run
+        )
+    finally:
+        db.close()
+
+    print(f'{report["scanned"]} file(s) scanned, {report["collected"]} collected '
+          f'({report["quarantined"]} quarantined), {report["temp_files"]} abandoned temp file(s), '
+          f'{report["derived_files"]} derived file(s) without a source, '
+          f'{report["reclaimed_bytes"]} bytes reclaimed'
+          f'{" (dry run)" if args.dry_run else ""}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Move existing uploads into content-addressed storage.
+
+Renames every file in uploads/ that is not yet named by its SHA-256 to
+<sha256>.<ext>, merging duplicates, records it in media_files, and rewrites
+the photos/videos URLs of communities and properties to the new names.
+Safe to run again; already migrated files are left alone.
+
+Usage:
+    python migrate_media.py               # migrate ./uploads
+    python migrate_media.py --dry-run     # only print the plan
+    python migrate_media.py --upload-dir /var/www/housing-finder/backend/uploads
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app import media_store
+from app.database import SessionLocal, begin_write, init_db
+
+
+def legacy_files(upload_dir: Path):
+    """Stored originals whose name is not their content hash."""
+    for path in sorted(upload_dir.iterdir()):
+        if (
+            path.is_file()
+            and not path.name.startswith(".")
+            and not media_store.is_derived_name(path.name)
+            and not media_store.is_content_addressed(path.name)
+        ):
+            yield path
+
+
+def link_into_place(source: Path, destination: Path):
+    """Give source its new name (and keep the old one until the database is updated)."""
+    if not destination.exists():
+        os.link(source, destination)
+    for old, new in zip(media_store.derived_paths(source), media_store.derived_paths(destination)):
+        if old.exists() and not new.exists():
+            os.link(old, new)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move existing uploads into content-addressed storage.")
+    parser.add_argument("--upload-dir", default="uploads", help="directory holding the uploads")
+    parser.add_argument("--dry-run", action="store_true", help="print the renames without changing anything")
+    args = parser.parse_args()
+
+    upload_dir = Path(args.upload_dir)
+    init_db()
+    db = SessionLocal()
+    try:
+        if not args.dry_run:
+            begin_write(db)
+        renames = {}
+        reclaimed = 0
+        for path in legacy_files(upload_dir):
+            sha256 = media_store.hash_file(path)
+            new_name = media_store.content_name(sha256, path.name)
+            duplicate = (upload_dir / new_name).exists() or new_name in renames.values()
+            if duplicate:
+                reclaimed += path.stat().st_size
+            print(f"{path.name} -> {new_name}{' (duplicate)' if duplicate else ''}")
+            renames[path.name] = new_name
+
+            if not args.dry_run:
+                link_into_place(path, upload_dir / new_name)
+                media_store.add_reference(db, new_name, sha256, path.stat().st_size)
+
+        rewritten = 0
+        for row, column, value in list(media_store.iter_media_columns(db)):
+            new_value = media_store.rewrite_media_urls(value, renames)
+            if new_value != value:
+                rewritten += 1
+                if not args.dry_run:
+                    setattr(row, column, new_value)
+
+        if args.dry_run:
+            db.rollback()
+        else:
+            db.commit()
+            # Only drop the old names once the database points at the new ones
+            for old_name in renames:
+                old = upload_dir / old_name
+                for derivative in media_store.derived_paths(old):
+                    derivative.unlink(missing_ok=True)
+                old.unlink()
+
+        print(f'{len(renames)} file(s) renamed, {rewritten} column value(s) rewritten, '
+              f'{reclaimed} bytes reclaimed from duplicates{" (dry run)" if args.dry_run else ""}')
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
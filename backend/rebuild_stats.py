@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Rebuild or check the district_stats summary table.
+
+Usage:
+    python rebuild_stats.py           # recompute from communities/properties
+    python rebuild_stats.py --check   # report drift, exit 1 if any
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app import response_cache, stats_store
+from app.database import SessionLocal, begin_write, init_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild or check the district_stats summary table.")
+    parser.add_argument("--check", action="store_true", help="compare with a full aggregation instead of rebuilding")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.check:
+            mismatches = stats_store.check(db)
+            for mismatch in mismatches:
+                print(mismatch)
+            print(f'{len(mismatches)} mismatch(es)')
+            sys.exit(1 if mismatches else 0)
+
+        begin_write(db)
+        stats_store.rebuild(db)
+        response_cache.bump_data_version(db)
+        db.commit()
+        print('District stats rebuilt.')
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Recompute rent_ratio and price_per_sqm of every property from price, rent and area.
+
+Usage:
+    python recompute_derived.py --dry-run   # list the differences, change nothing
+    python recompute_derived.py             # rewrite the values that differ
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app import derived
+from app.database import SessionLocal, init_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute derived property metrics in one UPDATE.")
+    parser.add_argument("--dry-run", action="store_true", help="report the differences without writing")
+    parser.add_argument("--show", type=int, default=derived.DEFAULT_SHOW, help="differences to list")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        result = derived.recompute(db, dry_run=args.dry_run, show=args.show)
+    finally:
+        db.close()
+
+    for change in result["changes"]:
+        print(f'{change["id"]:>8}  {change["field"]:<14} {change["stored"]!r} -> {change["computed"]!r}')
+    by_field = ", ".join(f"{name}: {count}" for name, count in result["mismatched_by_field"].items())
+    print(f'{result["checked"]} properties checked, {result["mismatched"]} off ({by_field})')
+    if args.dry_run:
+        print('Dry run, nothing written.')
+    else:
+        print(f'{result["updated"]} properties updated.')
+
+
+if __name__ == '__main__':
+    main()